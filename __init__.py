@@ -1,5 +1,5 @@
 from flask import Flask
-from extensions import db, login_manager, migrate
+from extensions import db, login_manager, init_migrate
 import os
 
 def create_app():
@@ -18,9 +18,9 @@ def create_app():
     # Initialize extensions with app
     db.init_app(app)
     login_manager.init_app(app)
-    migrate.init_app(app, db)
+    init_migrate(app)
     
-    login_manager.login_view = 'login'
+    login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     
     with app.app_context():
@@ -34,6 +34,8 @@ def create_app():
         
         # Import and register routes
         import routes
+        for blueprint in routes.BLUEPRINTS:
+            app.register_blueprint(blueprint)
         
         # Create all database tables
         db.create_all()
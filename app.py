@@ -1,42 +1,193 @@
 from flask import Flask
-from extensions import db, login_manager, migrate
+from werkzeug.routing import Map
+from extensions import db, login_manager, init_migrate
+from uploads import UploadRequest
+import database
 import os
+import threading
 
-def create_app():
+
+class LazyRouteMap(Map):
+    """URL map that registers the blueprints the first time it matches or builds a URL
+
+    Importing the views and everything they use is a good part of the start-up
+    time, and a CLI command that never routes a request should not pay for it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_first_use = None
+        self._registering = False
+        self._lock = threading.RLock()
+
+    def _register(self):
+        if self.on_first_use is None:
+            return
+        with self._lock:
+            # The flag stops the recursion when registering itself needs the map
+            if self.on_first_use is None or self._registering:
+                return
+            self._registering = True
+            try:
+                self.on_first_use()
+                self.on_first_use = None
+            finally:
+                self._registering = False
+
+    def bind(self, *args, **kwargs):
+        self._register()
+        return super().bind(*args, **kwargs)
+
+    def bind_to_environ(self, *args, **kwargs):
+        self._register()
+        return super().bind_to_environ(*args, **kwargs)
+
+    def iter_rules(self, *args, **kwargs):
+        self._register()
+        return super().iter_rules(*args, **kwargs)
+
+
+class RentalApp(Flask):
+    url_map_class = LazyRouteMap
+    request_class = UploadRequest
+
+
+def register_blueprints(app):
+    """Import the views and register their blueprints (done on the URL map's first use)"""
+    import routes
+    for blueprint in routes.BLUEPRINTS:
+        app.register_blueprint(blueprint)
+
+
+def create_app(config=None):
     """Application factory to create and configure the Flask app"""
-    app = Flask(__name__)
+    app = RentalApp(__name__)
     
     # Configuration
     app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///rental_management.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # SQLite connection PRAGMAs and pool (see database.py); None keeps SQLite's default
+    app.config['SQLITE_JOURNAL_MODE'] = 'wal'
+    app.config['SQLITE_BUSY_TIMEOUT'] = 5000       # ms a writer waits for the lock
+    app.config['SQLITE_SYNCHRONOUS'] = 'normal'
+    app.config['SQLITE_CACHE_SIZE'] = -65536       # negative: KiB, i.e. 64 MB per connection
+    app.config['SQLITE_MMAP_SIZE'] = 268435456     # 256 MB
+    app.config['SQLITE_TEMP_STORE'] = 'memory'
+    app.config['DATABASE_POOL_SIZE'] = 10
+    app.config['DATABASE_POOL_OVERFLOW'] = 10
+    app.config['DATABASE_POOL_TIMEOUT'] = 30      # seconds to wait for a pooled connection
+    app.config['DATABASE_POOL_RECYCLE'] = 3600    # seconds before a connection is reopened
+    # Read-only bind for reports and dashboards: None opens the SQLite file above
+    # with mode=ro, a URI points at a replica, False reads from the primary
+    app.config['DATABASE_READ_URI'] = None
+    app.config['DATABASE_READ_AFTER_WRITE'] = 10  # seconds a user reads from the primary after writing
     app.config['UPLOAD_FOLDER'] = 'static/uploads'
+    # Uploaded originals keep their metadata, so they live outside static/
+    app.config['IMAGE_ORIGINALS_FOLDER'] = os.path.join(app.instance_path, 'uploads')
+    app.config['IMAGE_WORKERS'] = 2           # threads rendering image variants; 0 renders inline
+    
+    # Upload limits (see uploads.py): whole request body, and each file in it
+    app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024
+    app.config['MAX_UPLOAD_FILE_SIZE'] = 16 * 1024 * 1024
+    app.config['UPLOAD_TEMP_FOLDER'] = os.path.join(app.instance_path, 'uploads', 'incoming')
+    
+    # Late fees on pending payments (see latefees.py): 'flat', 'percentage' or 'daily'
+    app.config['LATE_FEE_POLICY'] = 'flat'
+    app.config['LATE_FEE_AMOUNT'] = 50.0      # flat fee, or the per-day fee for 'daily'
+    app.config['LATE_FEE_PERCENT'] = 5.0      # of the rent due, for 'percentage'
+    app.config['LATE_FEE_CAP'] = None         # maximum fee under any policy
+    app.config['LATE_FEE_GRACE_DAYS'] = 5
     
-    # Ensure upload folder exists
+    # Password hashing (see passwords.py): Werkzeug method string, and the
+    # process pool that runs it off the request threads
+    app.config['PASSWORD_HASH_METHOD'] = 'scrypt:32768:8:1'
+    app.config['PASSWORD_HASH_WORKERS'] = 2   # processes; 0 hashes on the request thread
+    app.config['PASSWORD_HASH_QUEUE'] = 8     # jobs waiting for a worker before 503s
+    app.config['PASSWORD_HASH_TIMEOUT'] = 10  # seconds a request waits for its job
+    
+    # Identity cache for the logged-in user (see identity.py)
+    app.config['IDENTITY_CACHE_TTL'] = 300              # seconds a cached user is trusted
+    app.config['IDENTITY_CACHE_SIZE'] = 10000           # users kept per process
+    app.config['IDENTITY_GENERATION_INTERVAL'] = 1.0    # seconds between checks for other workers' changes
+    
+    # Live notifications (see events.py)
+    app.config['SSE_POLL_INTERVAL'] = 1.0   # seconds between checks for other workers' notifications
+    app.config['SSE_HEARTBEAT'] = 15        # seconds between keep-alive comments
+    app.config['SSE_MAX_AGE'] = 300         # seconds before a stream ends and the browser reconnects
+    app.config['SSE_RETRY'] = 5             # seconds the browser waits before reconnecting
+    app.config['SSE_QUEUE_SIZE'] = 32       # undelivered events kept per stream
+    
+    # Read notifications older than this are archived (flask archive-notifications)
+    app.config['NOTIFICATION_RETENTION_DAYS'] = 90
+    
+    # Per-request SQL/template timings, slow-query log and N+1 detection (see instrumentation.py)
+    app.config['SQL_INSTRUMENTATION'] = False
+    app.config['SQL_SLOW_QUERY_MS'] = 100       # log statements slower than this; None logs none
+    app.config['SQL_SLOW_QUERY_LOG'] = None     # file for the slow-query log, besides the logger
+    app.config['SQL_NPLUSONE_THRESHOLD'] = 5    # lazy loads of one relationship per request
+    app.config['SQL_NPLUSONE_RAISE'] = False    # raise NPlusOneError instead of logging a warning
+    
+    # Prometheus metrics at /metrics (see metrics.py)
+    app.config['METRICS_ENABLED'] = True
+    app.config['METRICS_TOKEN'] = None          # bearer token for remote scrapers; None: local only
+    app.config['METRICS_DIR'] = None            # shared folder to add up several worker processes
+    app.config['METRICS_FLUSH_INTERVAL'] = 5.0  # seconds between a worker's snapshots in METRICS_DIR
+    
+    # Rendered {% cache %} blocks (see fragments.py); a size of 0 turns the cache off
+    app.config['FRAGMENT_CACHE_SIZE'] = 5000    # fragments kept per process
+    app.config['FRAGMENT_CACHE_TTL'] = 3600     # seconds, for blocks that give none
+    app.config['FRAGMENT_CACHE_DIR'] = None     # folder for a disk tier shared by the workers
+    
+    # RMS_* environment variables (values parsed as JSON where possible), then
+    # overrides from tests and scripts, win over the defaults above
+    app.config.from_prefixed_env('RMS')
+    if config:
+        app.config.update(config)
+    
+    # Ensure upload folders exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['IMAGE_ORIGINALS_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['UPLOAD_TEMP_FOLDER'], exist_ok=True)
     
     # Initialize extensions with app
+    database.init_app(app)
     db.init_app(app)
+    database.install(app)
+    import instrumentation
+    instrumentation.init_app(app)
+    import metrics
+    metrics.init_app(app)
     login_manager.init_app(app)
-    migrate.init_app(app, db)
+    init_migrate(app)
     
-    login_manager.login_view = 'login'
+    from images import image_variants
+    app.add_template_global(image_variants)
+    
+    import fragments
+    fragments.init_app(app)
+    
+    import identity
+    identity.init_app(app)
+    
+    import events
+    events.init_app(app)
+    
+    login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     
-    with app.app_context():
-        # Import models
-        from models import User
-        
-        # User loader for Flask-Login
-        @login_manager.user_loader
-        def load_user(user_id):
-            return User.query.get(int(user_id))
-        
-        # Import and register routes
-        import routes
-        
-        # Create all database tables
-        db.create_all()
+    # User loader for Flask-Login, served from the identity cache
+    login_manager.user_loader(identity.load_user)
+    
+    # The views are imported when the first request is routed (see LazyRouteMap)
+    app.url_map.on_first_use = lambda: register_blueprints(app)
+    
+    # Tables are created for a new database only; existing ones are migrated
+    database.ensure_schema(app)
+    
+    from commands import register_commands
+    register_commands(app)
     
     return app
 
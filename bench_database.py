@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+SQLite concurrency benchmark for the Rental Management System
+
+Starts separate writer and reader processes against one scratch database,
+as several server workers would. Writers record payments and update
+maintenance requests, the writes ``add_payment`` and
+``update_maintenance`` make. Readers run list and dashboard queries. The
+run is repeated with SQLite's defaults and with the tuned settings from
+database.py, and the script reports throughput and "database is locked"
+errors for each:
+
+    python bench_database.py --writers 4 --readers 4 --seconds 10
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+
+UNTUNED = {
+    'SQLITE_JOURNAL_MODE': None,
+    'SQLITE_BUSY_TIMEOUT': None,
+    'SQLITE_SYNCHRONOUS': None,
+    'SQLITE_CACHE_SIZE': None,
+    'SQLITE_MMAP_SIZE': None,
+    'SQLITE_TEMP_STORE': None,
+}
+
+
+def _app(uri, tuned):
+    from app import create_app
+    return create_app({'SQLALCHEMY_DATABASE_URI': uri, **({} if tuned else UNTUNED)})
+
+
+def seed(uri, leases, tuned):
+    from extensions import db
+    from models import User, Property, Lease, MaintenanceRequest
+
+    # WAL mode sticks to the file, so the untuned run must not create it tuned
+    app = _app(uri, tuned)
+    with app.app_context():
+        owner = User(username='owner', email='owner@example.com', full_name='Owner',
+                     role='owner', password_hash='x', is_active=True)
+        db.session.add(owner)
+        db.session.flush()
+        for n in range(leases):
+            tenant = User(username=f'tenant{n}', email=f'tenant{n}@example.com', full_name=f'Tenant {n}',
+                          role='tenant', password_hash='x', is_active=True)
+            prop = Property(owner_id=owner.id, property_type='Apartment', title=f'Unit {n}',
+                            address='1 Bench Street', city='Springfield', rent_amount=1000,
+                            availability_status='occupied')
+            db.session.add_all([tenant, prop])
+            db.session.flush()
+            db.session.add(Lease(property_id=prop.id, tenant_id=tenant.id, start_date=date(2024, 1, 1),
+                                 end_date=date(2030, 12, 31), monthly_rent=1000, status='active'))
+            db.session.add(MaintenanceRequest(property_id=prop.id, tenant_id=tenant.id,
+                                              title='Leaky tap', description='Drips', category='plumbing'))
+        db.session.commit()
+        db.engine.dispose()
+
+
+def _write(db, rng, sequence):
+    from models import Lease, Payment, MaintenanceRequest
+
+    if rng.random() < 0.5:
+        lease = db.session.get(Lease, rng.randint(1, _write.leases))
+        # (lease, month) is unique: give every payment a month of its own
+        month = f'{2100 + sequence // 12:04d}-{sequence % 12 + 1:02d}'
+        db.session.add(Payment(lease_id=lease.id, tenant_id=lease.tenant_id, amount=lease.monthly_rent,
+                               payment_date=date.today(), payment_month=month,
+                               payment_method='bank_transfer', status='completed'))
+    else:
+        request = db.session.get(MaintenanceRequest, rng.randint(1, _write.leases))
+        request.status = rng.choice(['pending', 'in_progress', 'completed'])
+        request.resolution_notes = f'update {rng.random():.6f}'
+    db.session.commit()
+
+
+def _read(db, rng, sequence):
+    from models import Payment, MaintenanceRequest
+
+    db.session.query(Payment.status, func.count(), func.sum(Payment.amount)).group_by(Payment.status).all()
+    db.session.query(MaintenanceRequest).filter_by(status='pending') \
+        .order_by(MaintenanceRequest.id.desc()).limit(25).all()
+    db.session.rollback()
+
+
+def worker(uri, tuned, role, index, seconds, leases, barrier, results):
+    from extensions import db
+
+    app = _app(uri, tuned)
+    rng = random.Random(os.getpid())
+    _write.leases = leases
+    operation = _write if role == 'writer' else _read
+    done = errors = 0
+    barrier.wait()  # start together once every process has imported the app
+    with app.app_context():
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            try:
+                # Workers count in disjoint ranges, so their payments never collide
+                operation(db, rng, index * 1000000 + done + errors)
+                done += 1
+            except OperationalError as exc:
+                db.session.rollback()
+                if 'locked' not in str(exc):
+                    raise
+                errors += 1
+        db.session.remove()
+        db.engine.dispose()
+    results.put((role, done, errors))
+
+
+def run(tuned, args):
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as folder:
+        uri = 'sqlite:///' + os.path.join(folder, 'bench.db')
+        seed(uri, args.leases, tuned)
+        results = context.Queue()
+        roles = ['writer'] * args.writers + ['reader'] * args.readers
+        barrier = context.Barrier(len(roles))
+        processes = [context.Process(target=worker,
+                                     args=(uri, tuned, role, index, args.seconds, args.leases, barrier, results))
+                     for index, role in enumerate(roles)]
+        for process in processes:
+            process.start()
+        totals = {'writer': [0, 0], 'reader': [0, 0]}
+        for _ in processes:
+            role, done, errors = results.get(timeout=args.seconds + 120)
+            totals[role][0] += done
+            totals[role][1] += errors
+        for process in processes:
+            process.join()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--leases', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'settings':<10} {'writes/s':>9} {'locked':>7} {'reads/s':>9} {'locked':>7}")
+    for label, tuned in (('defaults', False), ('tuned', True)):
+        totals = run(tuned, args)
+        (writes, write_errors), (reads, read_errors) = totals['writer'], totals['reader']
+        print(f'{label:<10} {writes / args.seconds:>9.1f} {write_errors:>7} '
+              f'{reads / args.seconds:>9.1f} {read_errors:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Login burst benchmark for the Rental Management System
+
+Runs a burst of logins and, at the same time, a steady stream of page
+loads by an already logged-in user, all on threads of one process as a
+threaded server would. Reports login throughput, how many logins were
+turned away with 503, and the page latency the burst causes, once with
+passwords hashed on the request threads and once on the hashing pool
+(see passwords.py).
+
+    python bench_login.py --logins 16 --pages 4 --seconds 10
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from extensions import db
+from models import User
+import passwords
+
+PASSWORD = 'correct horse battery staple'
+
+
+def seed(app, users):
+    with app.app_context():
+        db.create_all()
+        pwhash = generate_password_hash(PASSWORD, app.config['PASSWORD_HASH_METHOD'])
+        db.session.add_all(
+            User(username=f'user{n}', email=f'user{n}@example.com', full_name=f'User {n}',
+                 role='tenant', password_hash=pwhash, is_active=True)
+            for n in range(users))
+        db.session.commit()
+        return db.session.query(User.id).filter_by(username='user0').scalar()
+
+
+def run(app, page_user, logins, pages, seconds):
+    stop = threading.Event()
+    results = {'logins': 0, 'busy': 0, 'page_times': []}
+    lock = threading.Lock()
+
+    def login_loop(n):
+        client = app.test_client()
+        while not stop.is_set():
+            response = client.post('/login', data={'username': f'user{n}', 'password': PASSWORD})
+            with lock:
+                results['busy' if response.status_code == 503 else 'logins'] += 1
+            client.get('/logout')
+
+    def page_loop():
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(page_user)
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get('/profile')
+            with lock:
+                results['page_times'].append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=login_loop, args=(n + 1,)) for n in range(logins)]
+    threads += [threading.Thread(target=page_loop) for _ in range(pages)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def report(label, results, seconds):
+    times = sorted(results['page_times'])
+    p95 = times[int(len(times) * 0.95)] if times else 0
+    print(f"{label:<10} {results['logins'] / seconds:>9.1f} {results['busy']:>8} "
+          f"{len(times) / seconds:>9.1f} {statistics.median(times) * 1000 if times else 0:>9.1f} "
+          f"{p95 * 1000:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=16, help='concurrent login threads')
+    parser.add_argument('--pages', type=int, default=4, help='concurrent page-load threads')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=2, help='hashing processes for the pool run')
+    parser.add_argument('--queue', type=int, default=8, help='queued hashing jobs for the pool run')
+    parser.add_argument('--method', default=None, help='PASSWORD_HASH_METHOD (default: the app default)')
+    args = parser.parse_args()
+
+    print(f"{'hashing':<10} {'logins/s':>9} {'503s':>8} {'pages/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for label, workers in (('inline', 0), ('pool', args.workers)):
+        with tempfile.TemporaryDirectory() as folder:
+            config = {
+                'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(folder, 'bench.db'),
+                'PASSWORD_HASH_WORKERS': workers,
+                'PASSWORD_HASH_QUEUE': args.queue,
+            }
+            if args.method:
+                config['PASSWORD_HASH_METHOD'] = args.method
+            app = create_app(config)
+            page_user = seed(app, args.logins + 1)
+            results = run(app, page_user, args.logins, args.pages, args.seconds)
+            passwords.shutdown()
+            with app.app_context():
+                db.engine.dispose()
+        report(label, results, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
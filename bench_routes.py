@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Route benchmark for the Rental Management System
+
+Generates a synthetic portfolio (see synthetic.py) in a scratch database,
+then requests every GET route of the app as each role through the Flask
+test client, plus a few filtered and sorted variants. Pages a role is
+turned away from are left out. For every role and URL it records the p50/p95/p99 latency, the number of SQL statements and
+the peak Python memory of one request, and writes them as a JSON baseline:
+
+    python bench_routes.py run --size medium --repeat 30 --output baseline.json
+
+After a change, run again and compare against the baseline; the script
+lists the routes that got slower, run more queries or use more memory,
+and exits non-zero if there are any:
+
+    python bench_routes.py run --size medium --compare baseline.json
+    python bench_routes.py compare baseline.json current.json
+
+Latency is noisy: a route only counts as slower when its median grew by
+more than ``--tolerance`` and by more than ``--min-ms``; the tail
+percentiles are recorded to look at, not to gate on. Query counts are exact,
+so any increase counts.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict
+from datetime import date
+
+from sqlalchemy import event
+
+import synthetic
+from app import create_app
+from extensions import db
+from models import Lease, MaintenanceRequest, Property, User
+
+ROLES = ('admin', 'owner', 'tenant', 'staff')
+
+# Never benchmarked: the event stream stays open until the client leaves
+SKIP_ENDPOINTS = {'static', 'auth.logout', 'notifications.notification_stream'}
+
+# Filtered and sorted variants of list pages, on top of the plain routes
+VARIANTS = (
+    '/admin/users?role=tenant',
+    '/properties?status=available',
+    '/properties/search?q=Springfield',
+    '/payments?sort=payment_date',
+    '/maintenance?status=pending',
+    '/notifications?is_read=0',
+    '/reports/rent-collection/export?format=xlsx',
+)
+
+
+def _sample(model, *criteria):
+    return db.session.query(model.id).filter(*criteria).order_by(model.id).limit(1).scalar()
+
+
+def url_arguments(role, user_id):
+    """Values for the URL parameters of the routes, picked from what ``role`` can see"""
+    owned = Property.owner_id == user_id
+    if role == 'owner':
+        property_id = _sample(Property, owned)
+        lease_id = _sample(Lease, Lease.property.has(owned))
+        request_id = _sample(MaintenanceRequest, MaintenanceRequest.property.has(owned))
+    elif role == 'tenant':
+        lease_id = _sample(Lease, Lease.tenant_id == user_id)
+        property_id = db.session.get(Lease, lease_id).property_id
+        request_id = _sample(MaintenanceRequest, MaintenanceRequest.tenant_id == user_id)
+    elif role == 'staff':
+        request_id = _sample(MaintenanceRequest, MaintenanceRequest.staff_id == user_id)
+        property_id = db.session.get(MaintenanceRequest, request_id).property_id
+        lease_id = _sample(Lease, Lease.property_id == property_id)
+    else:
+        property_id, lease_id, request_id = _sample(Property), _sample(Lease), _sample(MaintenanceRequest)
+    return {
+        'property_id': property_id,
+        'lease_id': lease_id,
+        'request_id': request_id,
+        'user_id': _sample(User, User.role == 'tenant'),
+        'report': ['rent-collection', 'occupancy', 'maintenance'],
+    }
+
+
+def route_urls(app, arguments):
+    """Every GET URL of ``app``, with its parameters filled from ``arguments``"""
+    urls = []
+    adapter = app.url_map.bind('localhost')
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if rule.endpoint in SKIP_ENDPOINTS or 'GET' not in rule.methods:
+            continue
+        if any(arguments.get(name) is None for name in rule.arguments):
+            continue  # nothing of that kind for this role
+        values = [{}]
+        for name in rule.arguments:
+            choices = arguments[name] if isinstance(arguments[name], list) else [arguments[name]]
+            values = [{**partial, name: choice} for partial in values for choice in choices]
+        urls.extend(adapter.build(rule.endpoint, value) for value in values)
+    return urls + [url for url in VARIANTS if url not in urls]
+
+
+def _percentile(times, percent):
+    if len(times) == 1:
+        return times[0]
+    return statistics.quantiles(times, n=100, method='inclusive')[percent - 1]
+
+
+def measure(app, users, repeat, warmup):
+    """{'role GET url': {status, p50_ms, p95_ms, p99_ms, queries, peak_kib}}"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engines = list(db.engines.values())
+        urls = {role: route_urls(app, url_arguments(role, users[role])) for role in ROLES}
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+
+    results = {}
+    try:
+        # Requests must not run inside an outer app context: Flask would reuse
+        # it and Flask-Login would keep the first role's user cached on ``g``
+        for role in ROLES:
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['_user_id'] = str(users[role])
+                session['_fresh'] = True
+            for url in urls[role]:
+                response = client.get(url)
+                response.close()
+                if response.status_code != 200:
+                    # Not this role's page: it redirects with an "access denied" flash,
+                    # which would pile up in the session cookie of later requests
+                    with client.session_transaction() as session:
+                        session.pop('_flashes', None)
+                    continue
+                for _ in range(warmup):
+                    client.get(url).close()
+                gc.collect()
+                times, queries = [], []
+                for _ in range(repeat):
+                    del statements[:]
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    response.get_data()
+                    times.append((time.perf_counter() - started) * 1000)
+                    response.close()
+                    queries.append(len(statements))
+                # A separate request for memory: tracing slows every allocation
+                tracemalloc.start()
+                try:
+                    baseline = tracemalloc.get_traced_memory()[0]
+                    client.get(url).get_data()
+                    peak = tracemalloc.get_traced_memory()[1] - baseline
+                finally:
+                    tracemalloc.stop()
+                results[f'{role} GET {url}'] = {
+                    'status': response.status_code,
+                    'p50_ms': round(_percentile(times, 50), 3),
+                    'p95_ms': round(_percentile(times, 95), 3),
+                    'p99_ms': round(_percentile(times, 99), 3),
+                    # The fewest: some requests also refresh a cache on the way
+                    'queries': min(queries),
+                    'peak_kib': round(peak / 1024, 1),
+                }
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return results
+
+
+def run(args):
+    size = synthetic.scaled(synthetic.PRESETS[args.size], owners=args.owners, properties=args.properties,
+                            leases=args.leases, payments=args.payments, maintenance=args.maintenance,
+                            notifications=args.notifications)
+    today = date.fromisoformat(args.today)
+    with tempfile.TemporaryDirectory() as folder:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(folder, 'bench.db')})
+        with app.app_context():
+            started = time.perf_counter()
+            users = synthetic.generate(size, seed=args.seed, today=today)
+            print(f'Generated {size} in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+        results = measure(app, users, args.repeat, args.warmup)
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+    return {
+        'meta': {
+            'size': asdict(size),
+            'seed': args.seed,
+            'today': args.today,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'routes': results,
+    }
+
+
+def regressions(baseline, current, tolerance, min_ms, min_kib):
+    """[(route, message)] for every way ``current`` is worse than ``baseline``"""
+    found = []
+    for route, now in current['routes'].items():
+        before = baseline['routes'].get(route)
+        if before is None:
+            continue
+        if now['status'] != before['status']:
+            found.append((route, f"status {before['status']} -> {now['status']}"))
+        if now['queries'] > before['queries']:
+            found.append((route, f"queries {before['queries']} -> {now['queries']}"))
+        growth = now['p50_ms'] - before['p50_ms']
+        if growth > min_ms and growth > before['p50_ms'] * tolerance:
+            found.append((route, f"p50 {before['p50_ms']:.1f} -> {now['p50_ms']:.1f} ms"))
+        growth = now['peak_kib'] - before['peak_kib']
+        if growth > min_kib and growth > before['peak_kib'] * tolerance:
+            found.append((route, f"peak memory {before['peak_kib']:.0f} -> {now['peak_kib']:.0f} KiB"))
+    return found
+
+
+def print_results(results):
+    print(f"{'route':<60} {'status':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>7} {'peak KiB':>9}")
+    for route, row in results['routes'].items():
+        print(f"{route[:60]:<60} {row['status']:>6} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+              f"{row['p99_ms']:>8.2f} {row['queries']:>7} {row['peak_kib']:>9.1f}")
+
+
+def compare(baseline, current, args):
+    if baseline['meta']['size'] != current['meta']['size'] or baseline['meta']['seed'] != current['meta']['seed']:
+        print('! the runs used different data; latencies are not comparable')
+    for route in sorted(baseline['routes'].keys() - current['routes'].keys()):
+        print(f'- {route} (no longer benchmarked)')
+    for route in sorted(current['routes'].keys() - baseline['routes'].keys()):
+        print(f'+ {route} (new)')
+    found = regressions(baseline, current, args.tolerance, args.min_ms, args.min_kib)
+    for route, message in found:
+        print(f'✗ {route}: {message}')
+    if found:
+        print(f'❌ {len(found)} regressions')
+        return 1
+    print(f"✅ No regressions across {len(current['routes'])} routes")
+    return 0
+
+
+def _load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='benchmark the routes')
+    run_parser.add_argument('--size', choices=synthetic.PRESETS, default='medium', help='portfolio preset')
+    for name in ('owners', 'properties', 'leases', 'payments', 'maintenance', 'notifications'):
+        run_parser.add_argument(f'--{name}', type=int, help=f'override the number of {name} of the preset')
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--today', default='2024-06-01', help='date the portfolio is generated around')
+    run_parser.add_argument('--repeat', type=int, default=20, help='timed requests per route')
+    run_parser.add_argument('--warmup', type=int, default=2, help='untimed requests per route first')
+    run_parser.add_argument('--output', help='write the results as JSON to this file')
+    run_parser.add_argument('--compare', metavar='BASELINE', help='compare the results with a saved run')
+
+    compare_parser = commands.add_parser('compare', help='compare two saved runs')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument('--tolerance', type=float, default=0.5, help='relative growth allowed (0.5 = 50%%)')
+        sub.add_argument('--min-ms', type=float, default=5.0, help='median growth below this is noise')
+        sub.add_argument('--min-kib', type=float, default=64.0, help='peak memory growth below this is noise')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        return compare(_load(args.baseline), _load(args.current), args)
+
+    results = run(args)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        return compare(_load(args.compare), results, args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Start-up benchmark for the Rental Management System
+
+Starts fresh interpreters, as an autoscaled worker or a cron'd CLI command
+would, and times importing the app, ``create_app()`` against an existing
+database and the first request, which is when the views are imported (see
+``LazyRouteMap`` in app.py). Exits non-zero when the median import plus
+factory time is over the budget, or when the factory imported a module
+only the web pages or ``flask db`` use:
+
+    python bench_startup.py --repeat 10 --budget-ms 700
+
+The budget is wall time on the machine the script runs on; set it from a
+run on the deployment hardware. The import check does not depend on it.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Imported by the views or by ``flask db`` only; a CLI command that loads one pays for it
+WEB_ONLY_MODULES = ('routes', 'exports', 'flask_migrate', 'numpy')
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1]})
+created = time.perf_counter()
+loaded = [name for name in sys.argv[2:] if name in sys.modules]
+response = application.test_client().get('/login')
+finished = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'factory_ms': (created - imported) * 1000,
+    'first_request_ms': (finished - created) * 1000,
+    'status': response.status_code,
+    'loaded': loaded,
+}))
+'''
+
+
+def probe(uri):
+    """Timings of one fresh interpreter, and the web-only modules its factory imported"""
+    output = subprocess.run([sys.executable, '-c', PROBE, uri, *WEB_ONLY_MODULES], cwd=HERE,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10, help='interpreters to start')
+    parser.add_argument('--budget-ms', type=float, default=700.0, help='median import + create_app() allowed')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        uri = 'sqlite:///' + os.path.join(folder, 'bench.db')
+        probe(uri)  # creates the database, and writes any missing bytecode caches
+        runs = [probe(uri) for _ in range(args.repeat)]
+
+    print(f"{'phase':<16} {'p50 ms':>8} {'max ms':>8}")
+    for phase in ('import_ms', 'factory_ms', 'first_request_ms'):
+        times = [run[phase] for run in runs]
+        print(f"{phase[:-3]:<16} {statistics.median(times):>8.1f} {max(times):>8.1f}")
+    total = statistics.median(run['import_ms'] + run['factory_ms'] for run in runs)
+
+    failed = False
+    loaded = sorted({name for run in runs for name in run['loaded']})
+    if loaded:
+        print(f"❌ create_app() imported web-only modules: {', '.join(loaded)}")
+        failed = True
+    if any(run['status'] != 200 for run in runs):
+        print('❌ the first request failed')
+        failed = True
+    if total > args.budget_ms:
+        print(f'❌ import + create_app() took {total:.0f} ms, over the {args.budget_ms:.0f} ms budget')
+        failed = True
+    if failed:
+        return 1
+    print(f'✅ import + create_app() in {total:.0f} ms (budget {args.budget_ms:.0f} ms)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Query plan check for the Rental Management System
+
+Seeds a large throwaway SQLite database, drives the main routes for every
+role through the Flask test client, captures each SELECT they issue and
+runs EXPLAIN QUERY PLAN on it. Exits non-zero if any query reads a table
+with a full scan instead of an index search.
+
+    python check_query_plans.py --payments 200000
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+from datetime import date
+
+from sqlalchemy import event
+
+import synthetic
+from app import create_app
+from extensions import db
+from models import User
+
+ROUTES = {
+    'admin': [
+        '/admin/dashboard',
+        '/admin/users',
+        '/admin/users?role=tenant',
+        '/admin/users?is_active=0',
+        '/properties',
+        '/properties?status=available',
+        '/leases',
+        '/payments',
+        '/payments?sort=payment_date',
+        '/maintenance',
+        '/maintenance?status=pending',
+        '/notifications',
+        '/leases/add',
+        '/payments/add',
+        '/reports/rent-collection',
+        '/reports/occupancy',
+        '/reports/maintenance',
+    ],
+    'owner': [
+        '/owner/dashboard',
+        '/properties',
+        '/leases',
+        '/payments',
+        '/maintenance',
+        '/leases/add',
+        '/reports/rent-collection',
+        '/reports/occupancy',
+        '/reports/maintenance',
+    ],
+    'tenant': [
+        '/tenant/dashboard',
+        '/properties',
+        '/leases',
+        '/payments',
+        '/maintenance',
+        '/notifications',
+        '/maintenance/add',
+    ],
+    'staff': [
+        '/staff/dashboard',
+        '/maintenance',
+    ],
+}
+
+# "SCAN <table>" with no index is a full table scan. The exceptions are a
+# scan in rowid order feeding a LIMIT with no sort step (it stops after a
+# page), and admin-wide report breakdowns that emit one row per property or
+# owner, where walking that table is proportional to the number of groups.
+# Summary tables are read whole by design: property_facets holds one small
+# compressed row per facet value and id chunk, not one per property.
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+GROUP_TABLES = {'properties', 'users'}
+SUMMARY_TABLES = {'property_facets'}
+
+
+def capture_queries(app, users):
+    """Run every route for every role: [(role, url, statement, params)], and the routes that ran no SELECT"""
+    captured, silent = [], []
+    current = {}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            captured.append((current['role'], current['url'], statement, parameters))
+
+    client = app.test_client()
+    with app.app_context():
+        # Reports and dashboards are @read_only: their queries run on the read bind
+        engines = list(db.engines.values())
+    # Requests must not run inside an outer app context: Flask would reuse it
+    # and Flask-Login would keep the first role's user cached on ``g``
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        for role, urls in ROUTES.items():
+            with client.session_transaction() as session:
+                session['_user_id'] = str(users[role])
+                session['_fresh'] = True
+            for url in urls:
+                current.update(role=role, url=url)
+                before = len(captured)
+                response = client.get(url)
+                if response.status_code != 200:
+                    print(f'  ! {role} {url} returned {response.status_code}')
+                elif len(captured) == before:
+                    silent.append((role, url))
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return captured, silent
+
+
+def full_scans(connection, statement, parameters):
+    plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    details = [row[-1] for row in plan]
+    sorts = any('USE TEMP B-TREE' in detail for detail in details)
+    bounded = re.search(r'\bLIMIT\b', statement, re.IGNORECASE) is not None
+    grouped = re.search(r'\bGROUP BY\b', statement, re.IGNORECASE) is not None
+    scans = []
+    for detail in details:
+        match = FULL_SCAN.match(detail)
+        if not match or (bounded and not sorts) or match.group(1) in SUMMARY_TABLES:
+            continue
+        if grouped and match.group(1) in GROUP_TABLES:
+            continue
+        scans.append(match.group(1))
+    return scans, details
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--payments', type=int, default=100000, help='payment rows to seed')
+    parser.add_argument('--db', help='database file to use (default: a temporary file)')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'query_plans.db')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.abspath(path)}'})
+
+    with app.app_context():
+        if not User.query.first():
+            print(f'Seeding {args.payments} payments into {path}...')
+            users = synthetic.generate(synthetic.Size.for_payments(args.payments), today=date(2024, 6, 1))
+        else:
+            users = {role: User.query.filter_by(role=role).first().id
+                     for role in ('admin', 'owner', 'tenant', 'staff')}
+
+    captured, silent = capture_queries(app, users)
+
+    # Every route reads something; one with no captured SELECT would go unchecked
+    failures = len(silent)
+    for role, url in silent:
+        print(f'✗ {role:<6} {url}: no SELECT was captured')
+    seen = set()
+    with app.app_context():
+        with db.engine.connect() as connection:
+            for role, url, statement, parameters in captured:
+                if (url, statement) in seen:
+                    continue
+                seen.add((url, statement))
+                scans, details = full_scans(connection, statement, parameters)
+                if scans:
+                    failures += 1
+                    print(f'✗ {role:<6} {url}: full scan of {", ".join(scans)}')
+                    print('    ' + ' '.join(statement.split())[:200])
+                    for detail in details:
+                        print(f'      {detail}')
+
+    print(f'\nChecked {len(seen)} queries across {sum(len(u) for u in ROUTES.values())} route calls.')
+    if failures:
+        print(f'❌ {failures} queries use a full table scan')
+        return 1
+    print('✅ No full table scans')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Maintenance commands for the ``flask`` CLI.
+
+    PYTHONPATH=. flask --app app reconcile-counters [--dry-run]
+    PYTHONPATH=. flask --app app reconcile-facets [--dry-run]
+    PYTHONPATH=. flask --app app generate-invoices [--month YYYY-MM] [--dry-run]
+    PYTHONPATH=. flask --app app assess-late-fees [--policy daily --amount 10 --cap 150] [--dry-run]
+    PYTHONPATH=. flask --app app send-reminders [--horizon 60 --horizon 30 --horizon 7]
+    PYTHONPATH=. flask --app app process-images
+    PYTHONPATH=. flask --app app archive-notifications [--days 90 --batch 1000]
+    PYTHONPATH=. flask --app app import-portfolio --users users.csv --properties properties.csv ...
+    PYTHONPATH=. flask --app app generate-data [--size medium --seed 42 --payments 20000]
+"""
+
+import csv
+from contextlib import ExitStack
+from datetime import date
+
+import click
+
+import counters
+import facets
+import images
+import importer
+import inbox
+import invoices
+import reminders
+import synthetic
+
+
+def register_commands(app):
+    @app.cli.command('reconcile-counters')
+    @click.option('--dry-run', is_flag=True, help='Report drift without rewriting the counters.')
+    def reconcile_counters(dry_run):
+        """Rebuild the dashboard counters from the base tables and report drift."""
+        drift = counters.reconcile(fix=not dry_run)
+        for scope, scope_id, field, stored, expected in drift:
+            click.echo(f'{scope}:{scope_id} {field}: stored {stored}, expected {expected}')
+        if not drift:
+            click.echo('Dashboard counters are up to date.')
+        elif dry_run:
+            click.echo(f'{len(drift)} counters drifted (dry run, nothing changed).')
+        else:
+            click.echo(f'{len(drift)} counters drifted and were rebuilt.')
+
+    @app.cli.command('reconcile-facets')
+    @click.option('--dry-run', is_flag=True, help='Report drift without rewriting the facet counts.')
+    def reconcile_facets(dry_run):
+        """Rebuild the property facet bitmaps from the properties table and report drift."""
+        drift = facets.reconcile(fix=not dry_run)
+        for facet, value, chunk, stored, expected in drift:
+            click.echo(f'{facet}={value} (chunk {chunk}): stored {stored} properties, expected {expected}')
+        if not drift:
+            click.echo('Facet bitmaps are up to date.')
+        elif dry_run:
+            click.echo(f'{len(drift)} facet bitmaps drifted (dry run, nothing changed).')
+        else:
+            click.echo(f'{len(drift)} facet bitmaps drifted and were rebuilt.')
+
+    @app.cli.command('generate-invoices')
+    @click.option('--month', default=lambda: date.today().strftime('%Y-%m'), show_default='current month',
+                  help='Payment month to invoice, as YYYY-MM.')
+    @click.option('--dry-run', is_flag=True, help='Count the invoices without creating them.')
+    def generate_invoices(month, dry_run):
+        """Create the pending rent invoice for every active lease."""
+        try:
+            result = invoices.generate_invoices(month, dry_run=dry_run)
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint='--month')
+        verb = 'would be created' if dry_run else 'created'
+        click.echo(f"{month}: {result['created']} invoices {verb}, "
+                   f"{result['existing']} already invoiced, {result['leases']} active leases.")
+
+    @app.cli.command('assess-late-fees')
+    @click.option('--policy', help='flat, percentage or daily; overrides LATE_FEE_POLICY.')
+    @click.option('--amount', type=float, help='Flat fee or per-day fee; overrides LATE_FEE_AMOUNT.')
+    @click.option('--percent', type=float, help='Percentage of rent; overrides LATE_FEE_PERCENT.')
+    @click.option('--cap', type=float, help='Maximum fee; overrides LATE_FEE_CAP.')
+    @click.option('--grace-days', type=int, help='Overrides LATE_FEE_GRACE_DAYS.')
+    @click.option('--as-of', type=click.DateTime(['%Y-%m-%d']), help='Assess as of this date (default: today).')
+    @click.option('--dry-run', is_flag=True, help='Print the fee changes without saving them.')
+    def assess_late_fees(policy, amount, percent, cap, grace_days, as_of, dry_run):
+        """Recompute late fees on all pending payments."""
+        import latefees  # NumPy takes longer to import than the rest of the app; only this command needs it
+        try:
+            rule = latefees.LateFeePolicy.from_config(
+                app.config, kind=policy, amount=amount, percent=percent, cap=cap, grace_days=grace_days
+            )
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint='--policy')
+        result = latefees.assess_late_fees(rule, as_of=as_of.date() if as_of else None, dry_run=dry_run)
+        if dry_run:
+            for payment_id, old_fee, new_fee, days_late in result.rows():
+                click.echo(f'payment {payment_id}: {old_fee:.2f} -> {new_fee:.2f} ({days_late} days late)')
+        verb = 'would change' if dry_run else 'changed'
+        click.echo(f'{result.changed} of {result.checked} pending payments {verb}.')
+
+    @app.cli.command('send-reminders')
+    @click.option('--horizon', 'horizons', type=click.IntRange(min=0), multiple=True,
+                  default=reminders.HORIZONS, show_default=True,
+                  help='Days ahead to remind at; repeat for several horizons.')
+    @click.option('--as-of', type=click.DateTime(['%Y-%m-%d']), help='Scan as of this date (default: today).')
+    def send_reminders(horizons, as_of):
+        """Notify tenants and owners of expiring leases and rent falling due."""
+        result = reminders.send_reminders(today=as_of.date() if as_of else None, horizons=horizons)
+        click.echo(f"Sent {result['lease_expiry']} lease expiry and {result['rent_due']} rent-due reminders.")
+
+    @app.cli.command('process-images')
+    def process_images():
+        """Move legacy property uploads to content-addressed storage and render missing variants."""
+        converted, rendered = images.process_existing()
+        click.echo(f'{converted} legacy images converted, {rendered} images rendered.')
+
+    @app.cli.command('archive-notifications')
+    @click.option('--days', type=int, default=lambda: app.config['NOTIFICATION_RETENTION_DAYS'],
+                  show_default='NOTIFICATION_RETENTION_DAYS', help='Archive read notifications older than this.')
+    @click.option('--batch', type=click.IntRange(min=1), default=inbox.ARCHIVE_BATCH, show_default=True,
+                  help='Notifications moved per transaction.')
+    @click.option('--pause', type=float, default=0.0, show_default=True,
+                  help='Seconds to sleep between batches.')
+    def archive_notifications(days, batch, pause):
+        """Move old read notifications into the archive table."""
+        try:
+            moved = inbox.archive_read(days, batch_size=batch, pause=pause)
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint='--days')
+        click.echo(f'{moved} read notifications older than {days} days archived.')
+
+    def _csv_option(kind):
+        return click.option(f'--{kind}', type=click.Path(exists=True, dir_okay=False),
+                            help=f'CSV file of {kind} to import.')
+
+    @app.cli.command('import-portfolio')
+    @_csv_option('users')
+    @_csv_option('properties')
+    @_csv_option('leases')
+    @_csv_option('payments')
+    @click.option('--batch', type=click.IntRange(min=1), default=importer.BATCH_SIZE, show_default=True,
+                  help='Rows inserted per transaction.')
+    @click.option('--errors', 'errors_path', type=click.Path(dir_okay=False, writable=True),
+                  help='Write every rejected row to this CSV file.')
+    @click.option('--dry-run', is_flag=True, help='Validate the files without importing anything.')
+    @click.option('--show', type=click.IntRange(min=0), default=20, show_default=True,
+                  help='Rejected rows to print.')
+    def import_portfolio(batch, errors_path, dry_run, show, **paths):
+        """Import users, properties, leases and payments from CSV files."""
+        paths = {kind: path for kind, path in paths.items() if path}
+        if not paths:
+            raise click.UsageError('Give at least one of --users, --properties, --leases, --payments.')
+        with ExitStack() as stack:
+            sources = {kind: stack.enter_context(open(path, newline='', encoding='utf-8-sig'))
+                       for kind, path in paths.items()}
+            on_error = None
+            if errors_path:
+                writer = csv.writer(stack.enter_context(open(errors_path, 'w', newline='')))
+                writer.writerow(['file', 'line', 'error'])
+
+                def on_error(kind, line, message):
+                    writer.writerow([paths[kind], line, message])
+            result = importer.import_portfolio(sources, batch_size=batch, dry_run=dry_run, on_error=on_error)
+
+        verb = 'valid' if dry_run else 'imported'
+        for kind in importer.KINDS:
+            if kind in paths:
+                click.echo(f'{kind}: {result.imported[kind]} {verb}, {result.rejected[kind]} rejected.')
+        for kind, line, message in result.errors[:show]:
+            click.echo(f'{paths[kind]}:{line}: {message}')
+        hidden = result.error_count - min(show, len(result.errors))
+        if hidden > 0:
+            click.echo(f'... and {hidden} more rejected rows' + (f' (see {errors_path}).' if errors_path else '.'))
+
+    @app.cli.command('generate-data')
+    @click.option('--size', type=click.Choice(synthetic.PRESETS), default='medium', show_default=True,
+                  help='Portfolio preset to start from.')
+    @click.option('--owners', type=click.IntRange(min=1), help='Override the number of owners.')
+    @click.option('--properties', type=click.IntRange(min=0), help='Override the number of properties.')
+    @click.option('--leases', type=click.IntRange(min=0), help='Override the number of leases.')
+    @click.option('--payments', type=click.IntRange(min=0), help='Override the number of payments.')
+    @click.option('--maintenance', type=click.IntRange(min=0), help='Override the number of maintenance requests.')
+    @click.option('--notifications', type=click.IntRange(min=0), help='Override the number of notifications.')
+    @click.option('--seed', type=int, default=42, show_default=True, help='Same seed, same data.')
+    @click.option('--today', type=click.DateTime(['%Y-%m-%d']), help='Date to generate around (default: today).')
+    @click.option('--password', help='Password for every generated user (default: none, no logins).')
+    def generate_data(size, seed, today, password, **counts):
+        """Fill an empty database with a synthetic portfolio."""
+        size = synthetic.scaled(synthetic.PRESETS[size], **counts)
+        try:
+            users = synthetic.generate(size, seed=seed, today=today and today.date(), password=password)
+        except ValueError as exc:
+            raise click.UsageError(str(exc))
+        click.echo(f'Generated {size.owners} owners, {size.properties} properties, {size.leases} leases, '
+                   f'up to {size.payments} payments, {size.maintenance} maintenance requests and '
+                   f'{size.notifications} notifications.')
+        click.echo('Busiest users: ' + ', '.join(f'{role} #{user_id}' for role, user_id in users.items()))
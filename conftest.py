@@ -0,0 +1,97 @@
+import itertools
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app
+from extensions import db
+from models import User, Property, Lease, Payment, MaintenanceRequest
+
+_seq = itertools.count(1)
+
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        # A list page that lazy-loads per row fails its test
+        'SQL_INSTRUMENTATION': True,
+        'SQL_NPLUSONE_RAISE': True,
+    })
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """Log a user in on the test client without going through password hashing"""
+    def _login(user_id):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+    return _login
+
+
+def make_user(role, **fields):
+    n = next(_seq)
+    fields.setdefault('is_active', True)
+    user = User(
+        username=f'{role}{n}',
+        email=f'{role}{n}@example.com',
+        full_name=f'{role.title()} {n}',
+        role=role,
+        password_hash='not-a-real-hash',
+        **fields
+    )
+    db.session.add(user)
+    return user
+
+
+def make_portfolio(units, owner=None):
+    """Create ``units`` properties, each with its own tenant, lease, payment and request"""
+    owner = owner or make_user('owner')
+    db.session.flush()
+    for _ in range(units):
+        tenant = make_user('tenant')
+        prop = Property(owner_id=owner.id, property_type='House', title=f'Unit {next(_seq)}',
+                        address='1 Test Street', city='Springfield', rent_amount=1000,
+                        availability_status='occupied')
+        db.session.add(prop)
+        db.session.flush()
+        lease = Lease(property_id=prop.id, tenant_id=tenant.id, start_date=date(2024, 1, 1),
+                      end_date=date(2024, 12, 31), monthly_rent=1000, status='active')
+        db.session.add(lease)
+        db.session.flush()
+        db.session.add(Payment(lease_id=lease.id, tenant_id=tenant.id, amount=1000,
+                               payment_date=date(2024, 2, 1), payment_month='2024-02',
+                               payment_method='cash', status='completed'))
+        db.session.add(MaintenanceRequest(property_id=prop.id, tenant_id=tenant.id,
+                                          title='Leaky tap', description='Drips',
+                                          category='plumbing'))
+    db.session.commit()
+    return owner
+
+
+@contextmanager
+def count_queries(engine):
+    """Count the SQL statements executed on ``engine`` inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
@@ -0,0 +1,277 @@
+"""
+Incrementally maintained dashboard counters.
+
+Dashboards read one ``DashboardCounter`` row by primary key instead of
+running COUNT/SUM queries on every load. Rows exist per scope: ``global``
+(scope_id 0) for the admin dashboard, ``owner`` per property owner and
+``staff`` per assigned staff member.
+
+Counters are kept current by a ``before_flush`` hook: every ORM insert,
+update or delete of a user, property, lease, payment or maintenance request
+is turned into counter deltas and upserted on the same connection, so the
+figures commit or roll back together with the write that caused them.
+Bulk Core statements bypass the hook; run ``flask reconcile-counters``
+after them to rebuild the table and report any drift.
+"""
+
+from collections import defaultdict
+
+from sqlalchemy import case, event, func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session, attributes
+
+from extensions import db
+from models import (User, Property, Lease, Payment, MaintenanceRequest,
+                    DashboardCounter)
+
+GLOBAL = 'global'
+OWNER = 'owner'
+STAFF = 'staff'
+
+FIELDS = (
+    'total_users',
+    'pending_users',
+    'total_properties',
+    'active_leases',
+    'completed_revenue',
+    'pending_maintenance',
+    'in_progress_maintenance',
+    'completed_maintenance',
+)
+
+MAINTENANCE_FIELDS = {
+    'pending': 'pending_maintenance',
+    'in_progress': 'in_progress_maintenance',
+    'completed': 'completed_maintenance',
+}
+
+# Attributes whose changes move a counter, per model
+TRACKED = {
+    User: ('is_active',),
+    Property: ('owner_id',),
+    Lease: ('status', 'property_id'),
+    Payment: ('status', 'amount', 'lease_id'),
+    MaintenanceRequest: ('status', 'property_id', 'staff_id'),
+}
+
+
+def get_counters(scope, scope_id=0):
+    """The counter row for a scope, or an all-zero row if nothing was counted yet"""
+    row = db.session.get(DashboardCounter, (scope, scope_id))
+    if row is None:
+        row = DashboardCounter(scope=scope, scope_id=scope_id, **{field: 0 for field in FIELDS})
+    return row
+
+
+# ==================== Delta tracking ====================
+
+def _to_int(value):
+    return int(value) if value not in (None, '') else None
+
+
+def _owner_of_property(session, property_id):
+    prop = session.get(Property, _to_int(property_id)) if property_id not in (None, '') else None
+    return prop.owner_id if prop is not None else None
+
+
+def _owner_of_lease(session, lease_id):
+    lease = session.get(Lease, _to_int(lease_id)) if lease_id not in (None, '') else None
+    return _owner_of_property(session, lease.property_id) if lease is not None else None
+
+
+def _contributions(session, obj, values):
+    """[(scope, scope_id, field, amount)] that ``obj`` adds to the counters"""
+    if isinstance(obj, User):
+        rows = [(GLOBAL, 0, 'total_users', 1)]
+        if values['is_active'] is False:
+            rows.append((GLOBAL, 0, 'pending_users', 1))
+        return rows
+
+    if isinstance(obj, Property):
+        return [(GLOBAL, 0, 'total_properties', 1),
+                (OWNER, _to_int(values['owner_id']), 'total_properties', 1)]
+
+    if isinstance(obj, Lease):
+        if (values['status'] or 'active') != 'active':
+            return []
+        return [(GLOBAL, 0, 'active_leases', 1),
+                (OWNER, _owner_of_property(session, values['property_id']), 'active_leases', 1)]
+
+    if isinstance(obj, Payment):
+        if (values['status'] or 'pending') != 'completed':
+            return []
+        amount = float(values['amount'] or 0)
+        return [(GLOBAL, 0, 'completed_revenue', amount),
+                (OWNER, _owner_of_lease(session, values['lease_id']), 'completed_revenue', amount)]
+
+    if isinstance(obj, MaintenanceRequest):
+        field = MAINTENANCE_FIELDS.get(values['status'] or 'pending')
+        if field is None:
+            return []
+        rows = [(GLOBAL, 0, field, 1),
+                (OWNER, _owner_of_property(session, values['property_id']), field, 1)]
+        if values['staff_id'] not in (None, ''):
+            rows.append((STAFF, _to_int(values['staff_id']), field, 1))
+        return rows
+
+    return []
+
+
+def _current_values(obj, keys):
+    return {key: getattr(obj, key) for key in keys}
+
+
+def _previous_values(obj, keys):
+    values = {}
+    for key in keys:
+        history = attributes.get_history(obj, key)
+        if history.deleted:
+            values[key] = history.deleted[0]
+        else:
+            values[key] = getattr(obj, key)
+    return values
+
+
+def _changed(obj, keys):
+    return any(attributes.get_history(obj, key).has_changes() for key in keys)
+
+
+def collect_deltas(session):
+    """Fold the pending inserts, updates and deletes into {(scope, id): {field: delta}}"""
+    deltas = defaultdict(lambda: defaultdict(float))
+
+    def add(rows, sign):
+        for scope, scope_id, field, amount in rows:
+            if scope_id is not None:
+                deltas[(scope, scope_id)][field] += sign * amount
+
+    with session.no_autoflush:
+        for obj in session.new:
+            keys = TRACKED.get(type(obj))
+            if keys:
+                add(_contributions(session, obj, _current_values(obj, keys)), 1)
+        for obj in session.deleted:
+            keys = TRACKED.get(type(obj))
+            if keys:
+                add(_contributions(session, obj, _previous_values(obj, keys)), -1)
+        for obj in session.dirty:
+            keys = TRACKED.get(type(obj))
+            if keys and obj not in session.deleted and _changed(obj, keys):
+                add(_contributions(session, obj, _previous_values(obj, keys)), -1)
+                add(_contributions(session, obj, _current_values(obj, keys)), 1)
+
+    return {key: {field: amount for field, amount in fields.items() if amount}
+            for key, fields in deltas.items() if any(fields.values())}
+
+
+def apply_deltas(connection, deltas):
+    table = DashboardCounter.__table__
+    for (scope, scope_id), fields in deltas.items():
+        values = {field: 0 for field in FIELDS}
+        values.update(fields)
+        stmt = insert(table).values(scope=scope, scope_id=scope_id, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.scope, table.c.scope_id],
+            set_={field: table.c[field] + stmt.excluded[field] for field in fields},
+        )
+        connection.execute(stmt)
+
+
+@event.listens_for(Session, 'before_flush')
+def _update_counters(session, flush_context, instances):
+    deltas = collect_deltas(session)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def _keep_old_values(target, value, oldvalue, initiator):
+    return value
+
+
+# Load the previous value when a tracked attribute is overwritten, even if it
+# had been expired by an earlier commit, so the old contribution can be removed
+for _model, _keys in TRACKED.items():
+    for _key in _keys:
+        event.listen(getattr(_model, _key), 'set', _keep_old_values,
+                     active_history=True, retval=True)
+
+
+# ==================== Reconciliation ====================
+
+def compute_counters():
+    """Recount every scope from the base tables: {(scope, id): {field: value}}"""
+    expected = defaultdict(lambda: {field: 0 for field in FIELDS})
+
+    total_users, pending_users = db.session.query(
+        func.count(User.id),
+        func.coalesce(func.sum(case((User.is_active == db.false(), 1), else_=0)), 0),
+    ).one()
+    expected[(GLOBAL, 0)].update(total_users=total_users, pending_users=pending_users)
+
+    for owner_id, count in db.session.query(Property.owner_id, func.count(Property.id)) \
+            .group_by(Property.owner_id):
+        expected[(OWNER, owner_id)]['total_properties'] = count
+        expected[(GLOBAL, 0)]['total_properties'] += count
+
+    for owner_id, count in db.session.query(Property.owner_id, func.count(Lease.id)) \
+            .select_from(Lease).join(Property).filter(Lease.status == 'active') \
+            .group_by(Property.owner_id):
+        expected[(OWNER, owner_id)]['active_leases'] = count
+        expected[(GLOBAL, 0)]['active_leases'] += count
+
+    for owner_id, revenue in db.session.query(Property.owner_id, func.sum(Payment.amount)) \
+            .select_from(Payment).join(Lease).join(Property).filter(Payment.status == 'completed') \
+            .group_by(Property.owner_id):
+        expected[(OWNER, owner_id)]['completed_revenue'] = revenue or 0
+        expected[(GLOBAL, 0)]['completed_revenue'] += revenue or 0
+
+    for owner_id, staff_id, status, count in db.session.query(
+            Property.owner_id, MaintenanceRequest.staff_id, MaintenanceRequest.status,
+            func.count(MaintenanceRequest.id)) \
+            .select_from(MaintenanceRequest).join(Property) \
+            .group_by(Property.owner_id, MaintenanceRequest.staff_id, MaintenanceRequest.status):
+        field = MAINTENANCE_FIELDS.get(status)
+        if field is None:
+            continue
+        expected[(GLOBAL, 0)][field] += count
+        expected[(OWNER, owner_id)][field] += count
+        if staff_id is not None:
+            expected[(STAFF, staff_id)][field] += count
+
+    return expected
+
+
+def _differs(stored, expected):
+    return abs((stored or 0) - (expected or 0)) > 0.005
+
+
+def reconcile(fix=True):
+    """
+    Compare the stored counters with a full recount.
+
+    Returns a list of (scope, scope_id, field, stored, expected) for every
+    value that drifted. With ``fix`` the table is rewritten from the recount
+    in a single transaction.
+    """
+    expected = compute_counters()
+    stored = {(row.scope, row.scope_id): row for row in DashboardCounter.query}
+
+    drift = []
+    for key in sorted(set(expected) | set(stored), key=lambda k: (k[0], k[1])):
+        want = expected.get(key, {field: 0 for field in FIELDS})
+        have = stored.get(key)
+        for field in FIELDS:
+            current = getattr(have, field) if have is not None else 0
+            if _differs(current, want[field]):
+                drift.append((key[0], key[1], field, current, want[field]))
+
+    if fix and drift:
+        table = DashboardCounter.__table__
+        db.session.execute(table.delete())
+        rows = [dict(scope=scope, scope_id=scope_id, **values)
+                for (scope, scope_id), values in expected.items()]
+        if rows:
+            db.session.execute(table.insert(), rows)
+        db.session.commit()
+
+    return drift
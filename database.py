@@ -0,0 +1,283 @@
+"""
+SQLite connection tuning.
+
+Every new SQLite connection gets the ``SQLITE_*`` settings from the app
+config as PRAGMAs (a setting of None is left at SQLite's default):
+
+- ``journal_mode=WAL`` lets readers carry on while a write commits,
+  instead of the whole file being locked for the duration;
+- ``busy_timeout`` makes a writer wait for the lock instead of failing at
+  once with "database is locked";
+- ``synchronous=NORMAL`` is durable under WAL except across a power loss,
+  and saves an fsync per commit;
+- ``cache_size``, ``mmap_size`` and ``temp_store`` keep hot pages and
+  sort/temp b-trees in memory.
+
+For file databases the pool size, overflow, timeout and recycle come from
+the ``DATABASE_POOL_*`` settings. Connections run ``PRAGMA optimize`` as the
+pool closes them, which includes engine disposal at interpreter exit, so the
+planner statistics stay current without a separate ANALYZE job.
+
+Reports and dashboards read through a second, read-only bind
+(``DATABASE_READ_URI``): by default the same SQLite file opened with
+``mode=ro``, or a replica file kept up to date by something else. It has a
+connection pool of its own, so long report queries never take the
+connections a payment is waiting for, and its connections run with
+``query_only`` so a stray write fails instead of taking the write lock.
+Views opt in with ``@read_only``; ``RoutingSession`` then sends their
+SELECTs to the read bind, and flushes and DML to the primary as always.
+A user who wrote in the last ``DATABASE_READ_AFTER_WRITE`` seconds reads
+from the primary, so they never see a replica from before their own
+change, and so does the rest of a request once it has flushed.
+
+``create_app`` creates the tables of a new, empty database and stamps it
+with the newest migration revision; an existing one costs a single query
+at start-up and is upgraded with ``flask db upgrade`` (see ``ensure_schema``).
+
+Settings can also be given as environment variables prefixed with ``RMS_``
+(``RMS_SQLITE_BUSY_TIMEOUT=10000``, ``RMS_SQLALCHEMY_DATABASE_URI=...``),
+see ``create_app``.
+"""
+
+import atexit
+import sqlite3
+import time
+import weakref
+from functools import wraps
+
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+# (PRAGMA, config key) in the order they are applied
+PRAGMAS = (
+    ('journal_mode', 'SQLITE_JOURNAL_MODE'),
+    ('busy_timeout', 'SQLITE_BUSY_TIMEOUT'),
+    ('synchronous', 'SQLITE_SYNCHRONOUS'),
+    ('cache_size', 'SQLITE_CACHE_SIZE'),
+    ('mmap_size', 'SQLITE_MMAP_SIZE'),
+    ('temp_store', 'SQLITE_TEMP_STORE'),
+)
+
+# Pool settings for file databases: (create_engine option, config key)
+POOL_OPTIONS = (
+    ('pool_size', 'DATABASE_POOL_SIZE'),
+    ('max_overflow', 'DATABASE_POOL_OVERFLOW'),
+    ('pool_timeout', 'DATABASE_POOL_TIMEOUT'),
+    ('pool_recycle', 'DATABASE_POOL_RECYCLE'),
+)
+
+# Bind key of the read-only engine, and the session.info / cookie keys routing uses
+READ_BIND = 'read_only'
+READ_ONLY = 'read_only'
+WROTE = 'database_wrote'
+WROTE_AT = 'db_wrote_at'
+
+
+def is_file_database(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def read_only_uri(uri):
+    """``uri`` opened read-only, or None for a database that can't be shared that way"""
+    if not is_file_database(uri):
+        return None  # an in-memory database is private to its one connection
+    url = make_url(uri)
+    if not url.query.get('uri'):
+        url = url.set(database=f'file:{url.database}').update_query_dict({'uri': 'true'})
+    return url.update_query_dict({'mode': 'ro'})
+
+
+def read_uri(config):
+    """The URI of the read-only bind, or None when reads share the primary engine"""
+    uri = config.get('DATABASE_READ_URI')
+    if uri is False:
+        return None
+    return uri or read_only_uri(config['SQLALCHEMY_DATABASE_URI'])
+
+
+def _pool_options(config, options):
+    for option, key in POOL_OPTIONS:
+        if config.get(key) is not None:
+            options.setdefault(option, config[key])
+    return options
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for ``config``, with the pool settings added for SQLite files"""
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if is_file_database(config['SQLALCHEMY_DATABASE_URI']):
+        # In-memory databases use a single shared connection, which takes no pool settings
+        _pool_options(config, options)
+    return options
+
+
+def pragma_statements(config, file_database=True, read_only=False):
+    statements = []
+    for pragma, key in PRAGMAS:
+        value = config.get(key)
+        if value is None or (pragma in ('journal_mode', 'mmap_size') and not file_database):
+            continue
+        if pragma == 'journal_mode' and read_only:
+            continue  # set by the primary; changing it needs write access
+        statements.append(f'PRAGMA {pragma} = {value}')
+    if read_only:
+        statements.append('PRAGMA query_only = 1')
+    return statements
+
+
+def _set_pragmas(statements):
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+    return connect
+
+
+def _optimize(dbapi_connection, connection_record):
+    try:
+        dbapi_connection.execute('PRAGMA optimize')
+    except sqlite3.Error:
+        pass  # the file may already be gone (tests, scratch databases)
+
+
+def _dispose(engine_ref):
+    engine = engine_ref()
+    if engine is not None:
+        engine.dispose()
+
+
+def init_app(app):
+    """Set the engine options before ``db.init_app``; call ``install`` after it"""
+    config = app.config
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(config)
+    uri = read_uri(config)
+    if uri is not None:
+        config['SQLALCHEMY_BINDS'] = {**(config.get('SQLALCHEMY_BINDS') or {}),
+                                      READ_BIND: _pool_options(config, {'url': uri})}
+    app.teardown_request(_end_request)
+
+
+def install(app):
+    """Attach the PRAGMA and shutdown hooks to the app's SQLite engines"""
+    sqlalchemy = app.extensions['sqlalchemy']
+    # No model lives on the read bind: keep create_all/drop_all off it, for
+    # this app and for others in the process that have no read bind at all
+    sqlalchemy.metadatas.pop(READ_BIND, None)
+    with app.app_context():
+        engine, read_engine = sqlalchemy.engines[None], sqlalchemy.engines.get(READ_BIND)
+    if engine.dialect.name == 'sqlite':
+        file_database = is_file_database(app.config['SQLALCHEMY_DATABASE_URI'])
+        event.listen(engine, 'connect', _set_pragmas(pragma_statements(app.config, file_database)))
+        if file_database:
+            event.listen(engine, 'close', _optimize)
+            atexit.register(_dispose, weakref.ref(engine))
+    if read_engine is not None and read_engine.dialect.name == 'sqlite':
+        statements = pragma_statements(app.config, read_only=True)
+        event.listen(read_engine, 'connect', _set_pragmas(statements))
+        atexit.register(_dispose, weakref.ref(read_engine))
+
+
+# ==================== Schema ====================
+
+# The newest revision in migrations/versions; test_database checks the two agree
+SCHEMA_REVISION = 'e6f1a8c3d5b9'
+# The schema create_all made before there were migrations
+BASELINE_REVISION = '6a1d0c3e9f21'
+
+
+def schema_revision(connection):
+    """The migration revision the database is at; None when it has never been stamped"""
+    if not inspect(connection).has_table('alembic_version'):
+        return None
+    return connection.execute(text('SELECT version_num FROM alembic_version')).scalar()
+
+
+def ensure_schema(app):
+    """Create the tables of an empty database, instead of ``create_all`` on every start
+
+    A new database gets the tables and is stamped with SCHEMA_REVISION, as
+    ``flask db upgrade`` would leave it. One at another revision is only
+    logged: migrating it is left to ``flask db upgrade``. So is one made by
+    ``create_all`` before migrations existed: it is at BASELINE_REVISION but
+    not stamped, and is left as it is so the upgrade starts from that schema.
+    """
+    sqlalchemy = app.extensions['sqlalchemy']
+    with app.app_context():
+        engine = sqlalchemy.engine
+        with engine.connect() as connection:
+            revision = schema_revision(connection)
+            empty = revision is None and not inspect(connection).get_table_names()
+        if revision == SCHEMA_REVISION:
+            return
+        if revision is not None:
+            app.logger.warning('The database is at migration %s, this code expects %s; '
+                               'run `flask db upgrade`', revision, SCHEMA_REVISION)
+            return
+        if not empty:
+            app.logger.warning('The database has no migration revision; run `flask db stamp %s` '
+                               'and then `flask db upgrade`', BASELINE_REVISION)
+            return
+        sqlalchemy.create_all()
+        with engine.begin() as connection:
+            connection.execute(text('CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL, '
+                                    'CONSTRAINT alembic_version_pkc PRIMARY KEY (version_num))'))
+            connection.execute(text('INSERT INTO alembic_version (version_num) VALUES (:revision)'),
+                               {'revision': SCHEMA_REVISION})
+
+
+# ==================== Read routing ====================
+
+class RoutingSession(Session):
+    """``db.session``: sends reads in ``@read_only`` views to the read-only bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get(READ_ONLY) and not self.info.get(WROTE)
+                and not self._flushing and not isinstance(clause, UpdateBase)):
+            engine = self._db.engines.get(READ_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Route the view's queries to the read-only bind, unless the user has just written"""
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        wrote_at = flask_session.get(WROTE_AT)
+        if wrote_at is None or time.time() - wrote_at > current_app.config['DATABASE_READ_AFTER_WRITE']:
+            current_app.extensions['sqlalchemy'].session.info[READ_ONLY] = True
+        return view(*args, **kwargs)
+    return decorated_function
+
+
+def _end_request(error=None):
+    # The session outlives the request when a test or script holds the app context
+    scoped = current_app.extensions['sqlalchemy'].session
+    if scoped.registry.has():
+        scoped.info.pop(READ_ONLY, None)
+        scoped.info.pop(WROTE, None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_write(session, flush_context):
+    # Later queries in the same request must see what this one wrote
+    session.info[WROTE] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _note_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[WROTE] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _remember_write(session):
+    if session.info.get(WROTE) and has_request_context():
+        flask_session[WROTE_AT] = time.time()
@@ -0,0 +1,274 @@
+"""
+Live notifications over server-sent events.
+
+``/notifications/stream`` keeps one ``text/event-stream`` response open per
+browser tab and pushes each new notification, with the user's unread
+count, to ``base.html``. Its pieces:
+
+- ``Hub`` holds the subscriptions of this process, indexed by user. A
+  subscription is only a small bounded queue and an Event, so an idle tab
+  costs no CPU and no thread of the hub's own; publishing touches only
+  the subscriptions of the notification's user. The gevent workers of
+  gunicorn_events.conf.py, which serve this endpoint alone, patch
+  ``threading``, so each open response parks a greenlet in
+  ``Subscription.wait``, not a thread; the development server
+  (``python app.py``) still parks a thread per stream.
+- ``DatabaseBroker`` is the stand-in message broker shared by worker
+  processes: the ``notifications`` table itself, read past the last id
+  seen. One dispatcher thread per process polls it every
+  SSE_POLL_INTERVAL seconds while anyone is subscribed, and at once when
+  a commit in this process adds notifications, so events created by any
+  worker, or by ``flask send-reminders``, reach every tab.
+
+Streams send a comment every SSE_HEARTBEAT seconds so proxies keep them
+open, and end after SSE_MAX_AGE seconds; the browser then reconnects with
+``Last-Event-ID`` and is sent what it missed.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import Notification
+
+BATCH = 500
+REPLAY_LIMIT = 50
+
+
+def format_event(name, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {name}', f'data: {json.dumps(data)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+def notification_data(row, unread):
+    return {
+        'id': row.id,
+        'title': row.title,
+        'message': row.message,
+        'type': row.notification_type,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'unread': unread,
+    }
+
+
+def unread_counts(user_ids):
+    """{user_id: unread notifications} for ``user_ids`` (users without any are left out)"""
+    rows = db.session.execute(
+        select(Notification.user_id, func.count())
+        .where(Notification.user_id.in_(user_ids), Notification.is_read.is_(False))
+        .group_by(Notification.user_id))
+    return dict(rows.all())
+
+
+class Subscription:
+    """One open stream: the events published for its user, oldest first"""
+
+    def __init__(self, user_id, size):
+        self.user_id = user_id
+        # Notifications up to this id were already sent, replayed when the stream opened
+        self.sent_id = 0
+        # A tab that stops reading only ever keeps the latest events
+        self._events = deque(maxlen=size)
+        self._ready = threading.Event()
+
+    def put(self, event_id, data):
+        self._events.append((event_id, data))
+        self._ready.set()
+
+    def wait(self, timeout):
+        """The events published since the last call, waiting up to ``timeout`` seconds for one"""
+        if not self._events:
+            self._ready.wait(timeout)
+        self._ready.clear()
+        events = []
+        while self._events:
+            event_id, data = self._events.popleft()
+            if event_id > self.sent_id:
+                events.append(data)
+        return events
+
+
+class DatabaseBroker:
+    """Message broker stand-in: every ``notifications`` row is a message, in id order"""
+
+    def latest_id(self):
+        return db.session.execute(select(func.max(Notification.id))).scalar() or 0
+
+    def fetch(self, after_id, subscribed):
+        """(last id read, [(user_id, id, event)]) for the new notifications of subscribed users
+
+        ``subscribed()`` is asked once the rows are read, so a user who
+        subscribed while they were being read still gets theirs.
+        """
+        rows = db.session.execute(
+            select(Notification).where(Notification.id > after_id)
+            .order_by(Notification.id).limit(BATCH)).scalars().all()
+        if not rows:
+            return after_id, []
+        user_ids = subscribed()
+        wanted = [row for row in rows if row.user_id in user_ids]
+        counts = unread_counts({row.user_id for row in wanted}) if wanted else {}
+        events = [(row.user_id, row.id,
+                   format_event('notification', notification_data(row, counts.get(row.user_id, 0)), row.id))
+                  for row in wanted]
+        return rows[-1].id, events
+
+
+class Hub:
+    """Fans events out to this process's subscriptions; polls the broker while any exist"""
+
+    def __init__(self, app, broker, interval, queue_size):
+        self.app = app
+        self.broker = broker
+        self.interval = interval
+        self.queue_size = queue_size
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.last_id = None
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def subscribe(self, user_id):
+        """A new subscription; anything committed from now on is published to it
+
+        Starting the poller reads the broker's latest id here, not on its
+        first poll, so a notification committed while the stream is opening
+        is not skipped. Call in an app context of ``self.app``.
+        """
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+            if self.last_id is None:
+                self.last_id = self.broker.latest_id()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='notification-hub', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def subscribed_users(self):
+        with self._lock:
+            return set(self._subscriptions)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_id, event_id, data):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.put(event_id, data)
+
+    def wake(self):
+        """Poll the broker now instead of at the next interval"""
+        self._wakeup.set()
+
+    def poll(self):
+        with self.app.app_context():
+            try:
+                while True:
+                    last_id, events = self.broker.fetch(self.last_id, self.subscribed_users)
+                    if last_id == self.last_id:
+                        return
+                    self.last_id = last_id
+                    for user_id, event_id, data in events:
+                        self.publish(user_id, event_id, data)
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscriptions:
+                    # Restarted by the next subscriber, from the broker's latest id
+                    self._thread = None
+                    self.last_id = None
+                    return
+            try:
+                self.poll()
+            except Exception:
+                self.app.logger.exception('Polling for new notifications failed')
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+
+def init_app(app):
+    config = app.config
+    app.extensions['notification_hub'] = Hub(
+        app, DatabaseBroker(), config['SSE_POLL_INTERVAL'], config['SSE_QUEUE_SIZE'])
+
+
+def get_hub():
+    return current_app.extensions['notification_hub']
+
+
+def stream(user_id, last_event_id=None):
+    """The event-stream body for one tab of ``user_id``"""
+    config = current_app.config
+    heartbeat, max_age = config['SSE_HEARTBEAT'], config['SSE_MAX_AGE']
+    hub = get_hub()
+    subscription = hub.subscribe(user_id)
+
+    # Everything read from the database happens before the response starts
+    opening = [f"retry: {int(config['SSE_RETRY'] * 1000)}\n\n"]
+    unread = unread_counts([user_id]).get(user_id, 0)
+    if last_event_id is not None:
+        missed = Notification.query.filter(Notification.user_id == user_id,
+                                           Notification.id > last_event_id) \
+            .order_by(Notification.id).limit(REPLAY_LIMIT).all()
+        opening += [format_event('notification', notification_data(row, unread), row.id)
+                    for row in missed]
+        if missed:
+            # The hub may publish these too, having subscribed the stream first
+            subscription.sent_id = missed[-1].id
+    opening.append(format_event('unread', {'unread': unread}))
+    db.session.remove()
+
+    def generate():
+        try:
+            yield ''.join(opening)
+            deadline = time.monotonic() + max_age
+            while time.monotonic() < deadline:
+                events = subscription.wait(heartbeat)
+                yield ''.join(events) if events else ': keep-alive\n\n'
+        finally:
+            hub.unsubscribe(subscription)
+
+    return generate()
+
+
+# ==================== Commit hook ====================
+
+@event.listens_for(Session, 'after_flush')
+def _note_notifications(session, flush_context):
+    if any(isinstance(obj, Notification) for obj in session.new):
+        session.info['notifications_added'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_hub(session):
+    if session.info.pop('notifications_added', False) and has_app_context():
+        hub = current_app.extensions.get('notification_hub')
+        if hub is not None:
+            hub.wake()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_notifications(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop('notifications_added', None)
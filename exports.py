@@ -0,0 +1,246 @@
+"""
+Streaming CSV and XLSX exports for the report pages.
+
+Rows are pulled from the database in ``BATCH_SIZE`` batches with
+``yield_per`` and encoded as they arrive, so an export of millions of
+payments holds one batch in memory and the response starts before the
+query has finished. XLSX workbooks are written as a zip stream with the
+standard library; sheets roll over at Excel's row limit.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+from flask import Response, stream_with_context
+
+from pagination import apply_filters
+import reports as report_queries
+
+BATCH_SIZE = 1000
+XLSX_MAX_ROWS = 1048576
+
+# report slug: (file name prefix, row query builder, filters, column headers)
+EXPORTS = {
+    'rent-collection': (
+        'rent-collection', report_queries.payment_rows, report_queries.PAYMENT_FILTERS,
+        ['ID', 'Date', 'Month', 'Tenant', 'Property', 'Amount', 'Late Fee', 'Method',
+         'Transaction', 'Status'],
+    ),
+    'occupancy': (
+        'occupancy', report_queries.occupancy_rows, report_queries.PROPERTY_FILTERS,
+        ['ID', 'Property', 'Type', 'Address', 'City', 'Owner', 'Rent', 'Status'],
+    ),
+    'maintenance': (
+        'maintenance', report_queries.maintenance_rows, report_queries.MAINTENANCE_FILTERS,
+        ['ID', 'Reported', 'Title', 'Property', 'Tenant', 'Assigned To', 'Category',
+         'Priority', 'Status', 'Cost', 'Completed'],
+    ),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _batches(query):
+    batch = []
+    for row in query.yield_per(BATCH_SIZE):
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='seconds')
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+# ==================== CSV ====================
+
+def _csv_cell(value):
+    # Spreadsheet apps evaluate text starting with these as a formula
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    if isinstance(value, (int, float)):
+        return value
+    return _text(value)
+
+
+def stream_csv(headers, query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    yield buffer.getvalue()
+    for batch in _batches(query):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_cell(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+
+
+# ==================== XLSX ====================
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '{sheets}</Types>'
+)
+_SHEET_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{n}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>'
+)
+_WORKBOOK_SHEET = '<sheet name="{name}" sheetId="{n}" r:id="rId{n}"/>'
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{sheets}</Relationships>'
+)
+_WORKBOOK_REL = (
+    '<Relationship Id="rId{n}" Target="worksheets/sheet{n}.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+)
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+
+# Characters XML 1.0 does not allow, even escaped
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _ChunkSink:
+    """Write-only file object for ZipFile that hands back what was written"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _xlsx_cell(value):
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    if value is None:
+        return '<c/>'
+    text = escape(_INVALID_XML.sub('', _text(value)))
+    return f'<c t="inlineStr"><is><t>{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(headers, query, sheet_name='Report'):
+    sink = _ChunkSink()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED)
+    header_row = _xlsx_row(headers)
+
+    def open_sheet(n):
+        sheet = archive.open(f'xl/worksheets/sheet{n}.xml', 'w', force_zip64=True)
+        sheet.write((_SHEET_START + header_row).encode())
+        return sheet
+
+    sheets = 1
+    sheet = open_sheet(sheets)
+    rows_in_sheet = 1
+    yield sink.drain()
+
+    for batch in _batches(query):
+        parts = []
+        for row in batch:
+            if rows_in_sheet == XLSX_MAX_ROWS:
+                sheet.write((''.join(parts) + _SHEET_END).encode())
+                parts = []
+                sheet.close()
+                sheets += 1
+                sheet = open_sheet(sheets)
+                rows_in_sheet = 1
+            parts.append(_xlsx_row(row))
+            rows_in_sheet += 1
+        sheet.write(''.join(parts).encode())
+        yield sink.drain()
+
+    sheet.write(_SHEET_END.encode())
+    sheet.close()
+
+    numbers = range(1, sheets + 1)
+    names = [sheet_name if n == 1 else f'{sheet_name} {n}' for n in numbers]
+    archive.writestr('[Content_Types].xml', _CONTENT_TYPES.format(
+        sheets=''.join(_SHEET_TYPE.format(n=n) for n in numbers)))
+    archive.writestr('_rels/.rels', _ROOT_RELS)
+    archive.writestr('xl/workbook.xml', _WORKBOOK.format(sheets=''.join(
+        _WORKBOOK_SHEET.format(name=escape(name), n=n) for name, n in zip(names, numbers))))
+    archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS.format(
+        sheets=''.join(_WORKBOOK_REL.format(n=n) for n in numbers)))
+    archive.close()
+    yield sink.drain()
+
+
+# ==================== Response ====================
+
+def export_response(report, export_format, user, args):
+    """
+    Stream ``report`` for ``user`` as ``export_format``.
+
+    Returns None for an unknown report or format. The detail query applies
+    the report's own scoping and the filters from ``args``.
+    """
+    if report not in EXPORTS or export_format not in FORMATS:
+        return None
+    prefix, build_query, filters, headers = EXPORTS[report]
+    query, _ = apply_filters(build_query(user), filters, args)
+
+    if export_format == 'csv':
+        body = stream_csv(headers, query)
+    else:
+        body = stream_xlsx(headers, query, sheet_name=prefix.replace('-', ' ').title())
+
+    filename = f'{prefix}-{date.today().isoformat()}.{export_format}'
+    return Response(
+        stream_with_context(body),
+        mimetype=FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
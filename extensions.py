@@ -1,7 +1,20 @@
+import click
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_migrate import Migrate
 
-db = SQLAlchemy()
+from database import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
-migrate = Migrate()
\ No newline at end of file
+
+
+def init_migrate(app):
+    """Set up Flask-Migrate and its ``flask db`` commands, when the app runs under the flask CLI
+
+    Flask-Migrate imports alembic, about a fifth of the app's import time,
+    and nothing but ``flask db`` needs it, so web workers skip it. A script
+    that migrates in code calls ``Migrate(app, db)`` itself.
+    """
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
@@ -0,0 +1,242 @@
+"""
+Fragment cache for rendered template blocks.
+
+A ``{% cache %}`` block renders once and is then served from the cache:
+
+    {% cache [property, property.owner], 3600 %}
+        ... markup that only depends on property and its owner ...
+    {% endcache %}
+
+The first argument lists what the fragment depends on, the second is its
+lifetime in seconds (FRAGMENT_CACHE_TTL when left out). A model instance
+stands for its table, id and ``updated_at``, so an edit saved through the
+ORM, in this process or any other, changes the key and the next render
+misses; other values are used as they are. The template name and line are
+part of the key too. Nothing that depends on the current user belongs in a
+cached block unless the user (or their role) is in the key.
+
+Entries live in an LRU of FRAGMENT_CACHE_SIZE fragments per process, and,
+when FRAGMENT_CACHE_DIR is set, also as files there, which survive a
+restart and are shared by every worker on the machine. After a commit
+that changed or deleted a model instance, this process drops every
+fragment keyed on it from memory, which is also what keeps fragments of
+models without ``updated_at`` current. Bulk Core statements bypass the
+hooks, as they do for the dashboard counters.
+
+A hit costs building the key and one dict lookup; the block body, and
+any lazy loads in it, never runs.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import InstanceState, Session
+
+# Files of the disk tier older than this are removed by the next prune
+DISK_MAX_AGE = 24 * 3600
+PRUNE_EVERY = 500  # disk writes between prunes
+
+
+def _identity(obj):
+    """(table, id) of a model instance, or None for any other value"""
+    state = inspect(obj, raiseerr=False)
+    if not isinstance(state, InstanceState) or state.identity is None:
+        return None
+    return state.mapper.local_table.name, state.identity
+
+
+def fragment_key(name, parts):
+    """The cache key for ``parts``, and the (table, id) pairs it depends on"""
+    key, depends = [name], []
+    for part in parts:
+        identity = _identity(part)
+        if identity is None:
+            key.append(repr(part))
+        else:
+            depends.append(identity)
+            updated_at = getattr(part, 'updated_at', None)
+            key.append(f'{identity[0]}:{identity[1]}:{updated_at.isoformat() if updated_at else ""}')
+    return '|'.join(key), depends
+
+
+class FragmentCache:
+    """In-memory LRU of rendered fragments, over an optional folder of files"""
+
+    def __init__(self, max_size, ttl, folder=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.folder = folder
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()  # key: (expires, html, depends)
+        self._keys_by_row = {}  # (table, id): keys of the fragments that show it
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, depends=()):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        found = self._read(key, now) if self.folder else None
+        with self._lock:
+            if found is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, *found, depends)  # written by another worker, or before a restart
+        return found[1]
+
+    def put(self, key, html, ttl, depends):
+        expires = time.time() + ttl
+        with self._lock:
+            self._store(key, expires, html, depends)
+        if self.folder:
+            self._write(key, html, expires)
+
+    def _store(self, key, expires, html, depends):
+        self._remove(key)
+        self._entries[key] = (expires, html, depends)
+        for row in depends:
+            self._keys_by_row.setdefault(row, set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def evict(self, rows):
+        with self._lock:
+            for row in rows:
+                for key in self._keys_by_row.pop(row, ()):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_row.clear()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for row in entry[2]:
+            keys = self._keys_by_row.get(row)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_row[row]
+
+    # The disk tier: one file per fragment, the expiry time on its first line
+
+    def _path(self, key):
+        return os.path.join(self.folder, hashlib.sha256(key.encode()).hexdigest() + '.html')
+
+    def _read(self, key, now):
+        try:
+            with open(self._path(key), encoding='utf-8', newline='') as file:
+                expires = float(file.readline())
+                return (expires, file.read()) if expires > now else None
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key, html, expires):
+        path = self._path(key)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temporary, 'w', encoding='utf-8', newline='') as file:
+                file.write(f'{expires}\n{html}')
+            os.replace(temporary, path)
+        except OSError:
+            return  # the disk tier is best effort
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Remove files of the disk tier that nothing has written for DISK_MAX_AGE"""
+        cutoff = time.time() - DISK_MAX_AGE
+        for entry in os.scandir(self.folder):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class FragmentCacheExtension(Extension):
+    """``{% cache parts[, ttl] %}...{% endcache %}``"""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        name = nodes.Const(f'{parser.name}:{lineno}')
+        args = [name, parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, name, parts, ttl, caller):
+        cache = current_app.extensions.get('fragment_cache')
+        if cache is None:
+            return caller()
+        if not isinstance(parts, (list, tuple)):
+            parts = [parts]
+        key, depends = fragment_key(name, parts)
+        html = cache.get(key, depends)
+        if html is None:
+            html = caller()
+            cache.put(key, str(html), cache.ttl if ttl is None else ttl, depends)
+        return Markup(html)
+
+
+def init_app(app):
+    config = app.config
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    if config['FRAGMENT_CACHE_SIZE']:
+        folder = config['FRAGMENT_CACHE_DIR']
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        app.extensions['fragment_cache'] = FragmentCache(
+            config['FRAGMENT_CACHE_SIZE'], config['FRAGMENT_CACHE_TTL'], folder)
+
+
+def get_cache():
+    return current_app.extensions['fragment_cache']
+
+
+# ==================== Invalidation ====================
+
+@event.listens_for(Session, 'after_flush')
+def _collect_rows(session, flush_context):
+    rows = [_identity(obj) for obj in list(session.dirty) + list(session.deleted)]
+    rows = [row for row in rows if row is not None]
+    if rows:
+        session.info.setdefault('fragments_changed', set()).update(rows)
+
+
+@event.listens_for(Session, 'after_commit')
+def _evict_fragments(session):
+    rows = session.info.pop('fragments_changed', None)
+    if rows and has_app_context() and 'fragment_cache' in current_app.extensions:
+        get_cache().evict(rows)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rows(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop('fragments_changed', None)
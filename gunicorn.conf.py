@@ -0,0 +1,22 @@
+"""
+Production server settings for the Rental Management System
+
+    gunicorn -c gunicorn.conf.py 'app:create_app()'
+
+Workers are threaded: a request that resizes an upload (images.py), hashes
+a password (passwords.py) or waits on SQLite's busy timeout blocks its own
+thread only. ``/notifications/stream`` is served by the gevent workers of
+gunicorn_events.conf.py instead, where an open stream costs a greenlet
+rather than one of these threads; route that path there (see readme.md).
+Command line options win over these, e.g. ``-w 8`` or ``-b 127.0.0.1:8000``.
+"""
+
+import multiprocessing
+
+bind = '0.0.0.0:5000'
+workers = multiprocessing.cpu_count()
+worker_class = 'gthread'
+threads = 8
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,25 @@
+"""
+Server settings for the notification streams
+
+    gunicorn -c gunicorn_events.conf.py 'app:create_app()'
+
+Serves ``/notifications/stream`` only; the reverse proxy sends every other
+path to the threaded workers of gunicorn.conf.py. Workers are gevent
+workers: each open stream is a greenlet parked in ``Subscription.wait``
+(see events.py), so one worker holds thousands. Anything else that blocks
+in a gevent worker, such as a SQLite call waiting out its busy timeout,
+stalls every stream of that worker, which is why the pages stay off it.
+"""
+
+import multiprocessing
+
+bind = '127.0.0.1:5001'
+workers = multiprocessing.cpu_count()
+worker_class = 'gevent'
+# Open connections per worker, nearly all of them idle streams
+worker_connections = 10000
+# Streams stay open up to SSE_MAX_AGE seconds, but a gevent worker's
+# heartbeat to the arbiter does not wait for requests to finish
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,172 @@
+"""
+In-process identity cache for Flask-Login.
+
+Flask-Login loads the logged-in user on every authenticated request. The
+cache keeps each user's column values for IDENTITY_CACHE_TTL seconds, in an
+LRU of at most IDENTITY_CACHE_SIZE users, and puts the user back into the
+request's session with ``merge(load=False)``, which issues no SQL. The
+request then only hits ``users`` if a view touches a relationship.
+
+Invalidation:
+
+- an ORM update or delete of a user (``edit_user``, ``edit_profile``,
+  ``approve_user``, ``delete_user``, scripts) evicts that user from this
+  process's cache once the transaction commits;
+- the same flush bumps the ``identity`` row of ``cache_generations``, so
+  other worker processes drop their whole cache the next time they check
+  the generation, at most every IDENTITY_GENERATION_INTERVAL seconds. That
+  interval bounds how long another worker can serve a stale role or a
+  deleted account; set it to 0 to check on every request.
+
+Bulk Core updates of ``users`` bypass the hooks; they are only picked up
+when the entries expire.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from extensions import db
+from models import User, CacheGeneration
+
+GENERATION = 'identity'
+
+COLUMNS = tuple(column.key for column in User.__table__.columns)
+
+
+class IdentityCache:
+    """LRU of user column values with a per-entry TTL"""
+
+    def __init__(self, ttl, max_size, interval):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.interval = interval
+        self.generation = None
+        self.checked_at = None
+        # Bumped on every eviction, so a load that raced with one is not stored
+        self.epoch = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, values = entry
+            if expires <= now:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return values
+
+    def put(self, user_id, values, epoch):
+        with self._lock:
+            if epoch != self.epoch:
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, *user_ids):
+        with self._lock:
+            self.epoch += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.epoch += 1
+            self._entries.clear()
+
+    def check_generation(self):
+        """Drop everything if another process changed a user since the last check"""
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < self.interval:
+            return
+        generation = current_generation()
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+        self.checked_at = now
+
+
+def init_app(app):
+    config = app.config
+    app.extensions['identity_cache'] = IdentityCache(
+        config['IDENTITY_CACHE_TTL'], config['IDENTITY_CACHE_SIZE'],
+        config['IDENTITY_GENERATION_INTERVAL'])
+
+
+def get_cache():
+    return current_app.extensions['identity_cache']
+
+
+def current_generation():
+    return db.session.execute(
+        select(CacheGeneration.generation).where(CacheGeneration.name == GENERATION)
+    ).scalar() or 0
+
+
+def _snapshot(user):
+    return {key: getattr(user, key) for key in COLUMNS}
+
+
+def load_user(user_id):
+    """Flask-Login ``user_loader``: the user with ``user_id``, from the cache when possible"""
+    user_id = int(user_id)
+    cache = get_cache()
+    cache.check_generation()
+
+    values = cache.get(user_id)
+    if values is None:
+        epoch = cache.epoch
+        user = db.session.get(User, user_id)
+        if user is not None:
+            cache.put(user_id, _snapshot(user), epoch)
+        return user
+
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+# ==================== Invalidation ====================
+
+@event.listens_for(Session, 'before_flush')
+def _collect_users(session, flush_context, instances):
+    changed = [obj.id for obj in session.deleted if isinstance(obj, User)]
+    changed += [obj.id for obj in session.dirty
+                if isinstance(obj, User) and session.is_modified(obj, include_collections=False)]
+    if changed:
+        session.info.setdefault('identity_changed', set()).update(changed)
+        table = CacheGeneration.__table__
+        stmt = insert(table).values(name=GENERATION, generation=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={'generation': table.c.generation + 1},
+        )
+        session.connection().execute(stmt)
+
+
+@event.listens_for(Session, 'after_commit')
+def _evict_users(session):
+    changed = session.info.pop('identity_changed', None)
+    if changed and has_app_context() and 'identity_cache' in current_app.extensions:
+        get_cache().evict(*changed)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_users(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop('identity_changed', None)
@@ -0,0 +1,262 @@
+"""
+Property image uploads: content-addressed storage and resized variants.
+
+An upload arrives on disk already hashed and sniffed (see uploads.py), is
+checked to be a real image, and is kept once under its hash in
+IMAGE_ORIGINALS_FOLDER (outside ``static``, since originals still carry
+their EXIF data). The
+hash becomes ``Property.image_path``, so two properties uploading the same
+photo share one copy, and two different photos with the same filename no
+longer overwrite each other.
+
+Resized variants (see VARIANTS) are then rendered as WebP and JPEG into
+UPLOAD_FOLDER by a small thread pool, off the request thread. They are
+re-encoded from pixels only, so EXIF (GPS position, camera serial), XMP
+and embedded colour profiles are dropped; the EXIF orientation is applied
+first. Templates go through ``image_variants`` and show the placeholder
+until the variants exist. Older properties whose ``image_path`` is a plain
+filename keep rendering the file as it was uploaded.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+from werkzeug.datastructures import FileStorage
+
+from extensions import db
+from models import Property
+from uploads import IMAGE_TYPES, UploadStream
+
+# Width of each variant in pixels (the srcset ``w`` descriptors); images
+# are never upscaled, and very tall ones are capped at twice the width
+VARIANTS = {'thumb': 400, 'medium': 960, 'full': 1920}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+READ_CHUNK = 64 * 1024
+KEY = re.compile(r'[0-9a-f]{64}')
+
+_executor = None
+_pending = {}
+_ready = set()
+_lock = threading.Lock()
+
+
+class InvalidImage(ValueError):
+    """The upload is not an image in one of the ALLOWED_FORMATS"""
+
+
+def original_path(folder, key):
+    return os.path.join(folder, key[:2], key)
+
+
+def variant_path(folder, key, variant, ext):
+    return os.path.join(folder, key[:2], f'{key}-{variant}.{ext}')
+
+
+def _check(path):
+    try:
+        with Image.open(path) as image:
+            if image.format not in ALLOWED_FORMATS:
+                raise InvalidImage(f'unsupported image format {image.format}')
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as exc:
+        raise InvalidImage(str(exc)) from exc
+
+
+def _flatten(image):
+    """JPEG has no alpha channel: composite transparent images onto white"""
+    if image.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _save(image, path, image_format, options):
+    # Write next to the target and rename, so a half-written file is never served
+    temporary = f'{path}.{threading.get_ident()}.tmp'
+    image.info = {}
+    image.save(temporary, image_format, **options)
+    os.replace(temporary, path)
+
+
+def render_variants(original, folder, key):
+    """Write every variant of ``original``; the JPEG thumbnail, checked by ``variants_ready``, goes last"""
+    os.makedirs(os.path.join(folder, key[:2]), exist_ok=True)
+    with Image.open(original) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    for variant, size in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+        resized = image.copy()
+        resized.thumbnail((size, size * 2), Image.Resampling.LANCZOS)
+        for ext, (image_format, options) in FORMATS.items():
+            frame = resized if image_format == 'WEBP' else _flatten(resized)
+            _save(frame, variant_path(folder, key, variant, ext), image_format, options)
+
+
+def variants_ready(folder, key):
+    if (folder, key) in _ready:
+        return True
+    if os.path.exists(variant_path(folder, key, 'thumb', 'jpg')):
+        _ready.add((folder, key))
+        return True
+    return False
+
+
+def _pool(workers):
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='images')
+        return _executor
+
+
+def _finished(key, logger):
+    def callback(future):
+        with _lock:
+            _pending.pop(key, None)
+        if future.exception() is not None:
+            logger.error('Rendering image %s failed: %s', key, future.exception())
+    return callback
+
+
+def queue_variants(key):
+    """Render the variants for ``key`` on the worker pool unless they exist or are queued"""
+    config = current_app.config
+    folder = config['UPLOAD_FOLDER']
+    if variants_ready(folder, key):
+        return None
+    with _lock:
+        if key in _pending:
+            return _pending[key]
+    original = original_path(config['IMAGE_ORIGINALS_FOLDER'], key)
+    if not config['IMAGE_WORKERS']:
+        render_variants(original, folder, key)
+        return None
+    future = _pool(config['IMAGE_WORKERS']).submit(render_variants, original, folder, key)
+    with _lock:
+        _pending[key] = future
+    future.add_done_callback(_finished(key, current_app.logger))
+    return future
+
+
+def _store_stream(stream, folder):
+    """Copy a plain file stream into the originals folder, hashing it on the way; returns the key"""
+    digest = hashlib.sha256()
+    handle, temporary = tempfile.mkstemp(dir=folder, suffix='.upload')
+    try:
+        with os.fdopen(handle, 'wb') as out:
+            for chunk in iter(lambda: stream.read(READ_CHUNK), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        _check(temporary)
+        key = digest.hexdigest()
+        target = original_path(folder, key)
+        if os.path.exists(target):
+            os.unlink(temporary)  # the same image was uploaded before
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(temporary, target)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+    return key
+
+
+def save_upload(file):
+    """
+    Store an uploaded image and queue its variants.
+
+    ``file`` is a werkzeug FileStorage. Returns the content hash to keep in
+    ``Property.image_path``; raises InvalidImage for anything that is not a
+    supported image.
+    """
+    folder = current_app.config['IMAGE_ORIGINALS_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    stream = file.stream
+    if isinstance(stream, UploadStream):
+        # Already on disk, hashed and sniffed while the request body was read
+        if stream.mimetype not in IMAGE_TYPES:
+            raise InvalidImage(f'unsupported upload type {stream.mimetype}')
+        _check(stream.path)
+        key = stream.digest
+        target = original_path(folder, key)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            stream.keep(target)
+    else:
+        key = _store_stream(stream, folder)
+    queue_variants(key)
+    return key
+
+
+def process_existing():
+    """
+    Bring every property image into the pipeline and render what is missing.
+
+    Legacy uploads (plain filenames in UPLOAD_FOLDER) are stored by content
+    hash and the property is pointed at the hash; the old file is left in
+    place. Returns (converted, rendered) and waits for the rendering.
+    """
+    folder = current_app.config['UPLOAD_FOLDER']
+    converted = rendered = 0
+    for prop in Property.query.filter(Property.image_path.isnot(None), Property.image_path != ''):
+        if not KEY.fullmatch(prop.image_path):
+            path = os.path.join(folder, prop.image_path)
+            if not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as stream:
+                try:
+                    prop.image_path = save_upload(FileStorage(stream))
+                except InvalidImage:
+                    continue
+            converted += 1
+        elif not variants_ready(folder, prop.image_path):
+            queue_variants(prop.image_path)
+            rendered += 1
+    db.session.commit()
+    wait()
+    return converted, rendered
+
+
+def wait(timeout=None):
+    """Block until every queued variant has been rendered (scripts and tests)"""
+    with _lock:
+        futures = list(_pending.values())
+    wait_futures(futures, timeout=timeout)
+
+
+class ImageVariants:
+    """What a template needs to render one stored image"""
+
+    def __init__(self, key, legacy=False, ready=False):
+        self.key = key
+        self.legacy = legacy
+        self.ready = ready
+
+    def url(self, variant, ext='jpg'):
+        if self.legacy:
+            return url_for('static', filename='uploads/' + self.key)
+        return url_for('static', filename=f'uploads/{self.key[:2]}/{self.key}-{variant}.{ext}')
+
+    def srcset(self, ext, variants=tuple(VARIANTS)):
+        return ', '.join(f'{self.url(variant, ext)} {VARIANTS[variant]}w' for variant in variants)
+
+
+def image_variants(image_path):
+    """Template helper: an ImageVariants for ``image_path``, or None if there is no image"""
+    if not image_path:
+        return None
+    if not KEY.fullmatch(image_path):
+        return ImageVariants(image_path, legacy=True)
+    return ImageVariants(image_path, ready=variants_ready(current_app.config['UPLOAD_FOLDER'], image_path))
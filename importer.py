@@ -0,0 +1,429 @@
+"""
+Bulk CSV import for onboarding a portfolio: users, properties, leases and
+historical payments.
+
+Files are read one row at a time and each row is validated on its own; a
+bad row is reported with its file and line number and skipped, the rest
+go in. Rows refer to each other by key, not by database id:
+
+- properties name their ``owner`` and leases their ``tenant`` by username,
+  resolved against the users already in the database and those imported;
+- leases name their ``property`` and payments their ``lease`` by the
+  ``ref`` column of the properties and leases files, a key from the system
+  the portfolio comes from. Refs only live as long as one import, so a
+  lease and its payments are imported together.
+
+The keys resolve through dicts held for the length of the import, a few
+bytes per user, property and lease, never per payment, so memory stays
+flat however many payments there are. Valid rows are inserted
+``BATCH_SIZE`` at a time with a single executemany, one transaction per
+batch, so other writers get the database between batches. When a batch
+hits a constraint (a username or email that already exists, a second
+payment for the same lease and month) it is retried row by row, each in a
+savepoint, to find and report the offending rows.
+
+Inserts skip the ORM, so the dashboard counters and property facets are
+rebuilt from the tables once the import is done; the search index follows
+through its triggers.
+
+Users imported without a ``password`` or ``password_hash`` cannot log in
+until an admin sets a password. Hashing runs at login cost, about a tenth
+of a second per user, so prefer ``password_hash`` (a Werkzeug hash from
+the old system) for large files.
+"""
+
+import csv
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+import counters
+import facets
+import passwords
+from extensions import db
+from models import User, Property, Lease, Payment
+
+# Import order: every kind only refers to kinds before it
+KINDS = ('users', 'properties', 'leases', 'payments')
+BATCH_SIZE = 5000
+MAX_ERRORS = 1000  # kept for the report; the rest are only counted
+
+# Matches no password: Werkzeug rejects a hash without method and salt
+UNUSABLE_PASSWORD = '!'
+
+USER_ROLES = ('tenant', 'owner', 'staff')
+PROPERTY_STATUSES = ('available', 'occupied', 'maintenance')
+LEASE_STATUSES = ('active', 'expired', 'terminated')
+PAYMENT_STATUSES = ('completed', 'pending', 'cancelled')
+PAYMENT_METHODS = ('cash', 'bank_transfer', 'online', 'check')
+
+# kind: (required columns, optional columns)
+COLUMNS = {
+    'users': (('username', 'email', 'full_name', 'role'),
+              ('phone', 'address', 'is_active', 'password', 'password_hash')),
+    'properties': (('owner', 'property_type', 'title', 'address', 'rent_amount'),
+                   ('ref', 'city', 'state', 'zip_code', 'bedrooms', 'bathrooms', 'area_sqft',
+                    'security_deposit', 'description', 'amenities', 'availability_status')),
+    'leases': (('property', 'tenant', 'start_date', 'end_date', 'monthly_rent'),
+               ('ref', 'security_deposit', 'terms_conditions', 'status', 'payment_due_day')),
+    'payments': (('lease', 'amount', 'payment_date'),
+                 ('payment_month', 'due_date', 'payment_method', 'transaction_id', 'status',
+                  'late_fee', 'notes')),
+}
+
+
+class RowError(ValueError):
+    """A row that cannot be imported, with the reason shown in the report"""
+
+
+@dataclass
+class ImportResult:
+    imported: dict = field(default_factory=lambda: dict.fromkeys(KINDS, 0))
+    rejected: dict = field(default_factory=lambda: dict.fromkeys(KINDS, 0))
+    errors: list = field(default_factory=list)  # [(kind, line, message)], the first MAX_ERRORS
+    on_error: object = None
+
+    def reject(self, kind, line, message):
+        self.rejected[kind] += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((kind, line, message))
+        if self.on_error is not None:
+            self.on_error(kind, line, message)
+
+    @property
+    def error_count(self):
+        return sum(self.rejected.values())
+
+
+# ==================== Cell parsing ====================
+
+def _value(row, key):
+    return (row.get(key) or '').strip()
+
+
+def _required(row, key):
+    value = _value(row, key)
+    if not value:
+        raise RowError(f'{key} is required')
+    return value
+
+
+def _optional(row, key):
+    return _value(row, key) or None
+
+
+def _number(row, key, kind=float, required=False, minimum=None, maximum=None):
+    value = _required(row, key) if required else _value(row, key)
+    if not value:
+        return None
+    try:
+        number = kind(value)
+    except ValueError:
+        raise RowError(f'{key} must be a number, got {value!r}') from None
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        raise RowError(f'{key} must be between {minimum} and {maximum}, got {value!r}'
+                       if maximum is not None else f'{key} must be at least {minimum}, got {value!r}')
+    return number
+
+
+def _date(row, key, required=False):
+    value = _required(row, key) if required else _value(row, key)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise RowError(f'{key} must be a date as YYYY-MM-DD, got {value!r}') from None
+
+
+def _choice(row, key, choices, default):
+    value = _value(row, key).lower() or default
+    if value not in choices:
+        raise RowError(f'{key} must be one of {", ".join(choices)}, got {value!r}')
+    return value
+
+
+def _flag(row, key, default=True):
+    value = _value(row, key).lower()
+    if not value:
+        return default
+    if value in ('1', 'true', 'yes', 'y'):
+        return True
+    if value in ('0', 'false', 'no', 'n'):
+        return False
+    raise RowError(f'{key} must be true or false, got {value!r}')
+
+
+def _month(value):
+    try:
+        datetime.strptime(value, '%Y-%m')
+    except ValueError:
+        raise RowError(f'payment_month must be YYYY-MM, got {value!r}') from None
+    return value
+
+
+# ==================== Rows ====================
+
+class _Lookups:
+    """Natural key -> id maps for the rows rows can refer to"""
+
+    def __init__(self):
+        # username: (id, role), for everyone already in the database too.
+        # An id of None, here and below, is a row claimed but not yet inserted
+        self.users = {username: (user_id, role) for user_id, username, role in
+                      db.session.execute(select(User.id, User.username, User.role))}
+        self.emails = set()
+        self.properties = {}  # ref: id
+        self.leases = {}      # ref: (id, tenant id)
+
+    def user(self, row, key, role):
+        username = _required(row, key)
+        found = self.users.get(username)
+        if found is None or found[0] is None:
+            raise RowError(f'{key} {username!r} is not a user')
+        if found[1] != role:
+            raise RowError(f'{key} {username!r} has the role {found[1]}, not {role}')
+        return found[0]
+
+    def ref(self, row, table, key, kind):
+        ref = _required(row, key)
+        found = table.get(ref)
+        if found is None:
+            raise RowError(f'{key} {ref!r} is not in the {kind} file, or was rejected')
+        return found
+
+    @staticmethod
+    def new_ref(row, table, kind):
+        ref = _optional(row, 'ref')
+        if ref is not None and ref in table:
+            raise RowError(f'ref {ref!r} appears twice in the {kind} file')
+        return ref
+
+
+def _user(row, lookups, now):
+    username, email = _required(row, 'username'), _required(row, 'email').lower()
+    if username in lookups.users:
+        raise RowError(f'username {username!r} is already taken')
+    if email in lookups.emails:
+        raise RowError(f'email {email!r} appears twice in the users file')
+    if _value(row, 'password_hash'):
+        password_hash = _value(row, 'password_hash')
+    elif _value(row, 'password'):
+        password_hash = passwords.hash_password(_value(row, 'password'))
+    else:
+        password_hash = UNUSABLE_PASSWORD
+    values = dict(username=username, email=email, full_name=_required(row, 'full_name'),
+                  role=_choice(row, 'role', USER_ROLES, None), phone=_optional(row, 'phone'),
+                  address=_optional(row, 'address'), is_active=_flag(row, 'is_active'),
+                  password_hash=password_hash, created_at=now, updated_at=now)
+    return values, username
+
+
+def _property(row, lookups, now):
+    ref = lookups.new_ref(row, lookups.properties, 'properties')
+    values = dict(owner_id=lookups.user(row, 'owner', 'owner'),
+                  property_type=_required(row, 'property_type'), title=_required(row, 'title'),
+                  address=_required(row, 'address'), city=_optional(row, 'city'),
+                  state=_optional(row, 'state'), zip_code=_optional(row, 'zip_code'),
+                  bedrooms=_number(row, 'bedrooms', int, minimum=0),
+                  bathrooms=_number(row, 'bathrooms', int, minimum=0),
+                  area_sqft=_number(row, 'area_sqft', minimum=0),
+                  rent_amount=_number(row, 'rent_amount', required=True, minimum=0),
+                  security_deposit=_number(row, 'security_deposit', minimum=0),
+                  description=_optional(row, 'description'), amenities=_optional(row, 'amenities'),
+                  availability_status=_choice(row, 'availability_status', PROPERTY_STATUSES, 'available'),
+                  image_path=None, created_at=now, updated_at=now)
+    return values, ref
+
+
+def _lease(row, lookups, now):
+    ref = lookups.new_ref(row, lookups.leases, 'leases')
+    start, end = _date(row, 'start_date', required=True), _date(row, 'end_date', required=True)
+    if end < start:
+        raise RowError('end_date is before start_date')
+    values = dict(property_id=lookups.ref(row, lookups.properties, 'property', 'properties'),
+                  tenant_id=lookups.user(row, 'tenant', 'tenant'), start_date=start, end_date=end,
+                  monthly_rent=_number(row, 'monthly_rent', required=True, minimum=0),
+                  security_deposit=_number(row, 'security_deposit', minimum=0),
+                  terms_conditions=_optional(row, 'terms_conditions'),
+                  status=_choice(row, 'status', LEASE_STATUSES, 'active'),
+                  payment_due_day=_number(row, 'payment_due_day', int, minimum=1, maximum=31) or 1,
+                  created_at=now, updated_at=now)
+    return values, ref
+
+
+def _payment(row, lookups, now):
+    lease_id, tenant_id = lookups.ref(row, lookups.leases, 'lease', 'leases')
+    paid = _date(row, 'payment_date', required=True)
+    month = _value(row, 'payment_month')
+    method = _value(row, 'payment_method').lower() or None
+    if method is not None and method not in PAYMENT_METHODS:
+        raise RowError(f'payment_method must be one of {", ".join(PAYMENT_METHODS)}, got {method!r}')
+    values = dict(lease_id=lease_id, tenant_id=tenant_id,
+                  amount=_number(row, 'amount', required=True, minimum=0), payment_date=paid,
+                  payment_month=_month(month) if month else paid.strftime('%Y-%m'),
+                  due_date=_date(row, 'due_date'), payment_method=method,
+                  transaction_id=_optional(row, 'transaction_id'),
+                  status=_choice(row, 'status', PAYMENT_STATUSES, 'completed'),
+                  late_fee=_number(row, 'late_fee', minimum=0) or 0.0, notes=_optional(row, 'notes'),
+                  created_at=now)
+    return values, None
+
+
+# kind: (table, row builder, lookup the new ids go into)
+_KINDS = {
+    'users': (User.__table__, _user, 'users'),
+    'properties': (Property.__table__, _property, 'properties'),
+    'leases': (Lease.__table__, _lease, 'leases'),
+    'payments': (Payment.__table__, _payment, None),
+}
+
+
+# ==================== Import ====================
+
+def _constraint_message(exc):
+    message = str(exc.orig)
+    if 'users.username' in message:
+        return 'username is already taken'
+    if 'users.email' in message:
+        return 'email is already taken'
+    if 'payments.lease_id, payments.payment_month' in message:
+        return 'the lease already has a payment for this month'
+    return f'rejected by the database: {message}'
+
+
+class _Batch:
+    def __init__(self, kind, result, lookups, dry_run):
+        self.kind = kind
+        self.table, _, self.lookup = _KINDS[kind]
+        self.result, self.lookups, self.dry_run = result, lookups, dry_run
+        self.rows, self.lines, self.keys = [], [], []
+
+    def add(self, values, line, key):
+        self.rows.append(values)
+        self.lines.append(line)
+        self.keys.append(key)
+        # Keys are claimed before the insert, so a repeat further down the
+        # file is caught; the ids are filled in by flush
+        if self.kind == 'users':
+            self.lookups.users[key] = (None, values['role'])
+            self.lookups.emails.add(values['email'])
+        elif key is not None:
+            getattr(self.lookups, self.lookup)[key] = None
+
+    def flush(self):
+        if not self.rows:
+            return
+        ids = [0] * len(self.rows) if self.dry_run else self._insert()
+        for values, key, row_id in zip(self.rows, self.keys, ids):
+            if row_id is None:
+                # Refused by the database: rows that refer to it are rejected too
+                if self.kind == 'users':
+                    del self.lookups.users[key]
+                    self.lookups.emails.discard(values['email'])
+                continue
+            self.result.imported[self.kind] += 1
+            if self.kind == 'users':
+                self.lookups.users[key] = (row_id, values['role'])
+            elif self.kind == 'leases' and key is not None:
+                self.lookups.leases[key] = (row_id, values['tenant_id'])
+            elif key is not None:
+                self.lookups.properties[key] = row_id
+        self.rows, self.lines, self.keys = [], [], []
+
+    def _statement(self):
+        statement = insert(self.table)
+        if self.lookup is not None:
+            statement = statement.returning(self.table.c.id, sort_by_parameter_order=True)
+        return statement
+
+    def _insert(self):
+        """Ids of the inserted rows, None for each row the database refused"""
+        statement = self._statement()
+        try:
+            result = db.session.execute(statement, self.rows)
+            ids = result.scalars().all() if self.lookup is not None else [0] * len(self.rows)
+            db.session.commit()
+            return ids
+        except IntegrityError:
+            db.session.rollback()
+        ids = []
+        for values, line in zip(self.rows, self.lines):
+            try:
+                with db.session.begin_nested():
+                    result = db.session.execute(statement, [values])
+                    ids.append(result.scalars().one() if self.lookup is not None else 0)
+            except IntegrityError as exc:
+                ids.append(None)
+                self.result.reject(self.kind, line, _constraint_message(exc))
+        db.session.commit()
+        return ids
+
+
+def _check_header(kind, fieldnames):
+    required, optional = COLUMNS[kind]
+    fieldnames = [name.strip() for name in fieldnames or ()]
+    missing = [name for name in required if name not in fieldnames]
+    unknown = [name for name in fieldnames if name not in required and name not in optional]
+    if missing:
+        raise RowError(f'missing column{"s" if len(missing) > 1 else ""}: {", ".join(missing)}')
+    if unknown:
+        raise RowError(f'unknown column{"s" if len(unknown) > 1 else ""}: {", ".join(unknown)}')
+    return fieldnames
+
+
+def _import_file(kind, source, lookups, result, batch_size, dry_run, now):
+    reader = csv.reader(source)
+    try:
+        header = _check_header(kind, next(reader, None))
+    except RowError as exc:
+        result.reject(kind, 1, str(exc))
+        return
+    build = _KINDS[kind][1]
+    batch = _Batch(kind, result, lookups, dry_run)
+    try:
+        for cells in reader:
+            if not any(cell.strip() for cell in cells):
+                continue  # blank line, e.g. at the end of a hand-edited file
+            line = reader.line_num
+            try:
+                if len(cells) != len(header):
+                    raise RowError(f'expected {len(header)} cells, got {len(cells)}')
+                values, key = build(dict(zip(header, cells)), lookups, now)
+            except RowError as exc:
+                result.reject(kind, line, str(exc))
+                continue
+            batch.add(values, line, key)
+            if len(batch.rows) >= batch_size:
+                batch.flush()
+    except (csv.Error, UnicodeDecodeError) as exc:
+        # The rest of the file can't be read; keep what was read so far
+        result.reject(kind, reader.line_num + 1, f'unreadable from here on ({exc}); '
+                      'save the file as UTF-8 CSV')
+    batch.flush()
+
+
+def import_portfolio(sources, batch_size=BATCH_SIZE, dry_run=False, on_error=None):
+    """
+    Import the CSV ``sources``, {kind: file object or iterable of lines}, in KINDS order.
+
+    With ``dry_run`` every row is validated and nothing is written;
+    constraints only the database checks (e.g. an email already in use)
+    are not. ``on_error(kind, line, message)`` is called for every
+    rejected row. Returns an ImportResult.
+    """
+    unknown = set(sources) - set(KINDS)
+    if unknown:
+        raise ValueError(f'Unknown import file kind(s): {", ".join(sorted(unknown))}')
+    result = ImportResult(on_error=on_error)
+    lookups = _Lookups()
+    now = datetime.utcnow()
+    for kind in KINDS:
+        if kind in sources:
+            _import_file(kind, sources[kind], lookups, result, batch_size, dry_run, now)
+    if not dry_run and any(result.imported.values()):
+        counters.reconcile(fix=True)
+        facets.reconcile(fix=True)
+    return result
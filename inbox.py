@@ -0,0 +1,150 @@
+"""
+Notification inbox: unread-first pages, bulk mark-read and retention.
+
+The inbox lists a user's unread notifications, newest first, followed by
+the ones already read. Each half is one range scan of
+ix_notifications_user_read (user_id, is_read, and the rowid the index
+carries implicitly), so a page costs at most two index seeks however long
+the history is. Cursors are (0 or 1 for unread/read, id) pairs, in the
+same encoding as ``pagination.keyset_paginate``.
+
+Marking read is a single UPDATE for one notification, all of them, or all
+of one type.
+
+``archive_read`` keeps ``notifications`` small: read notifications older
+than the retention period are copied into ``notification_archive``, which
+drops the columns only the inbox and the reminder scan need, and deleted
+from the hot table, a batch per short transaction. The retention period
+must be longer than the widest reminder horizon: until then a reminder's
+``dedupe_key`` is what stops ``send_reminders`` from sending it again.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from flask import request
+from sqlalchemy import insert, select, update
+
+from extensions import db
+from models import Notification, NotificationArchive
+from pagination import KeysetPage, apply_filters, decode_cursor, encode_cursor, per_page_arg
+from reminders import HORIZONS
+
+# The two halves of the inbox, in display order
+SEGMENTS = (False, True)
+ARCHIVE_BATCH = 1000
+
+NOTIFICATION_TYPES = (
+    ('general', 'General'),
+    ('lease_renewal', 'Lease'),
+    ('rent_due', 'Rent due'),
+    ('maintenance', 'Maintenance'),
+)
+
+FILTERS = {'notification_type': Notification.notification_type, 'is_read': Notification.is_read}
+
+
+def _segment(row):
+    return 1 if row.is_read else 0
+
+
+def _read_cursor(cursor):
+    decoded = decode_cursor(cursor or '')
+    if decoded is None or decoded[0] not in (0, 1):
+        return None
+    return decoded
+
+
+def _seek(query, cursor, limit, forward):
+    """Up to ``limit`` rows after (or, walking back, before) ``cursor`` in inbox order"""
+    rows = []
+    if forward:
+        start = cursor[0] if cursor else 0
+        segments = range(start, len(SEGMENTS))
+    else:
+        segments = range(cursor[0], -1, -1)
+    for segment in segments:
+        segment_query = query.filter(Notification.is_read.is_(SEGMENTS[segment]))
+        if cursor is not None and segment == cursor[0]:
+            bound = Notification.id < cursor[1] if forward else Notification.id > cursor[1]
+            segment_query = segment_query.filter(bound)
+        order = Notification.id.desc() if forward else Notification.id.asc()
+        rows += segment_query.order_by(order).limit(limit - len(rows)).all()
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def inbox_page(user_id, args=None):
+    """One KeysetPage of ``user_id``'s inbox, for the request's cursor, filters and per_page"""
+    args = request.args if args is None else args
+    per_page = per_page_arg(args)
+    query, active_filters = apply_filters(Notification.query.filter_by(user_id=user_id), FILTERS, args)
+
+    cursor, forward = None, True
+    if args.get('after'):
+        cursor = _read_cursor(args['after'])
+    elif args.get('before'):
+        cursor = _read_cursor(args['before'])
+        forward = cursor is None
+
+    rows = _seek(query, cursor, per_page + 1, forward)
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        has_next, has_prev = (more, cursor is not None) if forward else (True, more)
+        if has_next:
+            next_cursor = encode_cursor(_segment(rows[-1]), rows[-1].id)
+        if has_prev:
+            prev_cursor = encode_cursor(_segment(rows[0]), rows[0].id)
+
+    return KeysetPage(rows, 'inbox', 'desc', per_page, active_filters,
+                      next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def mark_read(user_id, notification_type=None, notification_id=None):
+    """Mark ``user_id``'s unread notifications read in one UPDATE; returns how many changed"""
+    stmt = update(Notification).where(Notification.user_id == user_id, Notification.is_read.is_(False))
+    if notification_type:
+        stmt = stmt.where(Notification.notification_type == notification_type)
+    if notification_id is not None:
+        stmt = stmt.where(Notification.id == notification_id)
+    count = db.session.execute(stmt.values(is_read=True)).rowcount
+    db.session.commit()
+    return count
+
+
+def archive_read(days, batch_size=ARCHIVE_BATCH, pause=0.0, now=None):
+    """
+    Move read notifications created more than ``days`` days ago to the archive.
+
+    Works through them oldest first, ``batch_size`` per transaction,
+    sleeping ``pause`` seconds between batches so other writers get the
+    database lock in between. Returns the number of notifications moved.
+    """
+    if days <= max(HORIZONS):
+        raise ValueError(f'notifications must be kept longer than {max(HORIZONS)} days '
+                         'so that reminders are not sent twice')
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    columns = [column.key for column in NotificationArchive.__table__.columns]
+    moved = 0
+    while True:
+        ids = db.session.execute(
+            select(Notification.id)
+            .where(Notification.is_read.is_(True), Notification.created_at < cutoff)
+            .order_by(Notification.created_at)
+            .limit(batch_size)).scalars().all()
+        if not ids:
+            db.session.commit()
+            return moved
+        source = select(*[getattr(Notification, key) for key in columns]).where(Notification.id.in_(ids))
+        db.session.execute(insert(NotificationArchive).from_select(columns, source))
+        db.session.execute(Notification.__table__.delete().where(Notification.id.in_(ids)))
+        db.session.commit()
+        moved += len(ids)
+        if pause:
+            time.sleep(pause)
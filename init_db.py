@@ -4,15 +4,15 @@ Initialization script for Rental Management System
 Creates database tables and default admin user
 """
 
-from app import app, db
-from models import User, Property, Lease, Payment, MaintenanceRequest, Notification
-from datetime import datetime
+from app import create_app
+from extensions import db
+from models import User
 
 def init_database():
     """Initialize the database with tables and default data"""
+    print("Creating database tables...")
+    app = create_app()  # creates the tables of a new database (see database.ensure_schema)
     with app.app_context():
-        print("Creating database tables...")
-        db.create_all()
         print("✓ Database tables created successfully!")
         
         # Check if admin user already exists
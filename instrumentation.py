@@ -0,0 +1,198 @@
+"""
+Per-request SQL and template instrumentation, off unless SQL_INSTRUMENTATION
+is set.
+
+For every request it records the number of SQL statements and the time
+spent in them, the time spent rendering templates (not counting the SQL
+that lazy relationship loads run from inside the template) and the number
+of lazy loads. The figures go out with the response as a ``Server-Timing``
+header, which browser dev tools show next to the request, and are summed
+per endpoint (``endpoint_stats``). A streamed body (report exports) runs
+its queries after the headers are sent, so they are not in the figures.
+
+Statements slower than SQL_SLOW_QUERY_MS are logged as one JSON object per
+line to the ``rental.sql.slow`` logger (and to SQL_SLOW_QUERY_LOG, a file,
+when set), with the endpoint and path of the request and, for a lazy load,
+the relationship that ran it, e.g. ``Lease.property``.
+
+A relationship lazy-loaded SQL_NPLUSONE_THRESHOLD times in one request is
+an N+1: one query per row of a list instead of one for the whole list. It
+is logged as a warning, or raised as ``NPlusOneError`` at the offending
+load when SQL_NPLUSONE_RAISE is set, as the test suite does. The fix is
+usually an eager-loading option in queries.py.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import current_app, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+slow_query_log = logging.getLogger('rental.sql.slow')
+logger = logging.getLogger(__name__)
+
+FIELDS = ('requests', 'queries', 'sql_ms', 'render_ms', 'lazy_loads')
+
+
+class NPlusOneError(AssertionError):
+    """A relationship was lazy-loaded once per row of a list"""
+
+
+class RequestStats:
+    """What one request spent on SQL and templates"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.render_sql_time = 0.0
+        self.rendering = []  # start times of the templates being rendered
+        self.lazy_loads = Counter()  # relationship: loads
+        self.cause = None  # the relationship being lazy-loaded right now
+
+    def server_timing(self):
+        total = (time.perf_counter() - self.started) * 1000
+        queries = f'{self.queries} query' if self.queries == 1 else f'{self.queries} queries'
+        return ', '.join((
+            f'sql;dur={self.sql_time * 1000:.1f};desc="{queries}"',
+            f'render;dur={(self.render_time - self.render_sql_time) * 1000:.1f}',
+            f'lazy;desc="{sum(self.lazy_loads.values())} lazy loads"',
+            f'total;dur={total:.1f}',
+        ))
+
+
+class Instrumentation:
+    """Settings and per-endpoint totals of one app"""
+
+    def __init__(self, slow_ms, threshold, raise_n_plus_one):
+        self.slow_ms = slow_ms
+        self.threshold = threshold
+        self.raise_n_plus_one = raise_n_plus_one
+        self._totals = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, stats):
+        with self._lock:
+            totals = self._totals[endpoint]
+            totals['requests'] += 1
+            totals['queries'] += stats.queries
+            totals['sql_ms'] += stats.sql_time * 1000
+            totals['render_ms'] += (stats.render_time - stats.render_sql_time) * 1000
+            totals['lazy_loads'] += sum(stats.lazy_loads.values())
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: {field: totals[field] for field in FIELDS}
+                    for endpoint, totals in self._totals.items()}
+
+
+def init_app(app):
+    config = app.config
+    if not config['SQL_INSTRUMENTATION']:
+        return
+    app.extensions['instrumentation'] = Instrumentation(
+        config['SQL_SLOW_QUERY_MS'], config['SQL_NPLUSONE_THRESHOLD'], config['SQL_NPLUSONE_RAISE'])
+    if config['SQL_SLOW_QUERY_LOG'] and not slow_query_log.handlers:
+        slow_query_log.addHandler(logging.FileHandler(config['SQL_SLOW_QUERY_LOG']))
+        slow_query_log.setLevel(logging.INFO)
+    with app.app_context():
+        engines = list(app.extensions['sqlalchemy'].engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start)
+    app.after_request(_finish)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+
+
+def endpoint_stats(app=None):
+    """{endpoint: {requests, queries, sql_ms, render_ms, lazy_loads}} since the app started"""
+    instrumentation = (app or current_app).extensions.get('instrumentation')
+    return instrumentation.snapshot() if instrumentation is not None else {}
+
+
+def _stats():
+    return g.get('sql_stats') if has_request_context() else None
+
+
+def _start():
+    g.sql_stats = RequestStats()
+
+
+def _finish(response):
+    stats = g.pop('sql_stats', None)
+    if stats is not None:
+        current_app.extensions['instrumentation'].add(request.endpoint, stats)
+        response.headers['Server-Timing'] = stats.server_timing()
+    return response
+
+
+def _render_started(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None:
+        stats.rendering.append(time.perf_counter())
+
+
+def _render_finished(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None and stats.rendering:
+        started = stats.rendering.pop()
+        if not stats.rendering:  # nested renders are part of the outer one
+            stats.render_time += time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.instrumentation_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.instrumentation_started
+    stats = _stats()
+    if stats is not None:
+        stats.queries += 1
+        stats.sql_time += elapsed
+        if stats.rendering:
+            stats.render_sql_time += elapsed
+    instrumentation = current_app.extensions.get('instrumentation') if has_request_context() else None
+    if instrumentation is None or instrumentation.slow_ms is None or elapsed * 1000 < instrumentation.slow_ms:
+        return
+    slow_query_log.warning(json.dumps({
+        'duration_ms': round(elapsed * 1000, 1),
+        'endpoint': request.endpoint,
+        'method': request.method,
+        'path': request.path,
+        'relationship': stats.cause if stats is not None else None,
+        'statement': ' '.join(statement.split()),
+    }))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _lazy_load(orm_execute_state):
+    # Eager loads (selectinload, joinedload) have no lazy_loaded_from
+    if not orm_execute_state.is_relationship_load or orm_execute_state.lazy_loaded_from is None:
+        return None
+    stats = _stats()
+    if stats is None:
+        return None
+    relationship = str(orm_execute_state.loader_strategy_path[-1])
+    stats.lazy_loads[relationship] += 1
+    loads = stats.lazy_loads[relationship]
+    instrumentation = current_app.extensions['instrumentation']
+    if loads == instrumentation.threshold:
+        message = (f'N+1 in {request.endpoint}: {relationship} was lazy-loaded {loads} times; '
+                   'load it with the list instead (see queries.py)')
+        if instrumentation.raise_n_plus_one:
+            raise NPlusOneError(message)
+        logger.warning(message)
+    # Run the load here, so the slow-query log can name the relationship
+    stats.cause = relationship
+    try:
+        return orm_execute_state.invoke_statement()
+    finally:
+        stats.cause = None
@@ -0,0 +1,97 @@
+"""
+Monthly rent invoice generation.
+
+An invoice is the pending ``Payment`` row for a lease and ``payment_month``.
+``generate_invoices`` creates one for every active lease that covers the
+month, due on the lease's ``payment_due_day`` for ``monthly_rent``. Rows are
+built with ``INSERT ... SELECT`` over lease id ranges, so they never pass
+through Python, and ``ON CONFLICT DO NOTHING`` against the unique
+(lease_id, payment_month) index makes a re-run only fill in leases that are
+still missing an invoice. ``add_payment`` later settles the invoice row
+instead of adding a second payment for the month, and gives it the
+``payment_date`` it leaves NULL until then.
+"""
+
+import calendar
+import re
+from datetime import date, datetime
+
+from sqlalchemy import DateTime, String, cast, func, literal, select
+from sqlalchemy.dialects.sqlite import insert
+
+from extensions import db
+from models import Lease, Payment
+
+CHUNK_SIZE = 5000
+
+MONTH_FORMAT = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+
+def parse_month(payment_month):
+    """(first day, last day) of a 'YYYY-MM' month; ValueError if malformed"""
+    if not MONTH_FORMAT.match(payment_month or ''):
+        raise ValueError(f'Invalid payment month {payment_month!r}, expected YYYY-MM')
+    year, month = map(int, payment_month.split('-'))
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _active_leases(first, last):
+    return (
+        Lease.status == 'active',
+        Lease.start_date <= last,
+        Lease.end_date >= first,
+    )
+
+
+def _invoice_select(payment_month, first, last, now):
+    # Due day clamped to 1..last day of the month, as SQLite date arithmetic
+    due_day = func.min(func.max(func.coalesce(Lease.payment_due_day, 1), 1), last.day)
+    due = func.date(literal(first.isoformat()), '+' + cast(due_day - 1, String) + ' days')
+    return select(
+        Lease.id,
+        Lease.tenant_id,
+        Lease.monthly_rent,
+        due,
+        literal(payment_month),
+        literal('pending'),
+        literal(0.0),
+        literal(now, DateTime),
+    ).where(*_active_leases(first, last))
+
+
+def generate_invoices(payment_month, chunk_size=CHUNK_SIZE, dry_run=False):
+    """
+    Create the pending invoice for ``payment_month`` on every active lease.
+
+    Returns {'leases': active leases covering the month, 'created': new
+    invoices, 'existing': leases that already had one}. With ``dry_run``
+    nothing is written and ``created`` is what would have been inserted.
+    """
+    first, last = parse_month(payment_month)
+    leases = db.session.query(func.count(Lease.id)).filter(*_active_leases(first, last)).scalar()
+
+    if dry_run:
+        invoiced = db.session.query(func.count(Lease.id)).filter(
+            *_active_leases(first, last),
+            Payment.query.filter(Payment.lease_id == Lease.id,
+                                 Payment.payment_month == payment_month).exists(),
+        ).scalar()
+        return {'leases': leases, 'created': leases - invoiced, 'existing': invoiced}
+
+    table = Payment.__table__
+    columns = [table.c.lease_id, table.c.tenant_id, table.c.amount, table.c.due_date, table.c.payment_month, table.c.status, table.c.late_fee,
+               table.c.created_at]
+    rows = _invoice_select(payment_month, first, last, datetime.utcnow())
+    low, high = db.session.query(func.min(Lease.id), func.max(Lease.id)).one()
+
+    created = 0
+    # Chunk on lease id ranges so each statement (and its write lock) stays short
+    for start in range(low or 0, (high or 0) + 1, chunk_size):
+        chunk = rows.where(Lease.id >= start, Lease.id < start + chunk_size)
+        stmt = insert(table).from_select(columns, chunk).on_conflict_do_nothing(
+            index_elements=[table.c.lease_id, table.c.payment_month]
+        )
+        created += db.session.execute(stmt).rowcount
+    db.session.commit()
+
+    return {'leases': leases, 'created': created, 'existing': leases - created}
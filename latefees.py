@@ -0,0 +1,181 @@
+"""
+Late-fee assessment for pending payments.
+
+Every pending payment is loaded as columns (id, amount, current fee, due
+date, lease due day, month) in a single query, and fees for the whole
+portfolio are computed in one vectorised NumPy pass. Only rows whose fee
+changes are written back, with a bulk UPDATE by primary key.
+
+Policies:
+
+* ``flat``: ``amount`` once the grace period has passed
+* ``percentage``: ``percent`` of the rent due
+* ``daily``: ``amount`` per day late beyond the grace period
+
+``cap``, if set, limits the fee under any policy.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+from sqlalchemy import String, bindparam, cast, func
+
+from extensions import db
+from models import Lease, Payment
+
+POLICIES = ('flat', 'percentage', 'daily')
+UPDATE_CHUNK = 5000
+
+
+@dataclass(frozen=True)
+class LateFeePolicy:
+    kind: str = 'flat'
+    amount: float = 0.0
+    percent: float = 0.0
+    cap: float = None
+    grace_days: int = 0
+
+    def __post_init__(self):
+        if self.kind not in POLICIES:
+            raise ValueError(f'Unknown late fee policy {self.kind!r}; expected one of {", ".join(POLICIES)}')
+
+    @classmethod
+    def from_config(cls, config, **overrides):
+        """Policy from the LATE_FEE_* settings, with ``None`` overrides ignored"""
+        values = dict(
+            kind=config.get('LATE_FEE_POLICY', 'flat'),
+            amount=config.get('LATE_FEE_AMOUNT', 0.0),
+            percent=config.get('LATE_FEE_PERCENT', 0.0),
+            cap=config.get('LATE_FEE_CAP'),
+            grace_days=config.get('LATE_FEE_GRACE_DAYS', 0),
+        )
+        values.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**values)
+
+
+@dataclass
+class Assessment:
+    """Result of one run: the changed rows and their fees before and after"""
+    checked: int
+    ids: np.ndarray
+    old_fees: np.ndarray
+    new_fees: np.ndarray
+    days_late: np.ndarray
+
+    @property
+    def changed(self):
+        return len(self.ids)
+
+    def rows(self):
+        """[(payment id, old fee, new fee, days late)] for display"""
+        return list(zip(self.ids.tolist(), self.old_fees.tolist(),
+                        self.new_fees.tolist(), self.days_late.tolist()))
+
+
+def _as_dates(values, unit):
+    try:
+        return np.array(values, dtype=f'datetime64[{unit}]')
+    except ValueError:
+        # A hand-typed month that is not YYYY-MM has no usable due date
+        parsed = []
+        for value in values:
+            try:
+                parsed.append(np.datetime64(value, unit))
+            except ValueError:
+                parsed.append(np.datetime64('NaT', unit))
+        return np.array(parsed, dtype=f'datetime64[{unit}]')
+
+
+def _load_pending():
+    # Dates come back as their stored ISO text so NumPy can parse whole columns
+    rows = db.session.query(
+        Payment.id,
+        Payment.amount,
+        func.coalesce(Payment.late_fee, 0.0),
+        func.coalesce(cast(Payment.due_date, String), 'NaT'),
+        func.coalesce(Payment.payment_month, 'NaT'),
+        func.coalesce(Lease.payment_due_day, 1),
+    ).join(Lease, Payment.lease_id == Lease.id).filter(Payment.status == 'pending').all()
+
+    ids, amounts, fees, due, months, due_days = zip(*rows) if rows else ((),) * 6
+    return (
+        np.array(ids, dtype=np.int64),
+        np.array(amounts, dtype=np.float64),
+        np.array(fees, dtype=np.float64),
+        _as_dates(due, 'D'),
+        _as_dates(months, 'M'),
+        np.array(due_days, dtype=np.int64),
+    )
+
+
+def effective_due_dates(stored, months, due_days):
+    """
+    Due date per payment.
+
+    Invoices carry ``due_date``; older rows fall back to the lease's due day
+    within ``payment_month``, clamped to the length of that month.
+    """
+    month_start = months.astype('datetime64[D]')
+    month_length = ((months + 1).astype('datetime64[D]') - month_start).astype(np.int64)
+    day = np.clip(due_days, 1, np.where(month_length > 0, month_length, 1))
+    fallback = month_start + (day - 1).astype('timedelta64[D]')
+    return np.where(np.isnat(stored), fallback, stored)
+
+
+def compute_fees(policy, amounts, due, as_of):
+    """(fees, days late) for every payment, computed column-wise"""
+    days_late = (np.datetime64(as_of, 'D') - due).astype(np.int64)
+    known = ~np.isnat(due)
+    late = known & (days_late > policy.grace_days)
+    days_late = np.where(known, np.maximum(days_late, 0), 0)
+
+    if policy.kind == 'flat':
+        fees = np.full(amounts.shape, float(policy.amount))
+    elif policy.kind == 'percentage':
+        fees = amounts * (policy.percent / 100.0)
+    else:
+        fees = (days_late - policy.grace_days) * float(policy.amount)
+
+    if policy.cap is not None:
+        fees = np.minimum(fees, policy.cap)
+    fees = np.where(late, np.round(fees, 2), 0.0)
+    return fees, days_late
+
+
+def assess_late_fees(policy, as_of=None, dry_run=False):
+    """
+    Recompute ``late_fee`` on every pending payment as of ``as_of`` (today).
+
+    Fees are recomputed from scratch, so a policy change or a corrected due
+    date can lower a fee as well as raise it. Returns an ``Assessment`` of the rows that
+    changed; with ``dry_run`` nothing is written.
+    """
+    as_of = as_of or date.today()
+    ids, amounts, old_fees, stored_due, months, due_days = _load_pending()
+    due = effective_due_dates(stored_due, months, due_days)
+    new_fees, days_late = compute_fees(policy, amounts, due, as_of)
+
+    changed = np.abs(new_fees - old_fees) > 0.005
+    assessment = Assessment(
+        checked=len(ids),
+        ids=ids[changed],
+        old_fees=old_fees[changed],
+        new_fees=new_fees[changed],
+        days_late=days_late[changed],
+    )
+
+    if not dry_run and assessment.changed:
+        table = Payment.__table__
+        stmt = table.update().where(table.c.id == bindparam('payment_id')) \
+            .values(late_fee=bindparam('fee'))
+        for start in range(0, assessment.changed, UPDATE_CHUNK):
+            chunk = slice(start, start + UPDATE_CHUNK)
+            db.session.execute(stmt, [
+                {'payment_id': payment_id, 'fee': fee}
+                for payment_id, fee in zip(assessment.ids[chunk].tolist(),
+                                           assessment.new_fees[chunk].tolist())
+            ])
+        db.session.commit()
+
+    return assessment
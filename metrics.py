@@ -0,0 +1,385 @@
+"""
+Prometheus metrics, served as text at ``/metrics``.
+
+Collected in-process, without a client library:
+
+- ``rms_http_request_duration_seconds``: latency histogram per endpoint
+  and role of the logged-in user (``anonymous`` when the view never
+  loaded one), and ``rms_http_responses_total`` per endpoint and status;
+- ``rms_http_requests_in_flight``;
+- ``rms_db_pool_checkouts_total`` per bind, ``rms_db_pool_connections_in_use``,
+  ``rms_db_pool_overflow_checkouts_total`` (checkouts beyond the pool size,
+  the ones that queue once the overflow is used up too) and
+  ``rms_db_pool_timeouts_total`` (requests that gave up waiting);
+- ``rms_sql_queries_total`` per bind;
+- business gauges read at scrape time from the ``global`` dashboard
+  counter row, one primary-key read (see counters.py).
+
+Observing is a thread-local dict lookup and a list increment, about half
+a microsecond on a slow core, with no lock; threads (or gevent greenlets)
+are only added up, and the text built, when scraped.
+
+Every worker process has its own figures. With METRICS_DIR set, each
+process writes a snapshot of them to ``METRICS_DIR/<pid>.json`` every
+METRICS_FLUSH_INTERVAL seconds (and when it serves a scrape), and a scrape
+adds up the snapshots of all processes, so any worker can answer it.
+Snapshots of exited processes keep counting towards the totals, so
+counters never go backwards when a worker is replaced; their in-flight
+and in-use gauges are dropped. Empty the directory when the server is
+restarted, as the totals start over then.
+
+``/metrics`` answers requests from the machine itself, or anyone sending
+``Authorization: Bearer <METRICS_TOKEN>`` when a token is set.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import deque
+from hmac import compare_digest
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from counters import GLOBAL, get_counters
+
+# Upper bounds in seconds; the +Inf bucket is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (metric, help, counter field) read from the global dashboard counters
+BUSINESS_GAUGES = (
+    ('rms_pending_maintenance_requests', 'Maintenance requests not yet started.', 'pending_maintenance'),
+    ('rms_in_progress_maintenance_requests', 'Maintenance requests being worked on.',
+     'in_progress_maintenance'),
+    ('rms_pending_users', 'User accounts waiting for approval.', 'pending_users'),
+    ('rms_users', 'User accounts.', 'total_users'),
+    ('rms_properties', 'Properties.', 'total_properties'),
+    ('rms_active_leases', 'Active leases.', 'active_leases'),
+)
+
+LOCAL_ADDRESSES = {'127.0.0.1', '::1'}
+
+
+class _Shard:
+    """Holder of one thread's values, kept only in its thread-local storage"""
+    __slots__ = ('values', '__weakref__')
+
+
+class Metric:
+    """Values per label tuple; counters and gauges hold one number each
+
+    Every thread counts into a dict of its own, so observing takes no lock;
+    the dicts are added up when scraped. Copying a dict is a single step
+    under the GIL, so a scrape never sees one half-updated.
+
+    A thread's dict is folded into the retired totals once its thread-local
+    storage is freed, which is when the thread, or under gevent the request
+    greenlet, ends. The finalizer only queues the dict: it can run inside
+    any allocation, including one made while the lock is held.
+    """
+
+    def __init__(self, name, help_text, kind, labels, aggregate=True):
+        self.name = name
+        self.kind = kind  # 'counter', 'gauge' or 'histogram'
+        self.help = help_text
+        self.labels = labels
+        # Whether values from exited processes still count (gauges: no)
+        self.aggregate = aggregate
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._local = threading.local()
+        self._keys = itertools.count()
+        self._shards = {}  # key: values of a live thread
+        self._ended = deque()  # keys of threads that have ended since the last fold
+        self._retired = {}  # values of threads that have ended
+
+    def _values(self):
+        try:
+            return self._local.shard.values
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            values = shard.values = {}
+            key = next(self._keys)
+            with self._lock:
+                self._retire_ended()
+                self._shards[key] = values
+            weakref.finalize(shard, self._ended.append, key)
+            return values
+
+    def _retire_ended(self):
+        while self._ended:
+            values = self._shards.pop(self._ended.popleft(), {})
+            for labels, value in values.items():
+                self._add(self._retired, labels, value)
+
+    def inc(self, labels, amount=1):
+        values = self._values()
+        values[labels] = values.get(labels, 0) + amount
+
+    def _add(self, totals, labels, value):
+        totals[labels] = totals.get(labels, 0) + value
+
+    def totals(self):
+        """{label tuple: value} over every thread of this process"""
+        with self._lock:
+            self._retire_ended()
+            totals = {}
+            for labels, value in self._retired.items():
+                self._add(totals, labels, value)
+            for values in list(self._shards.values()):
+                for labels, value in dict(values).items():
+                    self._add(totals, labels, value)
+        return totals
+
+    def snapshot(self):
+        return [[list(labels), value] for labels, value in self.totals().items()]
+
+
+class Histogram(Metric):
+    """Bucket counts (not cumulative) with the sum as the last item"""
+
+    def __init__(self, name, help_text, labels, buckets):
+        super().__init__(name, help_text, 'histogram', labels)
+        self.buckets = buckets
+
+    def observe(self, labels, value):
+        values = self._values()
+        counts = values.get(labels)
+        if counts is None:
+            counts = values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def _add(self, totals, labels, value):
+        current = totals.get(labels)
+        totals[labels] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+
+
+class Registry:
+    """The metrics of one app in this process, and their snapshot file"""
+
+    def __init__(self, directory=None, interval=5.0):
+        self.directory = directory
+        self.interval = interval
+        self.pid = None
+        self.requests = Histogram('rms_http_request_duration_seconds', 'Request latency.',
+                                  ('endpoint', 'role'), LATENCY_BUCKETS)
+        self.responses = Metric('rms_http_responses_total', 'Responses sent.', 'counter',
+                                ('endpoint', 'status'))
+        self.in_flight = Metric('rms_http_requests_in_flight', 'Requests being served.', 'gauge', (),
+                                aggregate=False)
+        self.checkouts = Metric('rms_db_pool_checkouts_total', 'Connections taken from the pool.',
+                                'counter', ('bind',))
+        self.overflow = Metric('rms_db_pool_overflow_checkouts_total',
+                               'Checkouts beyond the pool size.', 'counter', ('bind',))
+        self.in_use = Metric('rms_db_pool_connections_in_use', 'Connections checked out.', 'gauge',
+                             ('bind',), aggregate=False)
+        self.timeouts = Metric('rms_db_pool_timeouts_total', 'Requests that timed out waiting for a connection.',
+                               'counter', ())
+        self.queries = Metric('rms_sql_queries_total', 'SQL statements executed.', 'counter', ('bind',))
+        self.metrics = (self.requests, self.responses, self.in_flight, self.checkouts, self.overflow,
+                        self.in_use, self.timeouts, self.queries)
+
+    def start(self):
+        """Begin a process's figures; a forked worker must not report its parent's"""
+        pid = os.getpid()
+        if self.pid == pid:
+            return
+        self.pid = pid
+        for metric in self.metrics:
+            metric.reset()
+        if self.directory:
+            threading.Thread(target=self._flush_loop, args=(pid,), daemon=True,
+                             name='metrics-flush').start()
+
+    def _flush_loop(self, pid):
+        while self.pid == pid:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError:
+                pass  # the folder was cleared; the next scrape or flush recreates the file
+
+    def snapshot(self):
+        return {'pid': os.getpid(), 'metrics': {metric.name: metric.snapshot() for metric in self.metrics}}
+
+    def flush(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(path + '.tmp', path)
+
+    def collect(self):
+        """{metric name: {label tuple: value}} summed over every process"""
+        if not self.directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = [_read(os.path.join(self.directory, name)) for name in sorted(os.listdir(self.directory))
+                         if name.endswith('.json')]
+        kinds = {metric.name: metric for metric in self.metrics}
+        totals = {metric.name: {} for metric in self.metrics}
+        for snapshot in snapshots:
+            if snapshot is None:
+                continue
+            alive = _alive(snapshot['pid'])
+            for name, values in snapshot['metrics'].items():
+                metric = kinds.get(name)
+                if metric is None or not (alive or metric.aggregate):
+                    continue
+                for labels, value in values:
+                    metric._add(totals[name], tuple(labels), value)
+        return totals
+
+
+def _read(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None  # removed or half-written by a process that just exited
+
+
+def _alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# ==================== Collection hooks ====================
+
+def init_app(app):
+    config = app.config
+    if not config['METRICS_ENABLED']:
+        return
+    registry = app.extensions['metrics'] = Registry(config['METRICS_DIR'], config['METRICS_FLUSH_INTERVAL'])
+    with app.app_context():
+        engines = dict(app.extensions['sqlalchemy'].engines)
+    for bind, engine in engines.items():
+        _watch_engine(registry, bind or 'primary', engine)
+    app.before_request(_start_request)
+    app.after_request(_end_request)
+    app.teardown_request(_teardown_request)
+
+
+def get_registry():
+    return current_app.extensions['metrics']
+
+
+def _watch_engine(registry, bind, engine):
+    labels = (bind,)
+    # In-memory databases share one connection and have no pool size
+    size = engine.pool.size() if isinstance(engine.pool, QueuePool) else None
+
+    @event.listens_for(engine.pool, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        registry.checkouts.inc(labels)
+        registry.in_use.inc(labels)
+        if size is not None and engine.pool.checkedout() > size:
+            registry.overflow.inc(labels)
+
+    @event.listens_for(engine.pool, 'checkin')
+    def checkin(dbapi_connection, connection_record):
+        registry.in_use.inc(labels, -1)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        registry.queries.inc(labels)
+
+
+def _start_request():
+    registry = get_registry()
+    registry.start()
+    registry.in_flight.inc(())
+    g.metrics_in_flight = True
+    g.metrics_started = time.perf_counter()
+
+
+def _role():
+    # Only a user the view already loaded: the metrics never cost a query
+    user = g.get('_login_user')
+    return getattr(user, 'role', None) or 'anonymous'
+
+
+def _end_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        registry = get_registry()
+        endpoint = request.endpoint or 'none'
+        registry.requests.observe((endpoint, _role()), time.perf_counter() - started)
+        registry.responses.inc((endpoint, str(response.status_code)))
+    return response
+
+
+def _teardown_request(error=None):
+    registry = get_registry()
+    if g.pop('metrics_in_flight', False):
+        registry.in_flight.inc((), -1)
+    if isinstance(error, PoolTimeoutError):
+        registry.timeouts.inc(())
+
+
+# ==================== Exposition ====================
+
+def authorized():
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        return compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    return request.remote_addr in LOCAL_ADDRESSES
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(registry):
+    """Every metric in the Prometheus text exposition format (0.0.4)"""
+    totals = registry.collect()
+    lines = []
+    for metric in registry.metrics:
+        lines += [f'# HELP {metric.name} {metric.help}', f'# TYPE {metric.name} {metric.kind}']
+        values = totals[metric.name]
+        if metric.kind == 'gauge' and not metric.labels and not values:
+            values = {(): 0}
+        for labels, value in sorted(values.items()):
+            if metric.kind != 'histogram':
+                lines.append(f'{metric.name}{_labels(metric.labels, labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ('+Inf',), value[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{metric.name}_bucket{_labels(metric.labels, labels, le)} {cumulative}')
+            lines.append(f'{metric.name}_sum{_labels(metric.labels, labels)} {_number(value[-1])}')
+            lines.append(f'{metric.name}_count{_labels(metric.labels, labels)} {cumulative}')
+
+    row = get_counters(GLOBAL)
+    for name, help_text, field in BUSINESS_GAUGES:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {getattr(row, field)}']
+    return '\n'.join(lines) + '\n'
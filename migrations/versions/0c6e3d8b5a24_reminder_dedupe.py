@@ -0,0 +1,33 @@
+"""Reminder dedupe key on notifications and the rent-due index
+
+Revision ID: 0c6e3d8b5a24
+Revises: f2a9c64e7b18
+Create Date: 2026-10-17 09:12:44.507391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c6e3d8b5a24'
+down_revision = 'f2a9c64e7b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.add_column(sa.Column('dedupe_key', sa.String(length=100), nullable=True))
+    op.create_index('uq_notifications_user_dedupe', 'notifications', ['user_id', 'dedupe_key'],
+                    unique=True, if_not_exists=True)
+    op.create_index('ix_payments_status_due_date', 'payments', ['status', 'due_date'],
+                    unique=False, if_not_exists=True)
+    op.execute(sa.text('ANALYZE'))
+
+
+def downgrade():
+    op.drop_index('ix_payments_status_due_date', table_name='payments', if_exists=True)
+    op.drop_index('uq_notifications_user_dedupe', table_name='notifications', if_exists=True)
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.drop_column('dedupe_key')
@@ -0,0 +1,54 @@
+"""Full-text search index on properties
+
+Revision ID: 3b9f0e5d7c62
+Revises: 0c6e3d8b5a24
+Create Date: 2026-10-17 11:03:27.184530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9f0e5d7c62'
+down_revision = '0c6e3d8b5a24'
+branch_labels = None
+depends_on = None
+
+# Kept in step with search.CREATE_STATEMENTS; spelled out so this revision
+# does not change if the module does
+COLUMNS = 'title, description, amenities, address, city, zip_code'
+NEW = 'new.title, new.description, new.amenities, new.address, new.city, new.zip_code'
+OLD = 'old.title, old.description, old.amenities, old.address, old.city, old.zip_code'
+
+
+def upgrade():
+    op.execute(sa.text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS properties_fts USING fts5({COLUMNS}, "
+        f"content='properties', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ))
+    op.execute(sa.text(
+        f"CREATE TRIGGER IF NOT EXISTS properties_fts_insert AFTER INSERT ON properties BEGIN "
+        f"INSERT INTO properties_fts(rowid, {COLUMNS}) VALUES (new.id, {NEW}); END"
+    ))
+    op.execute(sa.text(
+        f"CREATE TRIGGER IF NOT EXISTS properties_fts_delete AFTER DELETE ON properties BEGIN "
+        f"INSERT INTO properties_fts(properties_fts, rowid, {COLUMNS}) "
+        f"VALUES ('delete', old.id, {OLD}); END"
+    ))
+    op.execute(sa.text(
+        f"CREATE TRIGGER IF NOT EXISTS properties_fts_update AFTER UPDATE OF {COLUMNS} ON properties BEGIN "
+        f"INSERT INTO properties_fts(properties_fts, rowid, {COLUMNS}) "
+        f"VALUES ('delete', old.id, {OLD}); "
+        f"INSERT INTO properties_fts(rowid, {COLUMNS}) VALUES (new.id, {NEW}); END"
+    ))
+    # Index the properties that already exist
+    op.execute(sa.text("INSERT INTO properties_fts(properties_fts) VALUES ('rebuild')"))
+
+
+def downgrade():
+    op.execute(sa.text('DROP TRIGGER IF EXISTS properties_fts_update'))
+    op.execute(sa.text('DROP TRIGGER IF EXISTS properties_fts_delete'))
+    op.execute(sa.text('DROP TRIGGER IF EXISTS properties_fts_insert'))
+    op.execute(sa.text('DROP TABLE IF EXISTS properties_fts'))
@@ -0,0 +1,83 @@
+"""Property facet bitmaps, backfilled from the existing rows
+
+Revision ID: 5e7a2d4c9b16
+Revises: 3b9f0e5d7c62
+Create Date: 2026-10-17 11:48:09.662714
+
+"""
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7a2d4c9b16'
+down_revision = '3b9f0e5d7c62'
+branch_labels = None
+depends_on = None
+
+
+# Same layout and rent buckets as facets.py at the time of this revision
+CHUNK_BITS = 15
+RENT_BUCKETS = (0, 500, 1000, 1500, 2000, 3000)
+
+
+def _number(value, convert):
+    # The forms store what was typed: '' for a blank field, or text that is not a number
+    try:
+        return convert(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _whole(value):
+    number = float(value)
+    return str(int(number)) if number.is_integer() else None
+
+
+def _backfill(bind):
+    size = (1 << CHUNK_BITS) // 8
+    bitmaps = defaultdict(lambda: bytearray(size))
+    rows = bind.execute(sa.text(
+        'SELECT id, availability_status, property_type, city, state, bedrooms, bathrooms, '
+        'rent_amount FROM properties'))
+    for id_, status, property_type, city, state, bedrooms, bathrooms, rent in rows:
+        values = {
+            'status': status or 'available',
+            'property_type': property_type or None,
+            'city': city or None,
+            'state': state or None,
+            'bedrooms': _number(bedrooms, _whole),
+            'bathrooms': _number(bathrooms, _whole),
+            'rent': _number(rent or 0, lambda value: str(max(
+                (bound for bound in RENT_BUCKETS if float(value) >= bound), default=0))),
+        }
+        offset = id_ & ((1 << CHUNK_BITS) - 1)
+        for facet, value in values.items():
+            if value is not None:
+                bitmaps[(facet, value, id_ >> CHUNK_BITS)][offset >> 3] |= 1 << (offset & 7)
+    if bitmaps:
+        bind.execute(sa.text(
+            'INSERT INTO property_facets (facet, value, chunk, bitmap) '
+            'VALUES (:facet, :value, :chunk, :bitmap)'
+        ), [dict(facet=facet, value=value, chunk=chunk, bitmap=bytes(bitmap))
+            for (facet, value, chunk), bitmap in bitmaps.items()])
+
+
+def upgrade():
+    op.create_table('property_facets',
+    sa.Column('facet', sa.String(length=20), nullable=False),
+    sa.Column('value', sa.String(length=100), nullable=False),
+    sa.Column('chunk', sa.Integer(), nullable=False),
+    sa.Column('bitmap', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('facet', 'value', 'chunk'),
+    if_not_exists=True
+    )
+    # Rebuild from scratch: create_all() may already have made an empty table
+    op.execute(sa.text('DELETE FROM property_facets'))
+    _backfill(op.get_bind())
+
+
+def downgrade():
+    op.drop_table('property_facets', if_exists=True)
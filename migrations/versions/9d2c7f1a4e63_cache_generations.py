@@ -0,0 +1,29 @@
+"""Cache generation counters shared by all worker processes
+
+Revision ID: 9d2c7f1a4e63
+Revises: 5e7a2d4c9b16
+Create Date: 2026-10-17 13:21:40.518337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2c7f1a4e63'
+down_revision = '5e7a2d4c9b16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_generations',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name'),
+    if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('cache_generations', if_exists=True)
@@ -0,0 +1,53 @@
+"""Unread-first inbox and retention indexes, notification archive table
+
+Revision ID: a7e4b2f9c318
+Revises: 9d2c7f1a4e63
+Create Date: 2026-10-17 14:37:12.804591
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e4b2f9c318'
+down_revision = '9d2c7f1a4e63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The inbox reads the unread and read halves separately; NULL would be in neither
+    op.execute('UPDATE notifications SET is_read = 0 WHERE is_read IS NULL')
+    op.drop_index('ix_notifications_user_created', table_name='notifications', if_exists=True)
+    op.create_index('ix_notifications_user_read', 'notifications', ['user_id', 'is_read'], unique=False,
+                    if_not_exists=True)
+    op.create_index('ix_notifications_read_created', 'notifications', ['is_read', 'created_at'], unique=False,
+                    if_not_exists=True)
+    op.execute(sa.text('ANALYZE notifications'))
+
+    op.create_table('notification_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=200), nullable=False),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('notification_type', sa.String(length=50), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    if_not_exists=True
+    )
+
+
+def downgrade():
+    # Archived notifications go back to the inbox, as read
+    op.execute(
+        'INSERT INTO notifications (id, user_id, title, message, notification_type, is_read, created_at) '
+        'SELECT id, user_id, title, message, notification_type, 1, created_at FROM notification_archive'
+    )
+    op.drop_table('notification_archive', if_exists=True)
+
+    op.drop_index('ix_notifications_read_created', table_name='notifications', if_exists=True)
+    op.drop_index('ix_notifications_user_read', table_name='notifications', if_exists=True)
+    op.create_index('ix_notifications_user_created', 'notifications', ['user_id', 'created_at'], unique=False,
+                    if_not_exists=True)
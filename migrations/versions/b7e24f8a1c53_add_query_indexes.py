@@ -0,0 +1,51 @@
+"""Add indexes for the hot filter paths in routes.py
+
+Revision ID: b7e24f8a1c53
+Revises: 6a1d0c3e9f21
+Create Date: 2026-10-17 06:52:58.436710
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e24f8a1c53'
+down_revision = '6a1d0c3e9f21'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_users_role', 'users', ['role']),
+    ('ix_users_is_active', 'users', ['is_active']),
+    ('ix_properties_owner_status', 'properties', ['owner_id', 'availability_status']),
+    ('ix_properties_status_created', 'properties', ['availability_status', 'created_at']),
+    ('ix_properties_created_at', 'properties', ['created_at']),
+    ('ix_leases_tenant_status', 'leases', ['tenant_id', 'status']),
+    ('ix_leases_property_status', 'leases', ['property_id', 'status']),
+    ('ix_leases_status_end_date', 'leases', ['status', 'end_date']),
+    ('ix_payments_lease_status', 'payments', ['lease_id', 'status']),
+    ('ix_payments_tenant_status', 'payments', ['tenant_id', 'status']),
+    ('ix_payments_status_amount', 'payments', ['status', 'amount']),
+    ('ix_payments_created_at', 'payments', ['created_at']),
+    ('ix_payments_payment_date', 'payments', ['payment_date']),
+    ('ix_maintenance_staff_status', 'maintenance_requests', ['staff_id', 'status']),
+    ('ix_maintenance_property_status', 'maintenance_requests', ['property_id', 'status']),
+    ('ix_maintenance_tenant_reported', 'maintenance_requests', ['tenant_id', 'reported_date']),
+    ('ix_maintenance_status', 'maintenance_requests', ['status']),
+    ('ix_maintenance_reported_date', 'maintenance_requests', ['reported_date']),
+    ('ix_notifications_user_created', 'notifications', ['user_id', 'created_at']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+    # Give the planner fresh statistics for the new indexes
+    op.execute(sa.text('ANALYZE'))
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
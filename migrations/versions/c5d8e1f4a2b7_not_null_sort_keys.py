@@ -0,0 +1,61 @@
+"""NOT NULL creation dates, the keyset pagination sort keys
+
+Revision ID: c5d8e1f4a2b7
+Revises: a7e4b2f9c318
+Create Date: 2026-10-17 16:12:48.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d8e1f4a2b7'
+down_revision = 'a7e4b2f9c318'
+branch_labels = None
+depends_on = None
+
+# In the format SQLAlchemy stores DateTime in, so backfilled rows compare like the rest
+NOW = "strftime('%Y-%m-%d %H:%M:%S.000000', 'now')"
+
+# (table, column, what an unknown date becomes)
+COLUMNS = (
+    ('users', 'created_at', f'COALESCE(updated_at, {NOW})'),
+    ('properties', 'created_at', f'COALESCE(updated_at, {NOW})'),
+    ('maintenance_requests', 'reported_date', f'COALESCE(assigned_date, completed_date, {NOW})'),
+)
+
+# The batch rebuild of properties drops its triggers; same SQL as revision 3b9f0e5d7c62
+FTS_COLUMNS = 'title, description, amenities, address, city, zip_code'
+NEW = 'new.title, new.description, new.amenities, new.address, new.city, new.zip_code'
+OLD = 'old.title, old.description, old.amenities, old.address, old.city, old.zip_code'
+FTS_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS properties_fts_insert AFTER INSERT ON properties BEGIN "
+    f"INSERT INTO properties_fts(rowid, {FTS_COLUMNS}) VALUES (new.id, {NEW}); END",
+    f"CREATE TRIGGER IF NOT EXISTS properties_fts_delete AFTER DELETE ON properties BEGIN "
+    f"INSERT INTO properties_fts(properties_fts, rowid, {FTS_COLUMNS}) "
+    f"VALUES ('delete', old.id, {OLD}); END",
+    f"CREATE TRIGGER IF NOT EXISTS properties_fts_update AFTER UPDATE OF {FTS_COLUMNS} ON properties BEGIN "
+    f"INSERT INTO properties_fts(properties_fts, rowid, {FTS_COLUMNS}) "
+    f"VALUES ('delete', old.id, {OLD}); "
+    f"INSERT INTO properties_fts(rowid, {FTS_COLUMNS}) VALUES (new.id, {NEW}); END",
+)
+
+
+def _set_nullable(nullable):
+    for table, column, _ in COLUMNS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(column, existing_type=sa.DateTime(), nullable=nullable)
+    for statement in FTS_TRIGGERS:
+        op.execute(sa.text(statement))
+
+
+def upgrade():
+    # Keyset pagination compares (date, id) row values; a NULL date drops out of every page but the first
+    for table, column, fallback in COLUMNS:
+        op.execute(sa.text(f'UPDATE {table} SET {column} = {fallback} WHERE {column} IS NULL'))
+    _set_nullable(False)
+
+
+def downgrade():
+    _set_nullable(True)
@@ -0,0 +1,43 @@
+"""Covering indexes for the report aggregates
+
+Revision ID: d41f7a2c8e90
+Revises: b7e24f8a1c53
+Create Date: 2026-10-17 07:20:11.402518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f7a2c8e90'
+down_revision = 'b7e24f8a1c53'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_payments_lease_status_amount', 'payments', ['lease_id', 'status', 'amount']),
+    ('ix_payments_month_status_amount', 'payments', ['payment_month', 'status', 'amount']),
+    ('ix_properties_type_status_rent', 'properties', ['property_type', 'availability_status', 'rent_amount']),
+    ('ix_maintenance_property_status_cost', 'maintenance_requests', ['property_id', 'status', 'cost']),
+    ('ix_maintenance_priority_status_cost', 'maintenance_requests', ['priority', 'status', 'cost']),
+]
+
+
+def upgrade():
+    # The old two-column indexes are prefixes of their replacements
+    op.drop_index('ix_payments_lease_status', table_name='payments', if_exists=True)
+    op.drop_index('ix_maintenance_property_status', table_name='maintenance_requests', if_exists=True)
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+    op.execute(sa.text('ANALYZE'))
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
+    op.create_index('ix_maintenance_property_status', 'maintenance_requests',
+                    ['property_id', 'status'], unique=False, if_not_exists=True)
+    op.create_index('ix_payments_lease_status', 'payments', ['lease_id', 'status'],
+                    unique=False, if_not_exists=True)
@@ -0,0 +1,41 @@
+"""Compressed property facet bitmaps
+
+Revision ID: d9b3f6a1e5c4
+Revises: c5d8e1f4a2b7
+Create Date: 2026-10-17 17:24:31.907265
+
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9b3f6a1e5c4'
+down_revision = 'c5d8e1f4a2b7'
+branch_labels = None
+depends_on = None
+
+# Chunk size of revision 5e7a2d4c9b16, whose blobs are the raw 4 KB bitmaps
+CHUNK_BYTES = (1 << 15) // 8
+
+
+def _rewrite(convert):
+    bind = op.get_bind()
+    rows = bind.execute(sa.text('SELECT facet, value, chunk, bitmap FROM property_facets')).fetchall()
+    if rows:
+        bind.execute(sa.text(
+            'UPDATE property_facets SET bitmap = :bitmap '
+            'WHERE facet = :facet AND value = :value AND chunk = :chunk'
+        ), [dict(facet=facet, value=value, chunk=chunk, bitmap=convert(bytes(bitmap)))
+            for facet, value, chunk, bitmap in rows])
+
+
+def upgrade():
+    # Cut after the highest set bit, then compress; same as facets._to_blob
+    _rewrite(lambda bitmap: zlib.compress(bitmap.rstrip(b'\0')))
+
+
+def downgrade():
+    _rewrite(lambda blob: zlib.decompress(blob).ljust(CHUNK_BYTES, b'\0'))
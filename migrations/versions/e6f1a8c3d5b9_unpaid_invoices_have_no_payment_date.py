@@ -0,0 +1,31 @@
+"""Unpaid invoices have no payment date
+
+Revision ID: e6f1a8c3d5b9
+Revises: d9b3f6a1e5c4
+Create Date: 2026-10-17 18:05:52.614380
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6f1a8c3d5b9'
+down_revision = 'd9b3f6a1e5c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('payments') as batch_op:
+        batch_op.alter_column('payment_date', existing_type=sa.Date(), nullable=True)
+    # generate-invoices used to copy the due date into payment_date of the pending rows it made
+    op.execute(sa.text("UPDATE payments SET payment_date = NULL "
+                       "WHERE status = 'pending' AND payment_date = due_date"))
+
+
+def downgrade():
+    op.execute(sa.text("UPDATE payments SET payment_date = COALESCE(due_date, date(created_at), date('now')) "
+                       "WHERE payment_date IS NULL"))
+    with op.batch_alter_table('payments') as batch_op:
+        batch_op.alter_column('payment_date', existing_type=sa.Date(), nullable=False)
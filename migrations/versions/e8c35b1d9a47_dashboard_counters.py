@@ -0,0 +1,82 @@
+"""Dashboard counter table, backfilled from the existing rows
+
+Revision ID: e8c35b1d9a47
+Revises: d41f7a2c8e90
+Create Date: 2026-10-17 08:04:37.915203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c35b1d9a47'
+down_revision = 'd41f7a2c8e90'
+branch_labels = None
+depends_on = None
+
+
+BACKFILL = [
+    """
+    INSERT INTO dashboard_counters
+    SELECT 'global', 0,
+           (SELECT COUNT(*) FROM users),
+           (SELECT COUNT(*) FROM users WHERE is_active = 0),
+           (SELECT COUNT(*) FROM properties),
+           (SELECT COUNT(*) FROM leases WHERE status = 'active'),
+           (SELECT COALESCE(SUM(amount), 0) FROM payments WHERE status = 'completed'),
+           (SELECT COUNT(*) FROM maintenance_requests WHERE status = 'pending'),
+           (SELECT COUNT(*) FROM maintenance_requests WHERE status = 'in_progress'),
+           (SELECT COUNT(*) FROM maintenance_requests WHERE status = 'completed')
+    """,
+    """
+    INSERT INTO dashboard_counters
+    SELECT 'owner', o.id, 0, 0,
+           (SELECT COUNT(*) FROM properties p WHERE p.owner_id = o.id),
+           (SELECT COUNT(*) FROM leases l JOIN properties p ON p.id = l.property_id
+             WHERE p.owner_id = o.id AND l.status = 'active'),
+           (SELECT COALESCE(SUM(pay.amount), 0) FROM payments pay
+              JOIN leases l ON l.id = pay.lease_id JOIN properties p ON p.id = l.property_id
+             WHERE p.owner_id = o.id AND pay.status = 'completed'),
+           (SELECT COUNT(*) FROM maintenance_requests m JOIN properties p ON p.id = m.property_id
+             WHERE p.owner_id = o.id AND m.status = 'pending'),
+           (SELECT COUNT(*) FROM maintenance_requests m JOIN properties p ON p.id = m.property_id
+             WHERE p.owner_id = o.id AND m.status = 'in_progress'),
+           (SELECT COUNT(*) FROM maintenance_requests m JOIN properties p ON p.id = m.property_id
+             WHERE p.owner_id = o.id AND m.status = 'completed')
+      FROM (SELECT DISTINCT owner_id AS id FROM properties) o
+    """,
+    """
+    INSERT INTO dashboard_counters
+    SELECT 'staff', staff_id, 0, 0, 0, 0, 0,
+           SUM(status = 'pending'), SUM(status = 'in_progress'), SUM(status = 'completed')
+      FROM maintenance_requests
+     WHERE staff_id IS NOT NULL
+     GROUP BY staff_id
+    """,
+]
+
+
+def upgrade():
+    op.create_table('dashboard_counters',
+    sa.Column('scope', sa.String(length=10), nullable=False),
+    sa.Column('scope_id', sa.Integer(), nullable=False),
+    sa.Column('total_users', sa.Integer(), nullable=False),
+    sa.Column('pending_users', sa.Integer(), nullable=False),
+    sa.Column('total_properties', sa.Integer(), nullable=False),
+    sa.Column('active_leases', sa.Integer(), nullable=False),
+    sa.Column('completed_revenue', sa.Float(), nullable=False),
+    sa.Column('pending_maintenance', sa.Integer(), nullable=False),
+    sa.Column('in_progress_maintenance', sa.Integer(), nullable=False),
+    sa.Column('completed_maintenance', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('scope', 'scope_id'),
+    if_not_exists=True
+    )
+    # Recount from scratch: create_all() may already have made an empty table
+    op.execute(sa.text('DELETE FROM dashboard_counters'))
+    for statement in BACKFILL:
+        op.execute(sa.text(statement))
+
+
+def downgrade():
+    op.drop_table('dashboard_counters', if_exists=True)
@@ -0,0 +1,45 @@
+"""One invoice per lease and month, plus the invoice due date
+
+Revision ID: f2a9c64e7b18
+Revises: e8c35b1d9a47
+Create Date: 2026-10-17 08:41:09.283716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a9c64e7b18'
+down_revision = 'e8c35b1d9a47'
+branch_labels = None
+depends_on = None
+
+
+DUPLICATES = """
+    SELECT COUNT(*) FROM (
+        SELECT 1 FROM payments
+         WHERE payment_month IS NOT NULL
+         GROUP BY lease_id, payment_month
+        HAVING COUNT(*) > 1
+    )
+"""
+
+
+def upgrade():
+    duplicates = op.get_bind().execute(sa.text(DUPLICATES)).scalar()
+    if duplicates:
+        raise RuntimeError(
+            f'{duplicates} lease/month pairs have more than one payment; merge them '
+            'before adding the uq_payments_lease_month index'
+        )
+    with op.batch_alter_table('payments') as batch_op:
+        batch_op.add_column(sa.Column('due_date', sa.Date(), nullable=True))
+    op.create_index('uq_payments_lease_month', 'payments', ['lease_id', 'payment_month'],
+                    unique=True, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('uq_payments_lease_month', table_name='payments', if_exists=True)
+    with op.batch_alter_table('payments') as batch_op:
+        batch_op.drop_column('due_date')
@@ -1,10 +1,16 @@
 from extensions import db
 from flask_login import UserMixin
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+import passwords
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Role pickers (owners/tenants/staff) and the user list role filter
+        db.Index('ix_users_role', 'role'),
+        # Pending-approval count on the admin dashboard
+        db.Index('ix_users_is_active', 'is_active'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -14,7 +20,7 @@ class User(UserMixin, db.Model):
     address = db.Column(db.Text)
     role = db.Column(db.String(20), nullable=False)
     is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     properties = db.relationship('Property', backref='owner', lazy=True, foreign_keys='Property.owner_id')
@@ -25,16 +31,25 @@ class User(UserMixin, db.Model):
     notifications = db.relationship('Notification', backref='user', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify_password(self.password_hash, password)
     
     def __repr__(self):
         return f'<User {self.username}>'
 
 class Property(db.Model):
     __tablename__ = 'properties'
+    __table_args__ = (
+        # Owner listings, owner dashboard and the available-for-lease picker
+        db.Index('ix_properties_owner_status', 'owner_id', 'availability_status'),
+        # Tenant browsing: available listings, newest first
+        db.Index('ix_properties_status_created', 'availability_status', 'created_at'),
+        db.Index('ix_properties_created_at', 'created_at'),
+        # Occupancy report breakdown by type, covering so it never reads rows
+        db.Index('ix_properties_type_status_rent', 'property_type', 'availability_status', 'rent_amount'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     property_type = db.Column(db.String(50), nullable=False)
@@ -52,7 +67,7 @@ class Property(db.Model):
     amenities = db.Column(db.Text)
     availability_status = db.Column(db.String(20), default='available')
     image_path = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     leases = db.relationship('Lease', backref='property', lazy=True)
@@ -74,6 +89,14 @@ class Tenant(db.Model):
 
 class Lease(db.Model):
     __tablename__ = 'leases'
+    __table_args__ = (
+        # Tenant dashboard / payment form: the tenant's active lease
+        db.Index('ix_leases_tenant_status', 'tenant_id', 'status'),
+        # Owner scoping joins properties -> leases
+        db.Index('ix_leases_property_status', 'property_id', 'status'),
+        # Active-lease counts and expiry range scans
+        db.Index('ix_leases_status_end_date', 'status', 'end_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     property_id = db.Column(db.Integer, db.ForeignKey('properties.id'), nullable=False)
     tenant_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -90,12 +113,30 @@ class Lease(db.Model):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        # Owner scoping joins leases -> payments; tenant dashboard pending count.
+        # Carries amount so per-property report sums stay index-only
+        db.Index('ix_payments_lease_status_amount', 'lease_id', 'status', 'amount'),
+        db.Index('ix_payments_tenant_status', 'tenant_id', 'status'),
+        # Revenue totals by status, covering so SUM(amount) never touches the table
+        db.Index('ix_payments_status_amount', 'status', 'amount'),
+        # Monthly rent collection report
+        db.Index('ix_payments_month_status_amount', 'payment_month', 'status', 'amount'),
+        # One invoice per lease and month; the invoice generator upserts on it
+        db.Index('uq_payments_lease_month', 'lease_id', 'payment_month', unique=True),
+        # Rent-due reminders: pending invoices by due date
+        db.Index('ix_payments_status_due_date', 'status', 'due_date'),
+        # Recent payments on dashboards and the payment-date sort
+        db.Index('ix_payments_created_at', 'created_at'),
+        db.Index('ix_payments_payment_date', 'payment_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     lease_id = db.Column(db.Integer, db.ForeignKey('leases.id'), nullable=False)
     tenant_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
-    payment_date = db.Column(db.Date, nullable=False)
+    payment_date = db.Column(db.Date)  # NULL until the invoice is paid
     payment_month = db.Column(db.String(7))
+    due_date = db.Column(db.Date)
     payment_method = db.Column(db.String(50))
     transaction_id = db.Column(db.String(100))
     status = db.Column(db.String(20), default='pending')
@@ -105,6 +146,19 @@ class Payment(db.Model):
 
 class MaintenanceRequest(db.Model):
     __tablename__ = 'maintenance_requests'
+    __table_args__ = (
+        # Staff dashboard and staff-scoped list
+        db.Index('ix_maintenance_staff_status', 'staff_id', 'status'),
+        # Owner scoping joins properties -> requests; cost keeps report sums index-only
+        db.Index('ix_maintenance_property_status_cost', 'property_id', 'status', 'cost'),
+        # Tenant's own requests, newest first
+        db.Index('ix_maintenance_tenant_reported', 'tenant_id', 'reported_date'),
+        # Pending count and admin list default order
+        db.Index('ix_maintenance_status', 'status'),
+        # Maintenance report breakdown by priority
+        db.Index('ix_maintenance_priority_status_cost', 'priority', 'status', 'cost'),
+        db.Index('ix_maintenance_reported_date', 'reported_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     property_id = db.Column(db.Integer, db.ForeignKey('properties.id'), nullable=False)
     tenant_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -114,7 +168,7 @@ class MaintenanceRequest(db.Model):
     category = db.Column(db.String(50))
     priority = db.Column(db.String(20), default='medium')
     status = db.Column(db.String(20), default='pending')
-    reported_date = db.Column(db.DateTime, default=datetime.utcnow)
+    reported_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     assigned_date = db.Column(db.DateTime)
     completed_date = db.Column(db.DateTime)
     cost = db.Column(db.Float)
@@ -122,10 +176,61 @@ class MaintenanceRequest(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        # Inbox: a user's unread, then read, notifications by id (inbox.py)
+        db.Index('ix_notifications_user_read', 'user_id', 'is_read'),
+        # Retention: read notifications, oldest first (inbox.archive_read)
+        db.Index('ix_notifications_read_created', 'is_read', 'created_at'),
+        # Scheduled reminders are sent at most once per user and key
+        db.Index('uq_notifications_user_dedupe', 'user_id', 'dedupe_key', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     message = db.Column(db.Text, nullable=False)
     notification_type = db.Column(db.String(50))
     is_read = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    dedupe_key = db.Column(db.String(100))  # set by reminders.py, NULL for ad-hoc notifications
+
+class NotificationArchive(db.Model):
+    """Read notifications past the retention period, moved out of ``notifications`` by inbox.py"""
+    __tablename__ = 'notification_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # the original notification id
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    notification_type = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime)
+
+class DashboardCounter(db.Model):
+    """Pre-aggregated dashboard figures, one row per scope (maintained by counters.py)"""
+    __tablename__ = 'dashboard_counters'
+    scope = db.Column(db.String(10), primary_key=True)  # 'global', 'owner' or 'staff'
+    scope_id = db.Column(db.Integer, primary_key=True, default=0)
+    total_users = db.Column(db.Integer, nullable=False, default=0)
+    pending_users = db.Column(db.Integer, nullable=False, default=0)
+    total_properties = db.Column(db.Integer, nullable=False, default=0)
+    active_leases = db.Column(db.Integer, nullable=False, default=0)
+    completed_revenue = db.Column(db.Float, nullable=False, default=0.0)
+    pending_maintenance = db.Column(db.Integer, nullable=False, default=0)
+    in_progress_maintenance = db.Column(db.Integer, nullable=False, default=0)
+    completed_maintenance = db.Column(db.Integer, nullable=False, default=0)
+
+class PropertyFacet(db.Model):
+    """Bitmap of the properties having one facet value, per id chunk (maintained by facets.py)"""
+    __tablename__ = 'property_facets'
+    facet = db.Column(db.String(20), primary_key=True)  # 'city', 'bedrooms', 'rent', ...
+    value = db.Column(db.String(100), primary_key=True)
+    chunk = db.Column(db.Integer, primary_key=True)  # property id >> facets.CHUNK_BITS
+    bitmap = db.Column(db.LargeBinary, nullable=False)  # zlib'd, bit (id & mask) set per property
+
+class CacheGeneration(db.Model):
+    """Counter bumped whenever cached data changes, so every worker can tell its cache is stale"""
+    __tablename__ = 'cache_generations'
+    name = db.Column(db.String(50), primary_key=True)  # 'identity', ...
+    generation = db.Column(db.Integer, nullable=False, default=0)
+
+# The properties_fts index and its triggers are created and dropped with the
+# properties table; search.py registers the DDL, so every create_all needs it
+import search  # noqa: E402,F401
@@ -0,0 +1,237 @@
+"""
+Keyset (cursor) pagination shared by the list routes.
+
+Pages are addressed by the (sort column, id) pair of the last row shown
+instead of an OFFSET, so fetching page N costs the same index seek as
+fetching page 1 no matter how large the table is.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from flask import request
+from sqlalchemy import Boolean, Date, DateTime, Integer, tuple_
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 100
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(column, value):
+    if value is None:
+        return None
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Date):
+        return date.fromisoformat(value)
+    return value
+
+
+def _coerce_filter(column, value):
+    if isinstance(column.type, Boolean):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(column.type, Integer):
+        return int(value)
+    return value
+
+
+def encode_cursor(sort_value, row_id):
+    raw = json.dumps([_encode_value(sort_value), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (sort_value, id) for a cursor string, or None if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _read_cursor(sort_column, cursor):
+    decoded = decode_cursor(cursor)
+    if decoded is None or (decoded[0] is None and not sort_column.nullable):
+        return None
+    try:
+        return _decode_value(sort_column, decoded[0]), decoded[1]
+    except (TypeError, ValueError):
+        return None
+
+
+def _segments(query, sort_column, id_column, ascending, cursor):
+    """
+    The (query, key columns) runs a page is read from, in page order.
+
+    ``(NULL, id) > cursor`` is never true, so past a cursor a nullable sort
+    column is paged as two runs, each a plain index seek: its NULL rows by
+    id, which SQLite sorts before every value, and the rest by (sort
+    column, id). Runs before the cursor's are skipped and only the
+    cursor's own run is filtered on it. The first page is one query, as
+    SQLite already orders the NULLs that way.
+    """
+    if cursor is None:
+        return [(query, (sort_column, id_column))]
+    if sort_column.nullable:
+        segments = [(query.filter(sort_column.is_(None)), (id_column,)),
+                    (query.filter(sort_column.isnot(None)), (sort_column, id_column))]
+    else:
+        segments = [(query, (sort_column, id_column))]
+    if not ascending:
+        segments.reverse()
+
+    value, row_id = cursor
+    current = next(index for index, (_, columns) in enumerate(segments)
+                   if (len(columns) == 1) == (value is None))
+    segment, columns = segments[current]
+    key, bound = (id_column, row_id) if value is None else (tuple_(*columns), (value, row_id))
+    segment = segment.filter(key > bound if ascending else key < bound)
+    return [(segment, columns)] + segments[current + 1:]
+
+
+class KeysetPage:
+    """One page of results plus everything the template needs to link around it"""
+
+    def __init__(self, items, sort, order, per_page, filters,
+                 next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.sort = sort
+        self.order = order
+        self.per_page = per_page
+        self.filters = filters
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def link_args(self, **overrides):
+        """Query-string arguments for a link that keeps the current sort and filters"""
+        args = dict(self.filters)
+        args.update(sort=self.sort, order=self.order, per_page=self.per_page)
+        args.update(overrides)
+        return {key: value for key, value in args.items() if value not in (None, '')}
+
+    def sort_args(self, sort):
+        """Arguments for a column header link: toggles order on the active column"""
+        if sort == self.sort:
+            order = 'asc' if self.order == 'desc' else 'desc'
+        else:
+            order = 'asc'
+        return self.link_args(sort=sort, order=order)
+
+
+def per_page_arg(args):
+    try:
+        per_page = int(args.get('per_page', DEFAULT_PER_PAGE))
+    except (TypeError, ValueError):
+        per_page = DEFAULT_PER_PAGE
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+
+def apply_filters(query, filters, args=None):
+    """
+    Apply the whitelisted equality ``filters`` present in ``args``.
+
+    A filter maps to a column compared for equality, or to a function that
+    builds the clause from the raw value. Returns the filtered query and the
+    {name: raw value} filters in effect; values that cannot be coerced to
+    the column type (or that the function rejects with ValueError) are
+    ignored.
+    """
+    args = request.args if args is None else args
+    active_filters = {}
+    for name, column in (filters or {}).items():
+        value = args.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            if callable(column):
+                query = query.filter(column(value))
+            else:
+                query = query.filter(column == _coerce_filter(column, value))
+        except ValueError:
+            continue
+        active_filters[name] = value
+    return query, active_filters
+
+
+def keyset_paginate(query, id_column, sort_columns, default_sort,
+                    default_order='asc', filters=None, args=None):
+    """
+    Paginate ``query`` on (sort column, id) using the request's query string.
+
+    ``sort_columns`` maps the public ``sort`` parameter to a column and
+    ``filters`` maps filter parameters to columns (see ``apply_filters``).
+    Only whitelisted names are ever turned into SQL. Rows with a NULL
+    sort value come first in ascending order and last in descending order,
+    as SQLite sorts them.
+    """
+    args = request.args if args is None else args
+    filters = filters or {}
+
+    sort = args.get('sort', default_sort)
+    if sort not in sort_columns:
+        sort = default_sort
+    order = args.get('order', default_order)
+    if order not in ('asc', 'desc'):
+        order = default_order
+    per_page = per_page_arg(args)
+    sort_column = sort_columns[sort]
+
+    query, active_filters = apply_filters(query, filters, args)
+
+    cursor, forward = None, True
+    if args.get('after'):
+        cursor = _read_cursor(sort_column, args['after'])
+    elif args.get('before'):
+        cursor = _read_cursor(sort_column, args['before'])
+        forward = cursor is None
+    # Walking backwards is the same seek with the comparison and order flipped
+    ascending = (order == 'asc') == forward
+
+    rows = []
+    for segment, columns in _segments(query, sort_column, id_column, ascending, cursor):
+        order = [column.asc() if ascending else column.desc() for column in columns]
+        rows += segment.order_by(*order).limit(per_page + 1 - len(rows)).all()
+        if len(rows) > per_page:
+            break
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def cursor_for(row):
+        return encode_cursor(getattr(row, sort_column.key), getattr(row, id_column.key))
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if forward:
+            has_next, has_prev = more, cursor is not None
+        else:
+            has_next, has_prev = True, more
+        if has_next:
+            next_cursor = cursor_for(rows[-1])
+        if has_prev:
+            prev_cursor = cursor_for(rows[0])
+
+    return KeysetPage(rows, sort, order, per_page, active_filters,
+                      next_cursor=next_cursor, prev_cursor=prev_cursor)
@@ -0,0 +1,130 @@
+"""
+Password hashing off the request thread.
+
+Hashing and verifying a password is deliberately slow: one scrypt call
+keeps a core busy for tens of milliseconds. ``hash_password`` and
+``verify_password`` run Werkzeug's functions on a small process pool
+(PASSWORD_HASH_WORKERS processes), so a burst of logins uses at most that
+many cores. The GIL is released while the request thread waits, so other
+page loads in the same process carry on.
+
+At most PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE jobs are accepted at a
+time. Past that, or when a job has not finished within
+PASSWORD_HASH_TIMEOUT seconds, ``HashingBusy`` (503 with a Retry-After)
+is raised at once instead of queueing more work behind the burst.
+
+New hashes use PASSWORD_HASH_METHOD. ``needs_rehash`` tells whether a
+stored hash was made with other parameters, and ``login`` then replaces it
+while the plain password is at hand.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app, has_app_context
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import (DEFAULT_PBKDF2_ITERATIONS, check_password_hash,
+                               generate_password_hash)
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+RETRY_AFTER = 2
+
+_executor = None
+_executor_pid = None
+_slots = None
+_lock = threading.Lock()
+
+
+class HashingBusy(ServiceUnavailable):
+    """Every hashing slot is taken; the client should retry shortly"""
+    description = 'Too many sign-ins are being processed right now. Please try again in a moment.'
+
+    def __init__(self, description=None):
+        super().__init__(description, retry_after=RETRY_AFTER)
+
+
+def _settings():
+    if not has_app_context():
+        return DEFAULT_METHOD, 0, 0, None
+    config = current_app.config
+    return (config['PASSWORD_HASH_METHOD'], config['PASSWORD_HASH_WORKERS'],
+            config['PASSWORD_HASH_QUEUE'], config['PASSWORD_HASH_TIMEOUT'])
+
+
+def _pool(workers, queue):
+    global _executor, _executor_pid, _slots
+    with _lock:
+        # A pool inherited through fork() belongs to the parent: start a new one
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _executor_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(workers + queue)
+        return _executor, _slots
+
+
+def shutdown():
+    """Stop the worker processes (tests and scripts); the next job starts a new pool"""
+    global _executor
+    with _lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=True)
+        _executor = None
+
+
+def _run(function, *args):
+    method, workers, queue, timeout = _settings()
+    if not workers:
+        return function(*args)
+    executor, slots = _pool(workers, queue)
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = executor.submit(function, *args)
+    except BrokenProcessPool:
+        slots.release()
+        shutdown()
+        raise
+    try:
+        result = future.result(timeout=timeout)
+    except FutureTimeout:
+        # The job still holds a worker: keep its slot until it ends
+        future.add_done_callback(lambda _: slots.release())
+        raise HashingBusy()
+    except BaseException:
+        slots.release()
+        raise
+    slots.release()
+    return result
+
+
+def hash_password(password):
+    """A new hash of ``password`` with PASSWORD_HASH_METHOD"""
+    method = _settings()[0]
+    return _run(generate_password_hash, password, method)
+
+
+def verify_password(pwhash, password):
+    return _run(check_password_hash, pwhash, password)
+
+
+def hash_method(pwhash):
+    """The method and parameters a stored hash was made with, e.g. ``scrypt:32768:8:1``"""
+    return pwhash.split('$', 1)[0] if pwhash and '$' in pwhash else None
+
+
+def canonical_method(method):
+    """``method`` with Werkzeug's defaults filled in, as it appears in the hashes it makes"""
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return DEFAULT_METHOD
+    if name == 'pbkdf2' and len(args) < 2:
+        return f"pbkdf2:{args[0] if args else 'sha256'}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+def needs_rehash(pwhash):
+    return hash_method(pwhash) != canonical_method(_settings()[0])
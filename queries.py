@@ -0,0 +1,114 @@
+"""
+Role-scoped query builders for list, dashboard and report pages.
+
+Every relationship in models.py is lazy, so a template that touches
+``payment.payer`` or ``lease.property`` on each row would otherwise issue
+extra SELECTs per row. Each builder here applies the role scoping the
+routes used to repeat inline, plus the loader options the target template
+needs (see ``load_options``), so a page runs a fixed number of queries.
+"""
+
+from functools import lru_cache
+
+from sqlalchemy.orm import joinedload
+
+from extensions import db
+from models import Property, Lease, Payment, MaintenanceRequest
+
+
+@lru_cache(maxsize=None)
+def _load_profiles():
+    # Built on first use: the backref attributes (Payment.payer, Lease.property, ...)
+    # only exist once the mappers have been configured
+    payment_rows = (
+        joinedload(Payment.payer),
+        joinedload(Payment.lease).joinedload(Lease.property),
+    )
+    lease_rows = (joinedload(Lease.property), joinedload(Lease.tenant))
+    return {
+        'payments/list.html': payment_rows,
+        'reports/rent_collection.html': payment_rows,
+        'admin/dashboard.html:payments': (joinedload(Payment.payer),),
+        'leases/list.html': lease_rows,
+        'leases/view.html': (
+            joinedload(Lease.property).joinedload(Property.owner),
+            joinedload(Lease.tenant),
+        ),
+        'payments/add.html': lease_rows,
+        'maintenance/list.html': (
+            joinedload(MaintenanceRequest.property),
+            joinedload(MaintenanceRequest.requester),
+        ),
+        'maintenance/update.html': (
+            joinedload(MaintenanceRequest.property),
+            joinedload(MaintenanceRequest.requester),
+        ),
+        'reports/maintenance.html': (joinedload(MaintenanceRequest.property),),
+        'staff/dashboard.html': (joinedload(MaintenanceRequest.property),),
+        'reports/occupancy.html': (joinedload(Property.owner),),
+        'properties/view.html': (joinedload(Property.owner),),
+    }
+
+
+def load_options(template):
+    """Loader options for the relationships ``template`` renders on each row"""
+    return _load_profiles().get(template, ())
+
+
+def _with_profile(query, template):
+    options = load_options(template) if template else ()
+    return query.options(*options) if options else query
+
+
+def scoped_properties(user, template=None):
+    if user.role == 'admin':
+        query = Property.query
+    elif user.role == 'owner':
+        query = Property.query.filter_by(owner_id=user.id)
+    else:
+        query = Property.query.filter_by(availability_status='available')
+    return _with_profile(query, template)
+
+
+def scoped_leases(user, template=None, active_only=False):
+    if user.role == 'admin':
+        query = Lease.query
+    elif user.role == 'owner':
+        query = Lease.query.join(Property).filter(Property.owner_id == user.id)
+    elif user.role == 'tenant':
+        query = Lease.query.filter_by(tenant_id=user.id)
+    else:
+        query = Lease.query.filter(db.false())
+    if active_only:
+        query = query.filter(Lease.status == 'active')
+    return _with_profile(query, template)
+
+
+def scoped_payments(user, template=None):
+    if user.role == 'admin':
+        query = Payment.query
+    elif user.role == 'owner':
+        query = Payment.query.join(Lease).join(Property).filter(
+            Property.owner_id == user.id
+        )
+    elif user.role == 'tenant':
+        query = Payment.query.filter_by(tenant_id=user.id)
+    else:
+        query = Payment.query.filter(db.false())
+    return _with_profile(query, template)
+
+
+def scoped_maintenance(user, template=None):
+    if user.role == 'admin':
+        query = MaintenanceRequest.query
+    elif user.role == 'owner':
+        query = MaintenanceRequest.query.join(Property).filter(
+            Property.owner_id == user.id
+        )
+    elif user.role == 'tenant':
+        query = MaintenanceRequest.query.filter_by(tenant_id=user.id)
+    elif user.role == 'staff':
+        query = MaintenanceRequest.query.filter_by(staff_id=user.id)
+    else:
+        query = MaintenanceRequest.query.filter(db.false())
+    return _with_profile(query, template)
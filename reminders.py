@@ -0,0 +1,127 @@
+"""
+Lease expiry and rent-due reminders.
+
+``send_reminders`` is meant to run once a day (see the readme). It finds
+active leases ending, and pending invoices falling due, within the widest
+horizon (60, 30 and 7 days by default) using range scans on
+ix_leases_status_end_date and ix_payments_status_due_date, so the work
+scales with the number of due items rather than the size of the portfolio.
+Lease reminders go to both the tenant and the owner.
+
+An item only produces a reminder for the tightest horizon it falls in, so a
+lease first seen five days before expiry gets one 7-day reminder rather than
+three. Each notification carries a ``dedupe_key``, and the rows are inserted
+in bulk with ``ON CONFLICT DO NOTHING`` against the unique (user_id,
+dedupe_key) index. Re-running the scan, even concurrently, never sends the
+same reminder twice.
+"""
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy.dialects.sqlite import insert
+
+from extensions import db
+from models import Property, Lease, Payment, Notification
+
+HORIZONS = (60, 30, 7)
+INSERT_CHUNK = 5000
+
+
+def _horizon(days_left, horizons):
+    """The tightest horizon ``days_left`` falls in, or None"""
+    fitting = [horizon for horizon in horizons if days_left <= horizon]
+    return min(fitting) if fitting else None
+
+
+def _days(days_left):
+    if days_left == 0:
+        return 'today'
+    return 'tomorrow' if days_left == 1 else f'in {days_left} days'
+
+
+def expiring_leases(today, days):
+    """Active leases ending within ``days``: a range scan on ix_leases_status_end_date"""
+    return db.session.query(
+        Lease.id, Lease.tenant_id, Lease.end_date, Property.owner_id, Property.title
+    ).join(Property, Lease.property_id == Property.id).filter(
+        Lease.status == 'active',
+        Lease.end_date >= today,
+        Lease.end_date <= today + timedelta(days=days),
+    )
+
+
+def due_invoices(today, days):
+    """Pending invoices due within ``days``: a range scan on ix_payments_status_due_date"""
+    return db.session.query(
+        Payment.id, Payment.tenant_id, Payment.due_date, Payment.amount, Payment.payment_month
+    ).filter(
+        Payment.status == 'pending',
+        Payment.due_date >= today,
+        Payment.due_date <= today + timedelta(days=days),
+    )
+
+
+def lease_expiry_reminders(today, horizons=HORIZONS):
+    """Notification rows for the tenant and owner of each lease nearing its end"""
+    for lease_id, tenant_id, end_date, owner_id, title in expiring_leases(today, max(horizons)):
+        days_left = (end_date - today).days
+        horizon = _horizon(days_left, horizons)
+        key = f'lease_expiry:{lease_id}:{end_date.isoformat()}:{horizon}'
+        when = _days(days_left)
+        yield dict(
+            user_id=tenant_id, dedupe_key=key, notification_type='lease_renewal',
+            title='Lease Expiring Soon',
+            message=f'Your lease for {title} ends {when} ({end_date:%Y-%m-%d}). '
+                    'Contact your landlord about renewal.',
+        )
+        yield dict(
+            user_id=owner_id, dedupe_key=key, notification_type='lease_renewal',
+            title='Lease Expiring Soon',
+            message=f'The lease for {title} ends {when} ({end_date:%Y-%m-%d}).',
+        )
+
+
+def rent_due_reminders(today, horizons=HORIZONS):
+    """Notification rows for tenants with a pending invoice falling due"""
+    for payment_id, tenant_id, due_date, amount, payment_month in due_invoices(today, max(horizons)):
+        days_left = (due_date - today).days
+        horizon = _horizon(days_left, horizons)
+        yield dict(
+            user_id=tenant_id, notification_type='rent_due',
+            dedupe_key=f'rent_due:{payment_id}:{due_date.isoformat()}:{horizon}',
+            title='Rent Due',
+            message=f'Rent of ${amount:.2f} for {payment_month} is due {_days(days_left)} '
+                    f'({due_date:%Y-%m-%d}).',
+        )
+
+
+def _insert(rows, now):
+    """Bulk-insert notification rows, skipping already-sent keys; returns rows added"""
+    table = Notification.__table__
+    stmt = insert(table).on_conflict_do_nothing(
+        index_elements=[table.c.user_id, table.c.dedupe_key]
+    )
+    added = 0
+    for start in range(0, len(rows), INSERT_CHUNK):
+        chunk = [dict(row, is_read=False, created_at=now) for row in rows[start:start + INSERT_CHUNK]]
+        # sqlite3 sums rowcount over an executemany; ignored conflicts count as 0
+        added += db.session.execute(stmt, chunk).rowcount
+    return added
+
+
+def send_reminders(today=None, horizons=HORIZONS):
+    """
+    Queue lease expiry and rent-due reminders as of ``today``.
+
+    Returns {'lease_expiry': sent, 'rent_due': sent}; items already
+    reminded at their current horizon are not counted.
+    """
+    today = today or date.today()
+    horizons = tuple(sorted(set(horizons)))
+    now = datetime.utcnow()
+    result = {
+        'lease_expiry': _insert(list(lease_expiry_reminders(today, horizons)), now),
+        'rent_due': _insert(list(rent_due_reminders(today, horizons)), now),
+    }
+    db.session.commit()
+    return result
@@ -0,0 +1,192 @@
+"""
+SQL-side aggregates for the report pages.
+
+Each function returns a handful of grouped rows computed with GROUP BY in
+the database, so report cost follows the number of groups rather than the
+number of payments, properties or maintenance requests. Owners only ever
+see figures for their own properties; admins see everything.
+
+Per-property and per-owner breakdowns return the top ``limit`` groups so
+a portfolio with thousands of units still renders a short table.
+
+The ``*_rows`` queries select the flat columns of each report's detail
+table for exports (see exports.py), under the same scoping and filters.
+"""
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import aliased
+
+from extensions import db
+from models import User, Property, Lease, Payment, MaintenanceRequest
+
+BREAKDOWN_LIMIT = 25
+MONTHS_SHOWN = 24
+
+# Filters accepted by each report's detail table and its export
+PAYMENT_FILTERS = {'status': Payment.status, 'payment_month': Payment.payment_month}
+PROPERTY_FILTERS = {'status': Property.availability_status, 'property_type': Property.property_type}
+MAINTENANCE_FILTERS = {'status': MaintenanceRequest.status, 'priority': MaintenanceRequest.priority}
+
+
+def _sum_if(column, condition):
+    return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _owned_by(query, user):
+    # Per-property groupings lead with owner_id so an owner's report walks
+    # ix_properties_owner_status instead of every property
+    if user.role == 'owner':
+        query = query.filter(Property.owner_id == user.id)
+    return query
+
+
+def _payments(user, *columns, by_property=False):
+    query = db.session.query(*columns).select_from(Payment)
+    # Admin-wide totals never need the property join
+    if by_property or user.role == 'owner':
+        query = query.join(Lease).join(Property)
+    return _owned_by(query, user)
+
+
+def _payment_sums():
+    return (
+        _sum_if(Payment.amount, Payment.status == 'completed').label('collected'),
+        _sum_if(Payment.amount, Payment.status == 'pending').label('pending'),
+        func.count(Payment.id).label('payments'),
+    )
+
+
+def payment_totals(user):
+    """{status: (count, total amount)} for the user's payments"""
+    rows = _payments(user, Payment.status, func.count(Payment.id), func.sum(Payment.amount)) \
+        .group_by(Payment.status).all()
+    return {status: (count, total or 0) for status, count, total in rows}
+
+
+def payments_by_month(user, limit=MONTHS_SHOWN):
+    return _payments(user, Payment.payment_month, *_payment_sums()) \
+        .group_by(Payment.payment_month) \
+        .order_by(Payment.payment_month.desc()).limit(limit).all()
+
+
+def payments_by_property(user, limit=BREAKDOWN_LIMIT):
+    return _payments(user, Property.id, Property.title, *_payment_sums(), by_property=True) \
+        .group_by(Property.owner_id, Property.id, Property.title) \
+        .order_by(db.desc('collected'), Property.id).limit(limit).all()
+
+
+def payments_by_owner(user, limit=BREAKDOWN_LIMIT):
+    return _payments(user, User.id, User.full_name, *_payment_sums(), by_property=True) \
+        .join(User, Property.owner_id == User.id) \
+        .group_by(User.id, User.full_name) \
+        .order_by(db.desc('collected'), User.id).limit(limit).all()
+
+
+def occupancy_totals(user):
+    """{availability_status: count} for the user's properties"""
+    query = db.session.query(Property.availability_status, func.count(Property.id))
+    rows = _owned_by(query, user).group_by(Property.availability_status).all()
+    return dict(rows)
+
+
+def _occupancy_counts():
+    return (
+        func.count(Property.id).label('total'),
+        _count_if(Property.availability_status == 'occupied').label('occupied'),
+        _count_if(Property.availability_status == 'available').label('available'),
+        func.coalesce(func.sum(Property.rent_amount), 0).label('rent_roll'),
+    )
+
+
+def occupancy_by_owner(user, limit=BREAKDOWN_LIMIT):
+    query = db.session.query(User.id, User.full_name, *_occupancy_counts()) \
+        .select_from(Property).join(User, Property.owner_id == User.id)
+    return _owned_by(query, user).group_by(User.id, User.full_name) \
+        .order_by(db.desc('total'), User.id).limit(limit).all()
+
+
+def occupancy_by_type(user):
+    query = db.session.query(Property.property_type, *_occupancy_counts())
+    return _owned_by(query, user).group_by(Property.property_type) \
+        .order_by(Property.property_type).all()
+
+
+def _maintenance(user, *columns, by_property=False):
+    query = db.session.query(*columns).select_from(MaintenanceRequest)
+    if by_property or user.role == 'owner':
+        query = query.join(Property)
+    return _owned_by(query, user)
+
+
+def _maintenance_counts():
+    return (
+        func.count(MaintenanceRequest.id).label('total'),
+        _count_if(MaintenanceRequest.status == 'pending').label('pending'),
+        _count_if(MaintenanceRequest.status == 'in_progress').label('in_progress'),
+        _count_if(MaintenanceRequest.status == 'completed').label('completed'),
+        func.coalesce(func.sum(MaintenanceRequest.cost), 0).label('cost'),
+    )
+
+
+def maintenance_totals(user):
+    """{status: count} for maintenance requests on the user's properties"""
+    rows = _maintenance(user, MaintenanceRequest.status, func.count(MaintenanceRequest.id)) \
+        .group_by(MaintenanceRequest.status).all()
+    return dict(rows)
+
+
+def maintenance_by_property(user, limit=BREAKDOWN_LIMIT):
+    return _maintenance(user, Property.id, Property.title, *_maintenance_counts(), by_property=True) \
+        .group_by(Property.owner_id, Property.id, Property.title) \
+        .order_by(db.desc('total'), Property.id).limit(limit).all()
+
+
+def maintenance_by_owner(user, limit=BREAKDOWN_LIMIT):
+    return _maintenance(user, User.id, User.full_name, *_maintenance_counts(), by_property=True) \
+        .join(User, Property.owner_id == User.id) \
+        .group_by(User.id, User.full_name) \
+        .order_by(db.desc('total'), User.id).limit(limit).all()
+
+
+def maintenance_by_priority(user):
+    return _maintenance(user, MaintenanceRequest.priority, *_maintenance_counts()) \
+        .group_by(MaintenanceRequest.priority) \
+        .order_by(MaintenanceRequest.priority).all()
+
+
+# ==================== Export rows ====================
+
+def payment_rows(user):
+    tenant = aliased(User)
+    return _payments(user, Payment.id, Payment.payment_date, Payment.payment_month,
+                     tenant.full_name.label('tenant'), Property.title.label('property'),
+                     Payment.amount, Payment.late_fee, Payment.payment_method,
+                     Payment.transaction_id, Payment.status, by_property=True) \
+        .outerjoin(tenant, Payment.tenant_id == tenant.id) \
+        .order_by(Payment.id)
+
+
+def occupancy_rows(user):
+    owner = aliased(User)
+    query = db.session.query(Property.id, Property.title, Property.property_type,
+                             Property.address, Property.city, owner.full_name.label('owner'),
+                             Property.rent_amount, Property.availability_status) \
+        .select_from(Property).outerjoin(owner, Property.owner_id == owner.id)
+    return _owned_by(query, user).order_by(Property.id)
+
+
+def maintenance_rows(user):
+    tenant, staff = aliased(User), aliased(User)
+    return _maintenance(user, MaintenanceRequest.id, MaintenanceRequest.reported_date,
+                        MaintenanceRequest.title, Property.title.label('property'),
+                        tenant.full_name.label('tenant'), staff.full_name.label('staff'),
+                        MaintenanceRequest.category, MaintenanceRequest.priority,
+                        MaintenanceRequest.status, MaintenanceRequest.cost,
+                        MaintenanceRequest.completed_date, by_property=True) \
+        .outerjoin(tenant, MaintenanceRequest.tenant_id == tenant.id) \
+        .outerjoin(staff, MaintenanceRequest.staff_id == staff.id) \
+        .order_by(MaintenanceRequest.id)
@@ -1,18 +1,46 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, current_app
+"""
+The web pages, one blueprint per area of the app. ``register_blueprints`` in
+app.py imports this module the first time the app routes a request or builds
+a URL, so CLI commands never load the views or what only they use (exports,
+search, ...).
+"""
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, current_app, abort
 from flask_login import login_user, logout_user, login_required, current_user
 from extensions import db
 from models import User, Property, Tenant, Lease, Payment, MaintenanceRequest, Notification
 from datetime import datetime, timedelta
+from contextlib import ExitStack
 from functools import wraps
-import os
-from werkzeug.utils import secure_filename
-
-# Get app instance for route decorators
-def get_app():
-    return current_app._get_current_object()
-
-# Use current_app for routes - Flask will bind these when imported
-app = current_app
+from pagination import keyset_paginate
+from database import read_only
+from queries import (load_options, scoped_properties, scoped_leases, scoped_payments,
+                     scoped_maintenance)
+import reports as report_queries
+from counters import get_counters
+from exports import export_response
+from search import search_properties, MAX_PAGE
+from facets import facet_counts, rent_filter
+import events
+import images
+import importer
+import inbox
+import metrics
+import passwords
+from uploads import accepts_uploads, CSV_TYPES, IMAGE_TYPES
+
+main_bp = Blueprint('main', __name__)
+auth_bp = Blueprint('auth', __name__)
+admin_bp = Blueprint('admin', __name__)
+properties_bp = Blueprint('properties', __name__)
+leases_bp = Blueprint('leases', __name__)
+payments_bp = Blueprint('payments', __name__)
+maintenance_bp = Blueprint('maintenance', __name__)
+notifications_bp = Blueprint('notifications', __name__)
+reports_bp = Blueprint('reports', __name__)
+
+BLUEPRINTS = (main_bp, auth_bp, admin_bp, properties_bp, leases_bp, payments_bp, maintenance_bp,
+              notifications_bp, reports_bp)
 
 # Decorator for role-based access control
 def role_required(*roles):
@@ -21,23 +49,23 @@ def role_required(*roles):
         def decorated_function(*args, **kwargs):
             if not current_user.is_authenticated or current_user.role not in roles:
                 flash('You do not have permission to access this page.', 'danger')
-                return redirect(url_for('dashboard'))
+                return redirect(url_for('main.dashboard'))
             return f(*args, **kwargs)
         return decorated_function
     return decorator
 
 # ==================== Authentication Routes ====================
 
-@current_app.route('/')
+@main_bp.route('/')
 def index():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
+        return redirect(url_for('main.dashboard'))
+    return redirect(url_for('auth.login'))
 
-@current_app.route('/login', methods=['GET', 'POST'])
+@auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     if request.method == 'POST':
         username = request.form.get('username')
@@ -48,24 +76,29 @@ def login():
         if user and user.check_password(password):
             if not user.is_active:
                 flash('⚠️ Your account is pending admin approval.', 'warning')
-                return redirect(url_for('login'))
+                return redirect(url_for('auth.login'))
+            
+            # Hashes made with older parameters are upgraded while the password is at hand
+            if passwords.needs_rehash(user.password_hash):
+                user.set_password(password)
+                db.session.commit()
             
             login_user(user)
             flash(f'Welcome back, {user.full_name}!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         else:
             flash('Invalid username or password.', 'danger')
     
     return render_template('login.html')
 
-@current_app.route('/logout')
+@auth_bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out successfully.', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('auth.login'))
 
-@current_app.route('/register', methods=['GET', 'POST'])
+@auth_bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -78,11 +111,11 @@ def register():
         # Check if user exists
         if User.query.filter_by(username=username).first():
             flash('Username already exists.', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('auth.register'))
         
         if User.query.filter_by(email=email).first():
             flash('Email already registered.', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('auth.register'))
         
         # Create new user (inactive by default)
         user = User(
@@ -99,80 +132,69 @@ def register():
         db.session.commit()
         
         flash('✅ Registration successful! Please wait for admin approval.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
     
     return render_template('register.html')
 
 # ==================== Dashboard Routes ====================
 
-@current_app.route('/dashboard')
+@main_bp.route('/dashboard')
 @login_required
 def dashboard():
     if current_user.role == 'admin':
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     elif current_user.role == 'owner':
-        return redirect(url_for('owner_dashboard'))
+        return redirect(url_for('main.owner_dashboard'))
     elif current_user.role == 'tenant':
-        return redirect(url_for('tenant_dashboard'))
+        return redirect(url_for('main.tenant_dashboard'))
     elif current_user.role == 'staff':
-        return redirect(url_for('staff_dashboard'))
+        return redirect(url_for('main.staff_dashboard'))
     else:
         flash('Invalid user role.', 'danger')
-        return redirect(url_for('logout'))
+        return redirect(url_for('auth.logout'))
 
-@current_app.route('/admin/dashboard')
+@main_bp.route('/admin/dashboard')
 @login_required
 @role_required('admin')
+@read_only
 def admin_dashboard():
-    total_users = User.query.count()
-    pending_users = User.query.filter_by(is_active=False).count()
-    total_properties = Property.query.count()
-    total_leases = Lease.query.filter_by(status='active').count()
-    total_revenue = db.session.query(db.func.sum(Payment.amount)).filter_by(status='completed').scalar() or 0
-    
-    pending_maintenance = MaintenanceRequest.query.filter_by(status='pending').count()
-    recent_payments = Payment.query.order_by(Payment.created_at.desc()).limit(5).all()
+    counters = get_counters('global')
+    recent_payments = Payment.query.options(*load_options('admin/dashboard.html:payments')).order_by(
+        Payment.created_at.desc()
+    ).limit(5).all()
     recent_requests = MaintenanceRequest.query.order_by(MaintenanceRequest.reported_date.desc()).limit(5).all()
     
     return render_template('admin/dashboard.html',
-                         total_users=total_users,
-                         pending_users=pending_users,
-                         total_properties=total_properties,
-                         total_leases=total_leases,
-                         total_revenue=total_revenue,
-                         pending_maintenance=pending_maintenance,
+                         total_users=counters.total_users,
+                         pending_users=counters.pending_users,
+                         total_properties=counters.total_properties,
+                         total_leases=counters.active_leases,
+                         total_revenue=counters.completed_revenue,
+                         pending_maintenance=counters.pending_maintenance,
                          recent_payments=recent_payments,
                          recent_requests=recent_requests)
 
-@current_app.route('/owner/dashboard')
+@main_bp.route('/owner/dashboard')
 @login_required
 @role_required('owner')
+@read_only
 def owner_dashboard():
-    my_properties = Property.query.filter_by(owner_id=current_user.id).all()
-    active_leases = Lease.query.join(Property).filter(
-        Property.owner_id == current_user.id,
-        Lease.status == 'active'
-    ).count()
-    
-    total_revenue = db.session.query(db.func.sum(Payment.amount)).join(Lease).join(Property).filter(
-        Property.owner_id == current_user.id,
-        Payment.status == 'completed'
-    ).scalar() or 0
-    
-    pending_requests = MaintenanceRequest.query.join(Property).filter(
-        Property.owner_id == current_user.id,
-        MaintenanceRequest.status == 'pending'
-    ).count()
+    counters = get_counters('owner', current_user.id)
+    my_properties = Property.query.filter_by(owner_id=current_user.id).order_by(
+        Property.created_at.desc()
+    ).all()
     
     return render_template('owner/dashboard.html',
                          properties=my_properties,
-                         active_leases=active_leases,
-                         total_revenue=total_revenue,
-                         pending_requests=pending_requests)
+                         total_properties=counters.total_properties,
+                         active_leases=counters.active_leases,
+                         total_revenue=counters.completed_revenue,
+                         pending_requests=counters.pending_maintenance)
 
-@current_app.route('/tenant/dashboard')
+@main_bp.route('/tenant/dashboard')
 @login_required
 @role_required('tenant')
+@read_only
 def tenant_dashboard():
     my_lease = Lease.query.filter_by(tenant_id=current_user.id, status='active').first()
     
@@ -203,31 +225,38 @@ def tenant_dashboard():
                          recent_payments=recent_payments,
                          maintenance_requests=my_requests)
 
-@current_app.route('/staff/dashboard')
+@main_bp.route('/staff/dashboard')
 @login_required
 @role_required('staff')
+@read_only
 def staff_dashboard():
-    assigned_requests = MaintenanceRequest.query.filter_by(staff_id=current_user.id).all()
-    pending_count = sum(1 for req in assigned_requests if req.status == 'pending')
-    in_progress_count = sum(1 for req in assigned_requests if req.status == 'in_progress')
-    completed_count = sum(1 for req in assigned_requests if req.status == 'completed')
+    counters = get_counters('staff', current_user.id)
+    assigned_requests = scoped_maintenance(current_user, 'staff/dashboard.html').order_by(
+        MaintenanceRequest.reported_date.desc()
+    ).all()
     
     return render_template('staff/dashboard.html',
                          assigned_requests=assigned_requests,
-                         pending_count=pending_count,
-                         in_progress_count=in_progress_count,
-                         completed_count=completed_count)
+                         pending_count=counters.pending_maintenance,
+                         in_progress_count=counters.in_progress_maintenance,
+                         completed_count=counters.completed_maintenance)
 
 # ==================== User Management Routes ====================
 
-@current_app.route('/admin/users')
+@admin_bp.route('/admin/users')
 @login_required
 @role_required('admin')
 def manage_users():
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    page = keyset_paginate(
+        User.query, User.id,
+        sort_columns={'id': User.id, 'username': User.username, 'full_name': User.full_name,
+                      'role': User.role, 'created_at': User.created_at},
+        default_sort='id',
+        filters={'role': User.role, 'is_active': User.is_active}
+    )
+    return render_template('admin/users.html', users=page.items, page=page)
 
-@current_app.route('/admin/users/add', methods=['GET', 'POST'])
+@admin_bp.route('/admin/users/add', methods=['GET', 'POST'])
 @login_required
 @role_required('admin')
 def add_user():
@@ -247,11 +276,11 @@ def add_user():
         db.session.commit()
         
         flash('User added successfully!', 'success')
-        return redirect(url_for('manage_users'))
+        return redirect(url_for('admin.manage_users'))
     
     return render_template('admin/add_user.html')
 
-@current_app.route('/admin/users/edit/<int:user_id>', methods=['GET', 'POST'])
+@admin_bp.route('/admin/users/edit/<int:user_id>', methods=['GET', 'POST'])
 @login_required
 @role_required('admin')
 def edit_user(user_id):
@@ -272,11 +301,11 @@ def edit_user(user_id):
         
         db.session.commit()
         flash('User updated successfully!', 'success')
-        return redirect(url_for('manage_users'))
+        return redirect(url_for('admin.manage_users'))
     
     return render_template('admin/edit_user.html', user=user)
 
-@current_app.route('/admin/users/delete/<int:user_id>', methods=['POST'])
+@admin_bp.route('/admin/users/delete/<int:user_id>', methods=['POST'])
 @login_required
 @role_required('admin')
 def delete_user(user_id):
@@ -284,16 +313,16 @@ def delete_user(user_id):
     
     if user.id == current_user.id:
         flash('You cannot delete your own account.', 'danger')
-        return redirect(url_for('manage_users'))
+        return redirect(url_for('admin.manage_users'))
     
     db.session.delete(user)
     db.session.commit()
     
     flash('User deleted successfully!', 'success')
-    return redirect(url_for('manage_users'))
+    return redirect(url_for('admin.manage_users'))
 
 # 🔥 NEW: Approve User Route
-@current_app.route('/admin/users/approve/<int:user_id>', methods=['POST'])
+@admin_bp.route('/admin/users/approve/<int:user_id>', methods=['POST'])
 @login_required
 @role_required('admin')
 def approve_user(user_id):
@@ -313,25 +342,73 @@ def approve_user(user_id):
     db.session.commit()
     
     flash(f'User {user.username} has been approved successfully!', 'success')
-    return redirect(url_for('manage_users'))
+    return redirect(url_for('admin.manage_users'))
+
+@admin_bp.route('/admin/import', methods=['GET', 'POST'])
+@login_required
+@role_required('admin')
+@accepts_uploads(*CSV_TYPES)
+def import_portfolio():
+    result = None
+    if request.method == 'POST':
+        files = {kind: request.files[kind] for kind in importer.KINDS
+                 if kind in request.files and request.files[kind].filename}
+        if not files:
+            flash('Choose at least one CSV file to import.', 'warning')
+            return redirect(url_for('admin.import_portfolio'))
+        
+        # The uploads are already on disk (see uploads.py); read them from there as text
+        with ExitStack() as stack:
+            sources = {kind: stack.enter_context(open(upload.stream.path, newline='', encoding='utf-8-sig'))
+                       for kind, upload in files.items()}
+            result = importer.import_portfolio(sources, dry_run=bool(request.form.get('dry_run')))
+        
+        if result.error_count:
+            flash(f'{result.error_count} rows were rejected; see the list below.', 'warning')
+        else:
+            flash('All rows are valid.' if request.form.get('dry_run') else 'Import complete.', 'success')
+    
+    return render_template('admin/import.html', result=result, columns=importer.COLUMNS,
+                         dry_run=bool(request.form.get('dry_run')))
 
 # ==================== Property Management Routes ====================
 
-@current_app.route('/properties')
+@properties_bp.route('/properties')
 @login_required
 def properties():
-    if current_user.role == 'admin':
-        properties = Property.query.all()
-    elif current_user.role == 'owner':
-        properties = Property.query.filter_by(owner_id=current_user.id).all()
-    else:
-        properties = Property.query.filter_by(availability_status='available').all()
-    
-    return render_template('properties/list.html', properties=properties)
+    page = keyset_paginate(
+        scoped_properties(current_user, 'properties/list.html'), Property.id,
+        sort_columns={'newest': Property.created_at, 'rent': Property.rent_amount,
+                      'title': Property.title, 'id': Property.id},
+        default_sort='newest',
+        default_order='desc',
+        filters={'status': Property.availability_status, 'property_type': Property.property_type,
+                 'city': Property.city, 'state': Property.state, 'bedrooms': Property.bedrooms,
+                 'bathrooms': Property.bathrooms, 'rent': rent_filter}
+    )
+    facets, total = facet_counts(current_user, page.filters)
+    return render_template('properties/list.html', properties=page.items, page=page,
+                         facets=facets, total=total)
+
+@properties_bp.route('/properties/search')
+@login_required
+def property_search():
+    q = request.args.get('q', '').strip()
+    page_number = max(1, min(request.args.get('page', 1, type=int), MAX_PAGE))
+    results, filters, has_next = search_properties(
+        scoped_properties(current_user, 'properties/list.html'), q, request.args, page=page_number
+    )
+    return render_template('properties/search.html',
+                         properties=results,
+                         q=q,
+                         filters=filters,
+                         page_number=page_number,
+                         has_next=has_next and page_number < MAX_PAGE)
 
-@current_app.route('/properties/add', methods=['GET', 'POST'])
+@properties_bp.route('/properties/add', methods=['GET', 'POST'])
 @login_required
 @role_required('admin', 'owner')
+@accepts_uploads(*IMAGE_TYPES)
 def add_property():
     if request.method == 'POST':
         property = Property(
@@ -356,30 +433,31 @@ def add_property():
         if 'image' in request.files:
             file = request.files['image']
             if file.filename:
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-                property.image_path = filename
+                try:
+                    property.image_path = images.save_upload(file)
+                except images.InvalidImage:
+                    flash('The image was not saved: upload a JPEG, PNG, WebP or GIF file.', 'warning')
         
         db.session.add(property)
         db.session.commit()
         
         flash('Property added successfully!', 'success')
-        return redirect(url_for('properties'))
+        return redirect(url_for('properties.properties'))
     
     owners = User.query.filter_by(role='owner').all() if current_user.role == 'admin' else []
     return render_template('properties/add.html', owners=owners)
 
-@current_app.route('/properties/edit/<int:property_id>', methods=['GET', 'POST'])
+@properties_bp.route('/properties/edit/<int:property_id>', methods=['GET', 'POST'])
 @login_required
 @role_required('admin', 'owner')
+@accepts_uploads(*IMAGE_TYPES)
 def edit_property(property_id):
     property = Property.query.get_or_404(property_id)
     
     # Check ownership
     if current_user.role == 'owner' and property.owner_id != current_user.id:
         flash('You do not have permission to edit this property.', 'danger')
-        return redirect(url_for('properties'))
+        return redirect(url_for('properties.properties'))
     
     if request.method == 'POST':
         property.property_type = request.form.get('property_type')
@@ -401,18 +479,18 @@ def edit_property(property_id):
         if 'image' in request.files:
             file = request.files['image']
             if file.filename:
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-                property.image_path = filename
+                try:
+                    property.image_path = images.save_upload(file)
+                except images.InvalidImage:
+                    flash('The image was not saved: upload a JPEG, PNG, WebP or GIF file.', 'warning')
         
         db.session.commit()
         flash('Property updated successfully!', 'success')
-        return redirect(url_for('properties'))
+        return redirect(url_for('properties.properties'))
     
     return render_template('properties/edit.html', property=property)
 
-@current_app.route('/properties/delete/<int:property_id>', methods=['POST'])
+@properties_bp.route('/properties/delete/<int:property_id>', methods=['POST'])
 @login_required
 @role_required('admin', 'owner')
 def delete_property(property_id):
@@ -421,37 +499,38 @@ def delete_property(property_id):
     # Check ownership
     if current_user.role == 'owner' and property.owner_id != current_user.id:
         flash('You do not have permission to delete this property.', 'danger')
-        return redirect(url_for('properties'))
+        return redirect(url_for('properties.properties'))
     
     db.session.delete(property)
     db.session.commit()
     
     flash('Property deleted successfully!', 'success')
-    return redirect(url_for('properties'))
+    return redirect(url_for('properties.properties'))
 
-@current_app.route('/properties/<int:property_id>')
+@properties_bp.route('/properties/<int:property_id>')
 @login_required
 def view_property(property_id):
-    property = Property.query.get_or_404(property_id)
+    property = Property.query.options(*load_options('properties/view.html')).filter_by(
+        id=property_id
+    ).first_or_404()
     return render_template('properties/view.html', property=property)
 
 #  Lease Management Routes 
 
-@current_app.route('/leases')
+@leases_bp.route('/leases')
 @login_required
 def leases():
-    if current_user.role == 'admin':
-        leases = Lease.query.all()
-    elif current_user.role == 'owner':
-        leases = Lease.query.join(Property).filter(Property.owner_id == current_user.id).all()
-    elif current_user.role == 'tenant':
-        leases = Lease.query.filter_by(tenant_id=current_user.id).all()
-    else:
-        leases = []
-    
-    return render_template('leases/list.html', leases=leases)
+    page = keyset_paginate(
+        scoped_leases(current_user, 'leases/list.html'), Lease.id,
+        sort_columns={'id': Lease.id, 'start_date': Lease.start_date, 'end_date': Lease.end_date,
+                      'rent': Lease.monthly_rent},
+        default_sort='id',
+        default_order='desc',
+        filters={'status': Lease.status}
+    )
+    return render_template('leases/list.html', leases=page.items, page=page)
 
-@current_app.route('/leases/add', methods=['GET', 'POST'])
+@leases_bp.route('/leases/add', methods=['GET', 'POST'])
 @login_required
 @role_required('admin', 'owner')
 def add_lease():
@@ -463,7 +542,7 @@ def add_lease():
         property = Property.query.get(property_id)
         if property.availability_status != 'available':
             flash('Property is not available for lease.', 'danger')
-            return redirect(url_for('add_lease'))
+            return redirect(url_for('leases.add_lease'))
         
         lease = Lease(
             property_id=property_id,
@@ -494,7 +573,7 @@ def add_lease():
         db.session.commit()
         
         flash('Lease created successfully!', 'success')
-        return redirect(url_for('leases'))
+        return redirect(url_for('leases.leases'))
     
     if current_user.role == 'owner':
         properties = Property.query.filter_by(owner_id=current_user.id, availability_status='available').all()
@@ -504,96 +583,95 @@ def add_lease():
     tenants = User.query.filter_by(role='tenant').all()
     return render_template('leases/add.html', properties=properties, tenants=tenants)
 
-@current_app.route('/leases/<int:lease_id>')
+@leases_bp.route('/leases/<int:lease_id>')
 @login_required
 def view_lease(lease_id):
-    lease = Lease.query.get_or_404(lease_id)
+    lease = Lease.query.options(*load_options('leases/view.html')).filter_by(id=lease_id).first_or_404()
     
     # Check permissions
     if current_user.role == 'tenant' and lease.tenant_id != current_user.id:
         flash('You do not have permission to view this lease.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     if current_user.role == 'owner' and lease.property.owner_id != current_user.id:
         flash('You do not have permission to view this lease.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     return render_template('leases/view.html', lease=lease)
 
 # ==================== Payment Management Routes ====================
 
-@current_app.route('/payments')
+@payments_bp.route('/payments')
 @login_required
 def payments():
-    if current_user.role == 'admin':
-        payments = Payment.query.all()
-    elif current_user.role == 'owner':
-        payments = Payment.query.join(Lease).join(Property).filter(
-            Property.owner_id == current_user.id
-        ).all()
-    elif current_user.role == 'tenant':
-        payments = Payment.query.filter_by(tenant_id=current_user.id).all()
-    else:
-        payments = []
-    
-    return render_template('payments/list.html', payments=payments)
+    page = keyset_paginate(
+        scoped_payments(current_user, 'payments/list.html'), Payment.id,
+        sort_columns={'id': Payment.id, 'payment_date': Payment.payment_date, 'amount': Payment.amount},
+        default_sort='id',
+        default_order='desc',
+        filters={'status': Payment.status, 'payment_month': Payment.payment_month,
+                 'payment_method': Payment.payment_method}
+    )
+    return render_template('payments/list.html', payments=page.items, page=page)
 
-@current_app.route('/payments/add', methods=['GET', 'POST'])
+@payments_bp.route('/payments/add', methods=['GET', 'POST'])
 @login_required
 def add_payment():
     if request.method == 'POST':
-        payment = Payment(
-            lease_id=request.form.get('lease_id'),
+        lease_id = request.form.get('lease_id')
+        payment_month = request.form.get('payment_month')
+        fields = dict(
             tenant_id=request.form.get('tenant_id'),
             amount=request.form.get('amount'),
             payment_date=datetime.strptime(request.form.get('payment_date'), '%Y-%m-%d').date(),
-            payment_month=request.form.get('payment_month'),
             payment_method=request.form.get('payment_method'),
             transaction_id=request.form.get('transaction_id'),
             status='completed',
-            late_fee=request.form.get('late_fee', 0),
             notes=request.form.get('notes')
         )
-        
-        db.session.add(payment)
+        # A blank late fee keeps whatever the late-fee run assessed on the invoice
+        if request.form.get('late_fee'):
+            fields['late_fee'] = request.form.get('late_fee')
+        
+        # Settle the month's generated invoice rather than adding a second row
+        invoice = Payment.query.filter_by(lease_id=lease_id, payment_month=payment_month).first()
+        if invoice is None:
+            db.session.add(Payment(lease_id=lease_id, payment_month=payment_month, **fields))
+        elif invoice.status == 'completed':
+            flash('A payment for this lease and month has already been recorded.', 'warning')
+            return redirect(url_for('payments.payments'))
+        else:
+            for key, value in fields.items():
+                setattr(invoice, key, value)
         db.session.commit()
         
         flash('Payment recorded successfully!', 'success')
-        return redirect(url_for('payments'))
+        return redirect(url_for('payments.payments'))
     
-    if current_user.role == 'tenant':
-        leases = Lease.query.filter_by(tenant_id=current_user.id, status='active').all()
-    elif current_user.role == 'owner':
-        leases = Lease.query.join(Property).filter(
-            Property.owner_id == current_user.id,
-            Lease.status == 'active'
-        ).all()
+    if current_user.role in ('admin', 'owner', 'tenant'):
+        leases = scoped_leases(current_user, 'payments/add.html', active_only=True).all()
     else:
-        leases = Lease.query.filter_by(status='active').all()
+        leases = Lease.query.options(*load_options('payments/add.html')).filter_by(status='active').all()
     
     return render_template('payments/add.html', leases=leases)
 
 # ==================== Maintenance Routes ====================
 
-@current_app.route('/maintenance')
+@maintenance_bp.route('/maintenance')
 @login_required
 def maintenance():
-    if current_user.role == 'admin':
-        requests = MaintenanceRequest.query.all()
-    elif current_user.role == 'owner':
-        requests = MaintenanceRequest.query.join(Property).filter(
-            Property.owner_id == current_user.id
-        ).all()
-    elif current_user.role == 'tenant':
-        requests = MaintenanceRequest.query.filter_by(tenant_id=current_user.id).all()
-    elif current_user.role == 'staff':
-        requests = MaintenanceRequest.query.filter_by(staff_id=current_user.id).all()
-    else:
-        requests = []
-    
-    return render_template('maintenance/list.html', requests=requests)
+    page = keyset_paginate(
+        scoped_maintenance(current_user, 'maintenance/list.html'), MaintenanceRequest.id,
+        sort_columns={'reported': MaintenanceRequest.reported_date, 'id': MaintenanceRequest.id,
+                      'title': MaintenanceRequest.title},
+        default_sort='reported',
+        default_order='desc',
+        filters={'status': MaintenanceRequest.status, 'priority': MaintenanceRequest.priority,
+                 'category': MaintenanceRequest.category}
+    )
+    return render_template('maintenance/list.html', requests=page.items, page=page)
 
-@current_app.route('/maintenance/add', methods=['GET', 'POST'])
+@maintenance_bp.route('/maintenance/add', methods=['GET', 'POST'])
 @login_required
 @role_required('tenant')
 def add_maintenance():
@@ -611,7 +689,7 @@ def add_maintenance():
         db.session.commit()
         
         flash('Maintenance request submitted successfully!', 'success')
-        return redirect(url_for('maintenance'))
+        return redirect(url_for('maintenance.maintenance'))
     
     if current_user.role == 'tenant':
         lease = Lease.query.filter_by(tenant_id=current_user.id, status='active').first()
@@ -623,11 +701,13 @@ def add_maintenance():
     
     return render_template('maintenance/add.html', properties=properties)
 
-@current_app.route('/maintenance/update/<int:request_id>', methods=['GET', 'POST'])
+@maintenance_bp.route('/maintenance/update/<int:request_id>', methods=['GET', 'POST'])
 @login_required
 @role_required('admin', 'staff', 'owner')
 def update_maintenance(request_id):
-    maintenance_request = MaintenanceRequest.query.get_or_404(request_id)
+    maintenance_request = MaintenanceRequest.query.options(
+        *load_options('maintenance/update.html')
+    ).filter_by(id=request_id).first_or_404()
     
     if request.method == 'POST':
         maintenance_request.status = request.form.get('status')
@@ -654,113 +734,172 @@ def update_maintenance(request_id):
         db.session.commit()
         
         flash('Maintenance request updated successfully!', 'success')
-        return redirect(url_for('maintenance'))
+        return redirect(url_for('maintenance.maintenance'))
     
     staff_members = User.query.filter_by(role='staff').all()
     return render_template('maintenance/update.html', request=maintenance_request, staff=staff_members)
 
 # ==================== Notification Routes ====================
 
-@current_app.route('/notifications')
+@notifications_bp.route('/notifications')
 @login_required
 def notifications():
-    user_notifications = Notification.query.filter_by(user_id=current_user.id).order_by(
-        Notification.created_at.desc()
-    ).all()
-    return render_template('notifications.html', notifications=user_notifications)
+    page = inbox.inbox_page(current_user.id)
+    return render_template('notifications.html', notifications=page.items, page=page,
+                           notification_types=inbox.NOTIFICATION_TYPES)
+
+@notifications_bp.route('/notifications/stream')
+@login_required
+def notification_stream():
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    return current_app.response_class(
+        events.stream(current_user.id, last_event_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
-@current_app.route('/notifications/mark-read/<int:notification_id>')
+@notifications_bp.route('/notifications/mark-read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    notification_type = request.form.get('notification_type') or None
+    count = inbox.mark_read(current_user.id, notification_type)
+    flash(f'{count} notification{"" if count == 1 else "s"} marked as read.', 'success')
+    return redirect(url_for('notifications.notifications', notification_type=notification_type))
+
+@notifications_bp.route('/notifications/mark-read/<int:notification_id>', methods=['POST'])
 @login_required
 def mark_notification_read(notification_id):
     notification = Notification.query.get_or_404(notification_id)
     
     if notification.user_id != current_user.id:
         flash('Unauthorized access.', 'danger')
-        return redirect(url_for('notifications'))
+        return redirect(url_for('notifications.notifications'))
     
-    notification.is_read = True
-    db.session.commit()
+    inbox.mark_read(current_user.id, notification_id=notification_id)
     
-    return redirect(url_for('notifications'))
+    return redirect(url_for('notifications.notifications'))
 
 # ==================== Report Routes ====================
 
-@current_app.route('/reports')
+@reports_bp.route('/reports')
 @login_required
 @role_required('admin', 'owner')
 def reports():
     return render_template('reports/index.html')
 
-@current_app.route('/reports/rent-collection')
+@reports_bp.route('/reports/rent-collection')
 @login_required
 @role_required('admin', 'owner')
+@read_only
 def rent_collection_report():
-    if current_user.role == 'owner':
-        payments = Payment.query.join(Lease).join(Property).filter(
-            Property.owner_id == current_user.id
-        ).all()
-    else:
-        payments = Payment.query.all()
-    
-    total_collected = sum(p.amount for p in payments if p.status == 'completed')
-    total_pending = sum(p.amount for p in payments if p.status == 'pending')
+    totals = report_queries.payment_totals(current_user)
+    total_collected = totals.get('completed', (0, 0))[1]
+    total_pending = totals.get('pending', (0, 0))[1]
+    
+    page = keyset_paginate(
+        scoped_payments(current_user, 'reports/rent_collection.html'), Payment.id,
+        sort_columns={'id': Payment.id, 'payment_date': Payment.payment_date, 'amount': Payment.amount},
+        default_sort='payment_date',
+        default_order='desc',
+        filters=report_queries.PAYMENT_FILTERS
+    )
     
     return render_template('reports/rent_collection.html',
-                         payments=payments,
+                         payments=page.items,
+                         page=page,
+                         totals=totals,
                          total_collected=total_collected,
-                         total_pending=total_pending)
+                         total_pending=total_pending,
+                         by_month=report_queries.payments_by_month(current_user),
+                         by_property=report_queries.payments_by_property(current_user),
+                         by_owner=report_queries.payments_by_owner(current_user)
+                                  if current_user.role == 'admin' else [])
 
-@current_app.route('/reports/occupancy')
+@reports_bp.route('/reports/occupancy')
 @login_required
 @role_required('admin', 'owner')
+@read_only
 def occupancy_report():
-    if current_user.role == 'owner':
-        properties = Property.query.filter_by(owner_id=current_user.id).all()
-    else:
-        properties = Property.query.all()
-    
-    total_properties = len(properties)
-    occupied = sum(1 for p in properties if p.availability_status == 'occupied')
-    available = sum(1 for p in properties if p.availability_status == 'available')
+    totals = report_queries.occupancy_totals(current_user)
+    total_properties = sum(totals.values())
+    occupied = totals.get('occupied', 0)
+    available = totals.get('available', 0)
     
     occupancy_rate = (occupied / total_properties * 100) if total_properties > 0 else 0
     
+    page = keyset_paginate(
+        scoped_properties(current_user, 'reports/occupancy.html'), Property.id,
+        sort_columns={'id': Property.id, 'rent': Property.rent_amount, 'newest': Property.created_at},
+        default_sort='id',
+        filters=report_queries.PROPERTY_FILTERS
+    )
+    
     return render_template('reports/occupancy.html',
-                         properties=properties,
+                         properties=page.items,
+                         page=page,
                          total_properties=total_properties,
                          occupied=occupied,
                          available=available,
-                         occupancy_rate=occupancy_rate)
+                         occupancy_rate=occupancy_rate,
+                         by_type=report_queries.occupancy_by_type(current_user),
+                         by_owner=report_queries.occupancy_by_owner(current_user)
+                                  if current_user.role == 'admin' else [])
 
-@current_app.route('/reports/maintenance')
+@reports_bp.route('/reports/maintenance')
 @login_required
 @role_required('admin', 'owner')
+@read_only
 def maintenance_report():
-    if current_user.role == 'owner':
-        requests = MaintenanceRequest.query.join(Property).filter(
-            Property.owner_id == current_user.id
-        ).all()
-    else:
-        requests = MaintenanceRequest.query.all()
-    
-    pending = sum(1 for r in requests if r.status == 'pending')
-    in_progress = sum(1 for r in requests if r.status == 'in_progress')
-    completed = sum(1 for r in requests if r.status == 'completed')
+    totals = report_queries.maintenance_totals(current_user)
+    
+    page = keyset_paginate(
+        scoped_maintenance(current_user, 'reports/maintenance.html'), MaintenanceRequest.id,
+        sort_columns={'reported': MaintenanceRequest.reported_date, 'id': MaintenanceRequest.id},
+        default_sort='reported',
+        default_order='desc',
+        filters=report_queries.MAINTENANCE_FILTERS
+    )
     
     return render_template('reports/maintenance.html',
-                         requests=requests,
-                         pending=pending,
-                         in_progress=in_progress,
-                         completed=completed)
+                         requests=page.items,
+                         page=page,
+                         pending=totals.get('pending', 0),
+                         in_progress=totals.get('in_progress', 0),
+                         completed=totals.get('completed', 0),
+                         by_priority=report_queries.maintenance_by_priority(current_user),
+                         by_property=report_queries.maintenance_by_property(current_user),
+                         by_owner=report_queries.maintenance_by_owner(current_user)
+                                  if current_user.role == 'admin' else [])
+
+@reports_bp.route('/reports/<report>/export')
+@login_required
+@role_required('admin', 'owner')
+@read_only
+def export_report(report):
+    response = export_response(report, request.args.get('format', 'csv'), current_user, request.args)
+    if response is None:
+        abort(404)
+    return response
+
+# ==================== Metrics ====================
+
+@main_bp.route('/metrics')
+def prometheus_metrics():
+    if 'metrics' not in current_app.extensions:
+        abort(404)
+    if not metrics.authorized():
+        abort(403)
+    return current_app.response_class(metrics.render(metrics.get_registry()),
+                                      mimetype='text/plain; version=0.0.4')
 
 # ==================== Profile Routes ====================
 
-@current_app.route('/profile')
+@main_bp.route('/profile')
 @login_required
 def profile():
     return render_template('profile.html')
 
-@current_app.route('/profile/edit', methods=['GET', 'POST'])
+@main_bp.route('/profile/edit', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
     if request.method == 'POST':
@@ -775,22 +914,27 @@ def edit_profile():
         
         db.session.commit()
         flash('Profile updated successfully!', 'success')
-        return redirect(url_for('profile'))
+        return redirect(url_for('main.profile'))
     
     return render_template('edit_profile.html')
 
 # Error handlers
-@app.errorhandler(404)
+@main_bp.app_errorhandler(404)
 def not_found(error):
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
+@main_bp.app_errorhandler(413)
+@main_bp.app_errorhandler(415)
+def upload_rejected(error):
+    db.session.rollback()
+    return render_template('upload_rejected.html', error=error), error.code
+
+@main_bp.app_errorhandler(passwords.HashingBusy)
+def hashing_busy(error):
+    db.session.rollback()
+    return render_template('busy.html', error=error), 503, {'Retry-After': str(passwords.RETRY_AFTER)}
+
+@main_bp.app_errorhandler(500)
 def internal_error(error):
     db.session.rollback()
     return render_template('500.html'), 500
-
-def register_routes(app):
-    """Register all routes with the app"""
-    # All routes are already decorated with @current_app.route
-    # This function is here for clarity but routes are auto-registered
-    pass
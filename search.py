@@ -0,0 +1,132 @@
+"""
+Full-text property search on an SQLite FTS5 index.
+
+``properties_fts`` is an external-content FTS5 table over the text columns
+of ``properties``; it stores only the inverted index and reads the row
+text from ``properties`` itself. Triggers on ``properties`` keep it in step
+with every insert, update and delete, including bulk statements that skip
+the ORM. New databases get the table and triggers from ``create_all`` (see
+the DDL hooks below, which models.py imports); existing ones from the
+migration.
+
+Searches rank by BM25 with title matches weighted highest, treat every
+term as a prefix (``2 bed apa`` finds "2 bedroom apartment"), and combine
+with structured filters on rent, bedrooms, bathrooms and type.
+"""
+
+import re
+
+from sqlalchemy import DDL, column, event, func, literal_column, table
+
+from models import Property
+
+FTS_COLUMNS = ('title', 'description', 'amenities', 'address', 'city', 'zip_code')
+# bm25() weights, in FTS_COLUMNS order
+WEIGHTS = (10.0, 2.0, 3.0, 2.0, 5.0, 5.0)
+MAX_TERMS = 8
+MAX_PAGE = 50
+
+properties_fts = table('properties_fts', column('rowid'))
+
+_columns = ', '.join(FTS_COLUMNS)
+_new = ', '.join(f'new.{name}' for name in FTS_COLUMNS)
+_old = ', '.join(f'old.{name}' for name in FTS_COLUMNS)
+
+CREATE_STATEMENTS = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS properties_fts USING fts5("
+    f"{_columns}, content='properties', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS properties_fts_insert AFTER INSERT ON properties BEGIN "
+    f"INSERT INTO properties_fts(rowid, {_columns}) VALUES (new.id, {_new}); END",
+    f"CREATE TRIGGER IF NOT EXISTS properties_fts_delete AFTER DELETE ON properties BEGIN "
+    f"INSERT INTO properties_fts(properties_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old}); END",
+    f"CREATE TRIGGER IF NOT EXISTS properties_fts_update AFTER UPDATE OF {_columns} ON properties BEGIN "
+    f"INSERT INTO properties_fts(properties_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old}); "
+    f"INSERT INTO properties_fts(rowid, {_columns}) VALUES (new.id, {_new}); END",
+)
+REBUILD_STATEMENT = "INSERT INTO properties_fts(properties_fts) VALUES ('rebuild')"
+DROP_STATEMENTS = (
+    'DROP TRIGGER IF EXISTS properties_fts_update',
+    'DROP TRIGGER IF EXISTS properties_fts_delete',
+    'DROP TRIGGER IF EXISTS properties_fts_insert',
+    'DROP TABLE IF EXISTS properties_fts',
+)
+
+for _statement in CREATE_STATEMENTS:
+    event.listen(Property.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in DROP_STATEMENTS:
+    event.listen(Property.__table__, 'before_drop', DDL(_statement).execute_if(dialect='sqlite'))
+
+
+def match_expression(text):
+    """
+    FTS5 query for free text typed by a user, or None if it has no terms.
+
+    Every word becomes a quoted prefix term, so FTS5 operators and
+    punctuation in the input are never interpreted as query syntax.
+    """
+    terms = re.findall(r'\w+', text or '')[:MAX_TERMS]
+    # One-letter prefixes match a large part of the index; keep them exact
+    return ' '.join(f'"{term}"*' if len(term) > 1 else f'"{term}"' for term in terms) or None
+
+
+def _number(args, name, kind):
+    try:
+        return kind(args[name]) if args.get(name) not in (None, '') else None
+    except ValueError:
+        return None
+
+
+def search_query(query, text, args):
+    """
+    Filter and rank ``query`` (an already scoped Property query) by ``text``.
+
+    Structured filters come from ``args``: rent_min, rent_max, bedrooms and
+    bathrooms (minimums) and property_type. Returns (query, filters) where
+    ``filters`` holds the ones that were applied.
+    """
+    filters = {}
+    rent_min = _number(args, 'rent_min', float)
+    rent_max = _number(args, 'rent_max', float)
+    bedrooms = _number(args, 'bedrooms', int)
+    bathrooms = _number(args, 'bathrooms', int)
+    property_type = args.get('property_type') or None
+
+    if rent_min is not None:
+        query = query.filter(Property.rent_amount >= rent_min)
+        filters['rent_min'] = args['rent_min']
+    if rent_max is not None:
+        query = query.filter(Property.rent_amount <= rent_max)
+        filters['rent_max'] = args['rent_max']
+    if bedrooms is not None:
+        query = query.filter(Property.bedrooms >= bedrooms)
+        filters['bedrooms'] = args['bedrooms']
+    if bathrooms is not None:
+        query = query.filter(Property.bathrooms >= bathrooms)
+        filters['bathrooms'] = args['bathrooms']
+    if property_type:
+        query = query.filter(Property.property_type == property_type)
+        filters['property_type'] = property_type
+
+    expression = match_expression(text)
+    if expression is not None:
+        fts = literal_column('properties_fts')
+        query = query.join(properties_fts, properties_fts.c.rowid == Property.id) \
+            .filter(fts.match(expression)) \
+            .order_by(func.bm25(fts, *WEIGHTS), Property.id)
+    else:
+        query = query.order_by(Property.created_at.desc(), Property.id.desc())
+    return query, filters
+
+
+def search_properties(query, text, args, page=1, per_page=12):
+    """
+    One page of ``search_query`` results.
+
+    Returns (properties, filters, has_next) for 1-based ``page``; pages
+    past MAX_PAGE are not served, so deep offsets never scan the index.
+    """
+    query, filters = search_query(query, text, args)
+    page = max(1, min(page, MAX_PAGE))
+    rows = query.limit(per_page + 1).offset((page - 1) * per_page).all()
+    return rows[:per_page], filters, len(rows) > per_page
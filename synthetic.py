@@ -0,0 +1,265 @@
+"""
+Seeded synthetic portfolios for benchmarks, query plan checks and demos.
+
+``generate(size, seed)`` bulk-loads an empty database with owners,
+properties, leases, a payment history, maintenance requests and
+notifications. The same size, seed and ``today`` always produce the same
+rows with the same ids, so two benchmark runs, or two branches, see
+identical data.
+
+Rows are built lazily and inserted ``BATCH_SIZE`` at a time with Core
+executemany, so memory stays flat however many payments are asked for.
+The inserts skip the ORM hooks: the dashboard counters and property facets
+are rebuilt afterwards, as after a CSV import, and the tables are
+ANALYZEd so the planner sees realistic statistics.
+
+The data is skewed the way real portfolios are: a few owners hold most of
+the properties and the first staff member gets the most requests. The
+user ids ``generate`` returns are those busiest ones, the worst case to
+benchmark as.
+"""
+
+import random
+from dataclasses import dataclass, replace
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+
+from sqlalchemy import insert
+
+import counters
+import facets
+import importer
+import inbox
+import passwords
+from extensions import db
+from models import User, Property, Lease, Payment, MaintenanceRequest, Notification
+
+BATCH_SIZE = 5000
+
+PROPERTY_TYPES = ('Apartment', 'House', 'Shop', 'Office')
+CITIES = (('Springfield', 'IL'), ('Riverside', 'CA'), ('Franklin', 'TN'), ('Greenville', 'SC'),
+          ('Bristol', 'CT'), ('Clinton', 'IA'), ('Salem', 'OR'), ('Madison', 'WI'))
+MAINTENANCE_CATEGORIES = ('plumbing', 'electrical', 'hvac', 'appliances', 'structural',
+                          'pest_control', 'general', 'other')
+MAINTENANCE_PRIORITIES = ('low', 'medium', 'high', 'urgent')
+# (status, weight)
+MAINTENANCE_STATUSES = (('pending', 3), ('in_progress', 2), ('completed', 6), ('cancelled', 1))
+PAYMENT_STATUSES = (('completed', 90), ('pending', 8), ('cancelled', 2))
+
+
+@dataclass(frozen=True)
+class Size:
+    """Row counts of a portfolio
+
+    ``leases`` beyond ``properties`` become lease history. Payments stop
+    short of ``payments`` once every month the leases have run is paid.
+    """
+    owners: int = 20
+    properties: int = 500
+    leases: int = 450
+    payments: int = 5000
+    maintenance: int = 900
+    notifications: int = 2000
+    staff: int = 10
+
+    @classmethod
+    def for_payments(cls, payments):
+        """A portfolio with a year of payments per lease, sized around ``payments``"""
+        leases = max(payments // 12, 10)
+        return cls(owners=max(leases // 50, 2), properties=leases, leases=leases, payments=payments,
+                   maintenance=leases * 2, notifications=leases * 2)
+
+
+PRESETS = {
+    'small': Size(owners=5, properties=50, leases=45, payments=400, maintenance=90,
+                  notifications=200, staff=3),
+    'medium': Size(),
+    'large': Size(owners=200, properties=10000, leases=12000, payments=120000, maintenance=20000,
+                  notifications=50000, staff=40),
+}
+
+
+def scaled(size, **counts):
+    """``size`` with some counts overridden; None leaves a count as it is"""
+    return replace(size, **{name: count for name, count in counts.items() if count is not None})
+
+
+def _insert(model, rows):
+    rows = iter(rows)
+    while chunk := list(islice(rows, BATCH_SIZE)):
+        db.session.execute(insert(model), chunk)
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _skewed(rng, items):
+    # Squaring a uniform draw favours the front of the list: the first owner
+    # holds the largest share, a long tail holds a few properties each
+    return items[int(len(items) * rng.random() ** 2)]
+
+
+def _add_months(day, months):
+    months += day.month - 1
+    return date(day.year + months // 12, months % 12 + 1, 1)
+
+
+class _Portfolio:
+    def __init__(self, size, rng, today, password_hash):
+        if size.owners < 1 or size.staff < 1:
+            raise ValueError('a portfolio needs at least one owner and one staff member')
+        if size.leases and not size.properties:
+            raise ValueError('leases need properties to be let')
+        self.size, self.rng, self.today = size, rng, today
+        self.now = datetime.combine(today, time(12))
+        self.password_hash = password_hash
+        self.owners, self.tenants, self.staff = [], [], []
+        self.leases = []  # (id, property_id, tenant_id, start, end, rent, due_day, active)
+
+    def users(self):
+        yield dict(id=1, username='admin', email='admin@example.com', password_hash=self.password_hash,
+                   full_name='Admin', role='admin', is_active=True, created_at=self.now, updated_at=self.now)
+        next_id = 2
+        for role, count, bucket in (('owner', self.size.owners, self.owners),
+                                    ('tenant', self.size.leases, self.tenants),
+                                    ('staff', self.size.staff, self.staff)):
+            for _ in range(count):
+                yield dict(id=next_id, username=f'{role}{next_id}', email=f'{role}{next_id}@example.com',
+                           password_hash=self.password_hash, full_name=f'{role.title()} {next_id}',
+                           role=role, phone=f'555-{next_id:07d}',
+                           # the busiest user of each role must be able to log in
+                           is_active=not bucket or self.rng.random() > 0.02, updated_at=self.now,
+                           created_at=self.now - timedelta(days=self.rng.randint(0, 1500)))
+                bucket.append(next_id)
+                next_id += 1
+
+    def properties(self):
+        rng = self.rng
+        self.rents, self.occupied = [], set()
+        leased = min(self.size.leases, self.size.properties)
+        for i in range(1, self.size.properties + 1):
+            city, state = CITIES[int(len(CITIES) * rng.random() ** 1.5)]
+            bedrooms = rng.randint(0, 5)
+            rent = round(600 + bedrooms * 350 + rng.randint(0, 900), -1)
+            self.rents.append(rent)
+            if i > leased:
+                status = 'available'
+            else:
+                status = _weighted(rng, (('occupied', 85), ('available', 12), ('maintenance', 3)))
+            if status == 'occupied':
+                self.occupied.add(i)
+            yield dict(id=i, owner_id=_skewed(rng, self.owners), property_type=rng.choice(PROPERTY_TYPES),
+                       title=f'{city} {PROPERTY_TYPES[i % len(PROPERTY_TYPES)]} {i}',
+                       address=f'{i} {rng.choice(("Main", "Oak", "Elm", "Park", "Lake"))} Street',
+                       city=city, state=state, zip_code=f'{10000 + i % 89999:05d}',
+                       bedrooms=bedrooms, bathrooms=max(1, bedrooms - rng.randint(0, 2)),
+                       area_sqft=float(400 + bedrooms * 300 + rng.randint(0, 400)), rent_amount=rent,
+                       security_deposit=rent * 2, availability_status=status, updated_at=self.now,
+                       created_at=self.now - timedelta(days=rng.randint(400, 2000)))
+
+    def leases_rows(self):
+        # Lease k lets property k % properties; later laps over the properties
+        # are newer leases, so a property's last lease is its current one
+        rng, properties = self.rng, self.size.properties
+        for k in range(self.size.leases):
+            property_id = k % properties + 1
+            laps_after = (self.size.leases - 1 - k) // properties
+            current = laps_after == 0 and property_id in self.occupied
+            start = self.today - timedelta(days=rng.randint(0, 700) + 730 * (laps_after + (not current)))
+            end = start + timedelta(days=729)
+            rent = self.rents[property_id - 1]
+            due_day = rng.choice((1, 1, 1, 5, 15))
+            lease = (k + 1, property_id, self.tenants[k], start, end, rent, due_day, current)
+            self.leases.append(lease)
+            yield dict(id=k + 1, property_id=property_id, tenant_id=self.tenants[k], start_date=start,
+                       end_date=end, monthly_rent=rent, security_deposit=rent * 2,
+                       status='active' if current else 'expired', payment_due_day=due_day,
+                       created_at=datetime.combine(start, time(9)), updated_at=self.now)
+
+    def payments(self):
+        # One payment per lease and month, oldest month first across all
+        # leases, until the requested number is reached or every month a
+        # lease has run so far is paid
+        rng, remaining = self.rng, self.size.payments
+        months = [(min(end, self.today).year - start.year) * 12 + min(end, self.today).month - start.month + 1
+                  for _, _, _, start, end, _, _, _ in self.leases]
+        for month in range(max(months, default=0)):
+            for lease, available in zip(self.leases, months):
+                if remaining <= 0:
+                    return
+                if month >= available:
+                    continue
+                lease_id, _, tenant_id, start, _, rent, due_day, _ = lease
+                first = _add_months(start, month)
+                due = first.replace(day=due_day)
+                paid = min(due + timedelta(days=rng.randint(-3, 12)), self.today)
+                late = (paid - due).days > 5
+                method = rng.choice(importer.PAYMENT_METHODS)
+                status = _weighted(rng, PAYMENT_STATUSES)
+                remaining -= 1
+                # A pending invoice has not been paid yet, so it has no payment date
+                yield dict(lease_id=lease_id, tenant_id=tenant_id, amount=rent,
+                           payment_date=None if status == 'pending' else paid,
+                           payment_month=first.strftime('%Y-%m'), due_date=due, payment_method=method,
+                           transaction_id=f'TX{lease_id:07d}{month:02d}',
+                           status=status, late_fee=25.0 if late else 0.0,
+                           created_at=datetime.combine(paid, time(10)))
+
+    def maintenance(self):
+        rng = self.rng
+        for i in range(self.size.maintenance):
+            lease_id, property_id, tenant_id, start, end, _, _, _ = rng.choice(self.leases)
+            reported = datetime.combine(start, time(8)) + timedelta(
+                hours=rng.randint(0, max(1, (min(end, self.today) - start).days) * 24))
+            status = _weighted(rng, MAINTENANCE_STATUSES)
+            assigned = status != 'pending' or rng.random() < 0.3
+            completed = reported + timedelta(days=rng.randint(1, 20)) if status == 'completed' else None
+            yield dict(property_id=property_id, tenant_id=tenant_id,
+                       staff_id=_skewed(rng, self.staff) if assigned else None,
+                       title=f'Request {i + 1}', description='Reported through the tenant portal',
+                       category=rng.choice(MAINTENANCE_CATEGORIES), priority=rng.choice(MAINTENANCE_PRIORITIES),
+                       status=status, reported_date=reported,
+                       assigned_date=reported + timedelta(hours=rng.randint(1, 72)) if assigned else None,
+                       completed_date=completed, cost=float(rng.randint(40, 2000)) if completed else None)
+
+    def notifications(self):
+        rng = self.rng
+        recipients = self.tenants + self.owners
+        kinds = [kind for kind, _ in inbox.NOTIFICATION_TYPES]
+        for i in range(self.size.notifications):
+            kind = rng.choice(kinds)
+            yield dict(user_id=_skewed(rng, recipients) if recipients else 1,
+                       title=f'{kind.replace("_", " ").capitalize()} notice', message=f'Notice {i + 1}',
+                       notification_type=kind, is_read=rng.random() < 0.6,
+                       created_at=self.now - timedelta(minutes=rng.randint(0, 180 * 24 * 60)))
+
+
+def generate(size=PRESETS['medium'], seed=42, today=None, password=None):
+    """Bulk-load a portfolio of ``size`` into an empty database
+
+    ``today`` anchors every date (default: the current date). Users get
+    ``password`` if one is given, otherwise they cannot log in through the
+    form; benchmarks log in through the session instead. Returns
+    ``{role: user id}`` for the busiest user of each role.
+    """
+    if db.session.query(User.id).first() is not None:
+        raise ValueError('the database already has users; generate into an empty one')
+    password_hash = passwords.hash_password(password) if password else importer.UNUSABLE_PASSWORD
+    portfolio = _Portfolio(size, random.Random(seed), today or date.today(), password_hash)
+
+    _insert(User, portfolio.users())
+    _insert(Property, portfolio.properties())
+    _insert(Lease, portfolio.leases_rows())
+    _insert(Payment, portfolio.payments())
+    _insert(MaintenanceRequest, portfolio.maintenance())
+    _insert(Notification, portfolio.notifications())
+    db.session.commit()
+
+    counters.reconcile(fix=True)
+    facets.reconcile(fix=True)
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+    return {'admin': 1, 'owner': portfolio.owners[0], 'tenant': portfolio.tenants[0] if portfolio.tenants
+            else None, 'staff': portfolio.staff[0]}
@@ -0,0 +1,98 @@
+"""Dashboard counters must track route writes and agree with a full recount."""
+
+from datetime import date
+
+from conftest import make_portfolio, make_user
+from extensions import db
+from models import User, Property, Lease, MaintenanceRequest
+import counters
+
+
+def _counters(app, scope, scope_id=0):
+    with app.app_context():
+        row = counters.get_counters(scope, scope_id)
+        return {field: getattr(row, field) for field in counters.FIELDS}
+
+
+def test_counters_follow_route_writes(app, client, login):
+    with app.app_context():
+        admin = make_user('admin')
+        pending = make_user('owner', is_active=False)
+        staff = make_user('staff')
+        leaving = make_user('tenant')
+        owner = make_portfolio(2)
+        tenant = make_user('tenant')
+        prop = Property(owner_id=owner.id, property_type='House', title='Vacant',
+                        address='2 Test Street', city='Springfield', rent_amount=800,
+                        availability_status='available')
+        db.session.add(prop)
+        db.session.commit()
+        ids = dict(admin=admin.id, pending=pending.id, leaving=leaving.id, staff=staff.id, owner=owner.id,
+                   tenant=tenant.id, prop=prop.id,
+                   request=MaintenanceRequest.query.first().id)
+
+    assert _counters(app, 'global')['total_users'] == 8
+    assert _counters(app, 'global')['pending_users'] == 1
+    assert _counters(app, 'owner', ids['owner'])['completed_revenue'] == 2000
+
+    login(ids['admin'])
+    client.post(f"/admin/users/approve/{ids['pending']}")
+    client.post('/leases/add', data={
+        'property_id': ids['prop'], 'tenant_id': ids['tenant'], 'start_date': '2024-01-01',
+        'end_date': '2024-12-31', 'monthly_rent': '800', 'security_deposit': '800',
+    })
+    with app.app_context():
+        lease_id = Lease.query.filter_by(property_id=ids['prop']).one().id
+    client.post('/payments/add', data={
+        'lease_id': lease_id, 'tenant_id': ids['tenant'], 'amount': '800.50',
+        'payment_date': '2024-02-01', 'payment_month': '2024-02', 'payment_method': 'cash',
+    })
+    client.post(f"/maintenance/update/{ids['request']}", data={
+        'status': 'in_progress', 'staff_id': str(ids['staff']), 'cost': '120',
+    })
+    client.post(f"/admin/users/delete/{ids['leaving']}")
+
+    owner_row = _counters(app, 'owner', ids['owner'])
+    assert owner_row['total_properties'] == 3
+    assert owner_row['active_leases'] == 3
+    assert owner_row['completed_revenue'] == 2800.5
+    assert owner_row['pending_maintenance'] == 1
+    assert owner_row['in_progress_maintenance'] == 1
+
+    global_row = _counters(app, 'global')
+    assert global_row['total_users'] == 7
+    assert global_row['pending_users'] == 0
+
+    staff_row = _counters(app, 'staff', ids['staff'])
+    assert staff_row['in_progress_maintenance'] == 1
+
+    with app.app_context():
+        assert counters.reconcile(fix=False) == []
+
+
+def test_reconcile_repairs_drift(app):
+    with app.app_context():
+        owner = make_portfolio(2)
+        # Bulk statements skip the ORM hooks, so the counters fall behind
+        Lease.query.update({'status': 'expired'})
+        db.session.commit()
+
+        drift = counters.reconcile(fix=False)
+        assert ('owner', owner.id, 'active_leases', 2, 0) in drift
+        assert counters.get_counters('owner', owner.id).active_leases == 2
+
+        assert counters.reconcile() == drift
+        db.session.expire_all()
+        assert counters.get_counters('owner', owner.id).active_leases == 0
+        assert counters.reconcile(fix=False) == []
+
+
+def test_dashboards_read_one_counter_row(app, client, login):
+    with app.app_context():
+        owner = make_portfolio(8)
+        owner_id = owner.id
+
+    login(owner_id)
+    response = client.get('/owner/dashboard')
+    assert response.status_code == 200
+    assert response.data.count(b'<h5 class="card-title">Unit ') == 8  # every property, not a page of them
@@ -0,0 +1,207 @@
+"""
+SQLite connection tuning: PRAGMAs, pool settings and environment overrides,
+the read-only bind reports and dashboards read from, and the schema check
+at start-up.
+"""
+
+import os
+import shutil
+
+import pytest
+from alembic.script import ScriptDirectory
+from flask_migrate import Migrate, stamp, upgrade
+from sqlalchemy import inspect
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+
+import database
+from app import create_app
+from conftest import make_user
+from extensions import db
+from models import Property
+
+
+def _pragma(name):
+    return db.session.execute(db.text(f'PRAGMA {name}')).scalar()
+
+
+def _file_app(tmp_path, **config):
+    return create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/tuned.db', **config})
+
+
+def test_file_database_gets_wal_and_pragmas(tmp_path):
+    app = _file_app(tmp_path)
+    with app.app_context():
+        assert _pragma('journal_mode') == 'wal'
+        assert _pragma('busy_timeout') == 5000
+        assert _pragma('synchronous') == 1  # NORMAL
+        assert _pragma('cache_size') == -65536
+        assert _pragma('mmap_size') == 268435456
+        assert _pragma('temp_store') == 2  # MEMORY
+        assert db.engine.pool.size() == 10
+        assert event.contains(db.engine, 'close', database._optimize)
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_unset_pragmas_keep_sqlite_defaults(tmp_path):
+    app = _file_app(tmp_path, SQLITE_JOURNAL_MODE=None, SQLITE_MMAP_SIZE=None)
+    with app.app_context():
+        assert _pragma('journal_mode') == 'delete'
+        assert _pragma('mmap_size') == 0
+        assert _pragma('busy_timeout') == 5000
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_in_memory_database_skips_file_settings(app):
+    with app.app_context():
+        assert _pragma('journal_mode') == 'memory'
+        assert _pragma('busy_timeout') == 5000
+        assert 'pool_size' not in app.config['SQLALCHEMY_ENGINE_OPTIONS']
+        assert database.READ_BIND not in db.engines
+
+
+def test_environment_overrides_defaults(tmp_path, monkeypatch):
+    monkeypatch.setenv('RMS_SQLITE_BUSY_TIMEOUT', '1234')
+    monkeypatch.setenv('RMS_DATABASE_POOL_SIZE', '3')
+    app = _file_app(tmp_path)
+    assert app.config['SQLITE_BUSY_TIMEOUT'] == 1234
+    with app.app_context():
+        assert _pragma('busy_timeout') == 1234
+        assert db.engine.pool.size() == 3
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_read_bind_opens_the_file_read_only(tmp_path):
+    app = _file_app(tmp_path)
+    url = database.read_only_uri('sqlite:///a.db')
+    assert (url.database, dict(url.query)) == ('file:a.db', {'mode': 'ro', 'uri': 'true'})
+    with app.app_context():
+        read_engine = db.engines[database.READ_BIND]
+        assert read_engine.pool.size() == 10
+        with read_engine.connect() as connection:
+            assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+            assert connection.exec_driver_sql('PRAGMA query_only').scalar() == 1
+            with pytest.raises(OperationalError, match='readonly'):
+                connection.exec_driver_sql("INSERT INTO cache_generations VALUES ('x', 1)")
+        db.session.remove()
+        db.engine.dispose()
+        read_engine.dispose()
+
+
+def _add_property(app, title):
+    with app.app_context():
+        owner = make_user('owner')
+        db.session.flush()
+        db.session.add(Property(owner_id=owner.id, property_type='House', title=title,
+                                address='1 Test Street', city='Springfield', rent_amount=1000))
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_reports_read_the_replica_until_the_user_writes(tmp_path):
+    # A stale replica makes it visible which bind a page was read from
+    (tmp_path / 'replica').mkdir()
+    _add_property(_file_app(tmp_path / 'replica'), 'Replica Tower')
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/primary.db',
+                      'DATABASE_READ_URI': f'sqlite:///{tmp_path}/replica/tuned.db'})
+    _add_property(app, 'Primary House')
+    with app.app_context():
+        admin = make_user('admin')
+        db.session.commit()
+        admin_id = admin.id
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+
+    page = client.get('/reports/occupancy').data
+    assert b'Replica Tower' in page and b'Primary House' not in page
+    assert b'Primary House' in client.get('/properties').data  # not a read-only view
+
+    # After writing, the user reads their own changes from the primary
+    assert client.post('/notifications/mark-read').status_code == 302
+    page = client.get('/reports/occupancy').data
+    assert b'Primary House' in page and b'Replica Tower' not in page
+
+    with client.session_transaction() as session:
+        session[database.WROTE_AT] -= 60
+    assert b'Replica Tower' in client.get('/reports/occupancy').data
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS = os.path.join(HERE, 'migrations')
+# The database the app shipped with before migrations, at the initial schema revision
+BASELINE_DB = os.path.join(HERE, 'instance', 'rental_management.db')
+
+
+def test_schema_revision_is_the_migration_head():
+    assert ScriptDirectory(MIGRATIONS).get_current_head() == database.SCHEMA_REVISION
+
+
+def _revision(app, set_to=None):
+    with app.app_context():
+        with db.engine.begin() as connection:
+            if set_to is not None:
+                connection.execute(db.text('UPDATE alembic_version SET version_num = :revision'),
+                                   {'revision': set_to})
+            revision = database.schema_revision(connection)
+        db.session.remove()
+        db.engine.dispose()
+    return revision
+
+
+def test_schema_is_created_once(tmp_path, monkeypatch, caplog):
+    assert _revision(_file_app(tmp_path)) == database.SCHEMA_REVISION
+
+    # A restart reads the revision and leaves the tables alone
+    def create_all(self, *args, **kwargs):
+        raise AssertionError('create_all on an existing database')
+    monkeypatch.setattr(SQLAlchemy, 'create_all', create_all)
+    _revision(_file_app(tmp_path), set_to='f2a9c64e7b18')
+    assert _revision(_file_app(tmp_path)) == 'f2a9c64e7b18'  # upgrading is left to flask db upgrade
+    assert 'at migration f2a9c64e7b18' in caplog.text
+
+
+
+def test_upgrade_after_create_all(tmp_path):
+    path = tmp_path / 'baseline.db'
+    shutil.copy(BASELINE_DB, path)
+    # Releases before migrations ran create_all on every start, making any new tables
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(db.text('CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL)'))
+        connection.execute(db.text("INSERT INTO alembic_version VALUES ('6a1d0c3e9f21')"))
+    engine.dispose()
+
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    Migrate(app, db, directory=MIGRATIONS)
+    with app.app_context():
+        upgrade()
+    assert _revision(app) == database.SCHEMA_REVISION
+
+
+def test_unstamped_database_is_left_for_the_upgrade(tmp_path, caplog):
+    path = tmp_path / 'baseline.db'
+    shutil.copy(BASELINE_DB, path)
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    assert f'flask db stamp {database.BASELINE_REVISION}' in caplog.text
+    with app.app_context():
+        assert not inspect(db.engine).has_table('cache_generations')
+
+        # The commands the warning names bring it to the head, backfills included
+        Migrate(app, db, directory=MIGRATIONS)
+        stamp(revision=database.BASELINE_REVISION)
+        upgrade()
+        assert db.session.execute(db.text('SELECT COUNT(*) FROM dashboard_counters')).scalar()
+        assert db.session.execute(db.text('SELECT COUNT(*) FROM properties_fts')).scalar() == \
+            Property.query.count() > 0
+    assert _revision(app) == database.SCHEMA_REVISION
@@ -0,0 +1,292 @@
+"""
+Live notification stream: pushes from routes and other workers, replay on
+reconnect, and thousands of concurrent streams on a gevent server of their
+own.
+"""
+
+import json
+import os
+import runpy
+import selectors
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import events
+from app import create_app
+from conftest import make_portfolio, make_user
+from extensions import db
+from models import MaintenanceRequest, Notification
+
+STREAM = '/notifications/stream'
+
+
+@pytest.fixture
+def live_app(tmp_path):
+    # The hub polls from its own thread, which an in-memory database can't share
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/live.db',
+        'SSE_HEARTBEAT': 0.02,
+        'SSE_POLL_INTERVAL': 0.05,
+        'SSE_MAX_AGE': 10,
+    })
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def _client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    return client
+
+
+def _open(client, **kwargs):
+    response = client.get(STREAM, buffered=False, **kwargs)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    return response, iter(response.response)
+
+
+def _events(chunk):
+    """[(event, data)] in an event-stream chunk"""
+    found = []
+    for block in chunk.decode().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if line and not line.startswith(':'))
+        if 'event' in fields:
+            found.append((fields['event'], json.loads(fields['data'])))
+    return found
+
+
+def _next_notification(body, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for name, data in _events(next(body)):
+            if name == 'notification':
+                return data
+    raise AssertionError('no notification was pushed')
+
+
+def test_stream_opens_with_the_unread_count(live_app):
+    with live_app.app_context():
+        tenant = make_user('tenant')
+        db.session.flush()
+        db.session.add_all([Notification(user_id=tenant.id, title=f'N{n}', message='m') for n in range(3)])
+        db.session.add(Notification(user_id=tenant.id, title='Read', message='m', is_read=True))
+        db.session.commit()
+        tenant_id = tenant.id
+
+    response, body = _open(_client(live_app, tenant_id))
+    first = next(body)
+    assert first.startswith(b'retry: ')
+    assert _events(first) == [('unread', {'unread': 3})]
+    response.close()
+    assert len(live_app.extensions['notification_hub']) == 0
+
+
+def test_update_maintenance_pushes_to_the_tenant(live_app):
+    with live_app.app_context():
+        admin = make_user('admin')
+        make_portfolio(1)
+        request = MaintenanceRequest.query.first()
+        request_id, tenant_id, admin_id = request.id, request.tenant_id, admin.id
+
+    response, body = _open(_client(live_app, tenant_id))
+    next(body)
+
+    admin_client = _client(live_app, admin_id)
+    posted = admin_client.post(f'/maintenance/update/{request_id}',
+                               data={'status': 'in_progress', 'resolution_notes': '', 'cost': '0'})
+    assert posted.status_code == 302
+
+    data = _next_notification(body)
+    assert data['title'] == 'Maintenance Request Updated'
+    assert 'in_progress' in data['message']
+    assert data['unread'] == 1
+    response.close()
+
+
+def test_notifications_from_other_workers_arrive(live_app):
+    with live_app.app_context():
+        tenant = make_user('tenant')
+        db.session.commit()
+        tenant_id = tenant.id
+
+    response, body = _open(_client(live_app, tenant_id))
+    next(body)
+
+    # A second app on the same database stands in for another worker process
+    other = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': live_app.config['SQLALCHEMY_DATABASE_URI']})
+    with other.app_context():
+        db.session.add(Notification(user_id=tenant_id, title='Rent due', message='Pay up'))
+        db.session.commit()
+        db.engine.dispose()
+
+    assert _next_notification(body)['title'] == 'Rent due'
+    response.close()
+
+
+def test_reconnect_replays_missed_notifications(live_app):
+    with live_app.app_context():
+        tenant = make_user('tenant')
+        db.session.flush()
+        seen = Notification(user_id=tenant.id, title='Seen', message='m')
+        db.session.add(seen)
+        db.session.flush()
+        db.session.add_all([Notification(user_id=tenant.id, title=f'Missed {n}', message='m') for n in range(2)])
+        db.session.commit()
+        tenant_id, seen_id = tenant.id, seen.id
+
+    response, body = _open(_client(live_app, tenant_id), headers={'Last-Event-ID': str(seen_id)})
+    replayed = _events(next(body))
+    assert [data['title'] for name, data in replayed if name == 'notification'] == ['Missed 0', 'Missed 1']
+    assert replayed[-1] == ('unread', {'unread': 3})
+    response.close()
+
+
+def _stopped_hub(app, monkeypatch):
+    # The test polls by hand, at the moments it picks
+    monkeypatch.setattr(events.Hub, '_run', lambda self: None)
+    return app.extensions['notification_hub']
+
+
+def test_notification_committed_while_the_stream_opens_is_pushed(live_app, monkeypatch):
+    hub = _stopped_hub(live_app, monkeypatch)
+    with live_app.app_context():
+        tenant = make_user('tenant')
+        db.session.commit()
+        subscription = hub.subscribe(tenant.id)
+        # Committed before the hub's first poll, which used to only note the latest id
+        db.session.add(Notification(user_id=tenant.id, title='Just in time', message='m'))
+        db.session.commit()
+    hub.poll()
+    assert [data['title'] for name, data in _events(''.join(subscription.wait(0)).encode())] == ['Just in time']
+
+
+def test_replayed_notifications_are_not_pushed_again(live_app, monkeypatch):
+    hub = _stopped_hub(live_app, monkeypatch)
+    with live_app.app_context():
+        tenant = make_user('tenant')
+        db.session.flush()
+        seen = Notification(user_id=tenant.id, title='Seen', message='m')
+        db.session.add(seen)
+        db.session.commit()
+        tenant_id, seen_id = tenant.id, seen.id
+        hub.last_id = seen_id  # the hub is behind the rows below when the tab reconnects
+        db.session.add_all([Notification(user_id=tenant_id, title=f'Missed {n}', message='m') for n in range(2)])
+        db.session.commit()
+
+        body = events.stream(tenant_id, seen_id)
+        replayed = _events(next(body).encode())
+        assert [data['title'] for name, data in replayed if name == 'notification'] == ['Missed 0', 'Missed 1']
+        db.session.add(Notification(user_id=tenant_id, title='New', message='m'))
+        db.session.commit()
+    hub.poll()
+    assert [data['title'] for name, data in _events(next(body).encode())] == ['New']
+    body.close()
+    assert len(hub) == 0
+
+
+# A gevent server, as gunicorn_events.conf.py runs the app, in a process of its own
+SERVER = '''
+from gevent import monkey
+monkey.patch_all()
+import json, sys
+from gevent.pywsgi import WSGIServer
+from app import create_app
+application = create_app(json.loads(sys.argv[1]))
+server = WSGIServer(('127.0.0.1', 0), application, log=None, backlog=1024)
+server.start()
+print(server.server_port, flush=True)
+server.serve_forever()
+'''
+
+
+def _threads(pid):
+    with open(f'/proc/{pid}/status') as status:
+        return next(int(line.split()[1]) for line in status if line.startswith('Threads:'))
+
+
+def _read_until(sockets, marker, timeout):
+    """Read every socket until it has sent ``marker``; the ones that have not by ``timeout``"""
+    waiting = {sock: b'' for sock in sockets}
+    deadline = time.monotonic() + timeout
+    with selectors.DefaultSelector() as selector:
+        for sock in sockets:
+            selector.register(sock, selectors.EVENT_READ)
+        while waiting and time.monotonic() < deadline:
+            for key, _ in selector.select(timeout=0.5):
+                sock = key.fileobj
+                waiting[sock] += sock.recv(65536)
+                if marker(sock) in waiting[sock]:
+                    del waiting[sock]
+                    selector.unregister(sock)
+    return list(waiting)
+
+
+def test_streams_have_their_own_gevent_workers():
+    here = os.path.dirname(os.path.abspath(__file__))
+    pages = runpy.run_path(os.path.join(here, 'gunicorn.conf.py'))
+    streams = runpy.run_path(os.path.join(here, 'gunicorn_events.conf.py'))
+    # Image resizing, password hashing and SQLite waits must not block other requests' event loop
+    assert pages['worker_class'] == 'gthread' and pages['threads'] > 1
+    assert streams['worker_class'] == 'gevent' and streams['worker_connections'] >= 5000
+    assert pages['bind'] != streams['bind']
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/status'), reason='counts threads through /proc')
+def test_five_thousand_concurrent_streams(tmp_path):
+    pytest.importorskip('gevent')
+    users, tabs = 50, 100
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/live.db',
+              'SSE_HEARTBEAT': 60, 'SSE_POLL_INTERVAL': 0.1, 'SSE_MAX_AGE': 300}
+    app = create_app(config)
+    with app.app_context():
+        tenants = [make_user('tenant') for _ in range(users)]
+        db.session.commit()
+        user_ids = [tenant.id for tenant in tenants]
+    cookies = {}
+    for user_id in user_ids:
+        client = _client(app, user_id)
+        cookies[user_id] = client.get_cookie('session').value
+
+    server = subprocess.Popen([sys.executable, '-c', SERVER, json.dumps(config)],
+                              cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.PIPE, text=True)
+    sockets, user_of = [], {}
+    try:
+        port = int(server.stdout.readline())
+        # Every tab connects and stays connected, each blocked in the server waiting for events
+        for user_id in user_ids:
+            batch = []
+            for _ in range(tabs):
+                sock = socket.create_connection(('127.0.0.1', port))
+                sock.sendall(f'GET {STREAM} HTTP/1.1\r\nHost: localhost\r\n'
+                             f'Cookie: session={cookies[user_id]}\r\n\r\n'.encode())
+                batch.append(sock)
+                user_of[sock] = user_id
+            assert _read_until(batch, lambda sock: b'event: unread', 30) == []
+            sockets += batch
+        # One process, a handful of threads: the streams are greenlets
+        assert _threads(server.pid) <= 5
+
+        with app.app_context():
+            db.session.add_all([Notification(user_id=user_id, title=f'For {user_id}', message='m')
+                                for user_id in user_ids])
+            db.session.commit()
+        started = time.monotonic()
+        assert _read_until(sockets, lambda sock: f'"title": "For {user_of[sock]}"'.encode(), 30) == []
+        assert time.monotonic() - started < 10
+    finally:
+        for sock in sockets:
+            sock.close()
+        server.terminate()
+        server.wait()
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
@@ -0,0 +1,117 @@
+"""Report exports must stream, respect scoping and filters, and produce valid files."""
+
+import csv
+import io
+import tracemalloc
+import zipfile
+from datetime import date
+from xml.etree import ElementTree
+
+from sqlalchemy import insert
+
+from conftest import make_portfolio, make_user
+from extensions import db
+from models import User, Lease, Payment
+import exports
+import reports
+
+SHEET_NS = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+
+def _setup(app):
+    with app.app_context():
+        admin = make_user('admin')
+        owner = make_portfolio(3)
+        make_portfolio(2)
+        Payment.query.filter(Payment.id == 1).update({'status': 'pending'})
+        db.session.commit()
+        return admin.id, owner.id
+
+
+def test_csv_export_is_scoped_and_filtered(app, client, login):
+    admin_id, owner_id = _setup(app)
+
+    login(admin_id)
+    response = client.get('/reports/rent-collection/export?format=csv')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'text/csv'
+    assert 'attachment; filename="rent-collection-' in response.headers['Content-Disposition']
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0][:3] == ['ID', 'Date', 'Month']
+    assert len(rows) == 6
+
+    response = client.get('/reports/rent-collection/export?format=csv&status=completed')
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == 5
+    assert {row[-1] for row in rows[1:]} == {'completed'}
+
+    login(owner_id)
+    response = client.get('/reports/maintenance/export')
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == 4
+
+    assert client.get('/reports/rent-collection/export?format=pdf').status_code == 404
+    assert client.get('/reports/unknown/export').status_code == 404
+
+
+def test_xlsx_export_is_a_workbook(app, client, login):
+    admin_id, _ = _setup(app)
+
+    login(admin_id)
+    response = client.get('/reports/occupancy/export?format=xlsx')
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    assert archive.testzip() is None
+    assert {'[Content_Types].xml', 'xl/workbook.xml', 'xl/worksheets/sheet1.xml'} <= set(archive.namelist())
+
+    sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+    rows = sheet.findall('.//s:row', SHEET_NS)
+    assert len(rows) == 6
+    assert rows[0].find('.//s:t', SHEET_NS).text == 'ID'
+
+
+def test_xlsx_rolls_over_to_new_sheets(app, monkeypatch):
+    monkeypatch.setattr(exports, 'XLSX_MAX_ROWS', 3)
+    admin_id, _ = _setup(app)
+    with app.app_context():
+        admin = db.session.get(User, admin_id)
+        data = b''.join(exports.stream_xlsx(['ID'], reports.payment_rows(admin)))
+
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    sheets = sorted(name for name in archive.namelist() if name.startswith('xl/worksheets/'))
+    # 5 payments, 2 data rows under the header per sheet
+    assert len(sheets) == 3
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    assert len(workbook.findall('.//s:sheet', SHEET_NS)) == 3
+
+
+def test_export_memory_stays_flat(app):
+    admin_id, _ = _setup(app)
+    with app.app_context():
+        lease = Lease.query.first()
+        # Distinct (lease, month) pairs: one invoice per lease and month
+        rows = [dict(lease_id=lease.id, tenant_id=lease.tenant_id, amount=1000,
+                     payment_date=date(2024, 3, 1), payment_month=f'{3000 + i // 12}-{i % 12 + 1:02d}',
+                     payment_method='cash', status='completed')
+                for i in range(60000)]
+        db.session.execute(insert(Payment), rows)
+        db.session.commit()
+        del rows
+        admin = db.session.get(User, admin_id)
+
+        def peak(limit):
+            query = reports.payment_rows(admin).limit(limit)
+            tracemalloc.start()
+            try:
+                size = sum(len(chunk) for chunk in exports.stream_csv(['ID'], query))
+                return size, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        small_size, small_peak = peak(6000)
+        large_size, large_peak = peak(60000)
+
+    assert large_size > 9 * small_size
+    # Ten times the rows must not mean ten times the memory
+    assert large_peak < 2 * small_peak
@@ -0,0 +1,175 @@
+"""Facet counts must follow property writes and match a GROUP BY recount."""
+
+from conftest import make_user, count_queries
+from extensions import db
+from models import Property
+import facets
+
+
+def _property(owner, **fields):
+    fields.setdefault('property_type', 'House')
+    fields.setdefault('city', 'Springfield')
+    fields.setdefault('rent_amount', 1000)
+    fields.setdefault('availability_status', 'available')
+    prop = Property(owner_id=owner.id, title='Unit', address='1 Test Street', **fields)
+    db.session.add(prop)
+    return prop
+
+
+def _options(options):
+    return {value: count for value, _, count in options}
+
+
+def test_facets_follow_route_writes(app, client, login):
+    with app.app_context():
+        admin = make_user('admin')
+        owner = make_user('owner')
+        tenant = make_user('tenant')
+        db.session.flush()
+        vacant = _property(owner, bedrooms=2, rent_amount=1200)
+        _property(owner, city='Shelbyville', bedrooms=3, rent_amount=2500)
+        doomed = _property(owner, property_type='Shop', rent_amount=400)
+        db.session.commit()
+        ids = dict(admin=admin.id, tenant=tenant.id, vacant=vacant.id, doomed=doomed.id)
+
+    login(ids['admin'])
+    client.post('/leases/add', data={
+        'property_id': ids['vacant'], 'tenant_id': ids['tenant'], 'start_date': '2024-01-01',
+        'end_date': '2024-12-31', 'monthly_rent': '1200', 'security_deposit': '1200',
+    })
+    client.post(f"/properties/delete/{ids['doomed']}")
+
+    with app.app_context():
+        assert facets.reconcile(fix=False) == []
+        prop = db.session.get(Property, ids['vacant'])
+        prop.rent_amount = 3100
+        prop.city = 'Capital City'
+        db.session.commit()
+        assert facets.reconcile(fix=False) == []
+
+        counts, total = facets.facet_counts(db.session.get(type(admin), ids['admin']), {})
+        assert total == 2
+        assert _options(counts['status']) == {'available': 1, 'occupied': 1}
+        assert _options(counts['rent']) == {'2000': 1, '3000': 1}
+        assert 'Shop' not in _options(counts['property_type'])
+
+
+def test_counts_apply_the_other_filters(app):
+    with app.app_context():
+        owner = make_user('owner')
+        other = make_user('owner')
+        tenant = make_user('tenant')
+        db.session.flush()
+        _property(owner, bedrooms=1, rent_amount=700)
+        _property(owner, bedrooms=2, rent_amount=1100)
+        _property(owner, bedrooms=2, rent_amount=1300, city='Shelbyville')
+        _property(other, bedrooms=2, rent_amount=1100, availability_status='occupied')
+        db.session.commit()
+
+        counts, total = facets.facet_counts(tenant, {'bedrooms': '2', 'city': 'Springfield'})
+        assert total == 1
+        # Each facet ignores its own selection but honours the others
+        assert _options(counts['bedrooms']) == {'1': 1, '2': 1}
+        assert _options(counts['city']) == {'Springfield': 1, 'Shelbyville': 1}
+        assert _options(counts['status']) == {'available': 1}
+
+        counts, total = facets.facet_counts(other, {})
+        assert total == 1
+        assert _options(counts['status']) == {'occupied': 1}
+        assert facets.rent_label(1000) == '$1,000-$1,499'
+        assert facets.rent_label(3000) == '$3,000+'
+
+
+def test_listing_reads_facets_in_one_lookup(app, client, login):
+    with app.app_context():
+        owner = make_user('owner')
+        tenant = make_user('tenant')
+        db.session.flush()
+        _property(owner, rent_amount=900)
+        _property(owner, rent_amount=1600)
+        db.session.commit()
+        tenant_id = tenant.id
+        engine = db.engine
+
+    login(tenant_id)
+    with count_queries(engine) as statements:
+        body = client.get('/properties?rent=1500').get_data(as_text=True)
+    assert '$1,500-$1,999 (1)' in body
+    assert '$500-$999 (1)' in body
+    assert '1 property match' in body
+    assert len([s for s in statements if 'property_facets' in s]) == 1
+
+
+
+def test_bitmaps_span_id_chunks(app):
+    with app.app_context():
+        owner = make_user('owner')
+        tenant = make_user('tenant')
+        db.session.flush()
+        _property(owner, bedrooms=2)
+        far = _property(owner, id=(1 << facets.CHUNK_BITS) + 5, bedrooms=2)
+        db.session.commit()
+
+        counts, total = facets.facet_counts(tenant, {'bedrooms': '2'})
+        assert total == 2
+        assert {chunk for _, _, chunk, _ in db.session.execute(
+            facets.PropertyFacet.__table__.select().where(
+                facets.PropertyFacet.facet == 'bedrooms'))} == {0, 1}
+
+        db.session.delete(far)
+        db.session.commit()
+        assert facets.facet_counts(tenant, {'bedrooms': '2'})[1] == 1
+        assert facets.reconcile(fix=False) == []
+
+
+def test_bitmaps_are_stored_compressed(app):
+    with app.app_context():
+        owner = make_user('owner')
+        other = make_user('owner')
+        tenant = make_user('tenant')
+        db.session.flush()
+        for _ in range(20):
+            _property(other)
+        far = _property(owner, id=(1 << facets.CHUNK_BITS) + 5, city='Shelbyville')
+        db.session.commit()
+
+        table = facets.PropertyFacet.__table__
+        sizes = [len(bitmap) for bitmap in db.session.execute(db.select(table.c.bitmap)).scalars()]
+        assert max(sizes) < 64  # not 4 KB per value and chunk
+        assert facets._to_int(facets._to_blob(1 << facets.MASK)) == 1 << facets.MASK
+        assert facets.facet_counts(tenant, {'city': 'Shelbyville'})[1] == 1
+
+        # An owner's page reads only the chunk holding their one property
+        with count_queries(db.engine) as statements:
+            counts, total = facets.facet_counts(db.session.get(type(owner), owner.id), {})
+        assert total == 1 and _options(counts['city']) == {'Shelbyville': 1}
+        read = [s for s in statements if 'property_facets' in s]
+        assert len(read) == 1 and 'chunk IN' in read[0]
+        assert far.id >> facets.CHUNK_BITS == 1
+
+
+def test_text_in_number_fields_gets_no_facet(app, client, login):
+    with app.app_context():
+        owner = make_user('owner')
+        db.session.commit()
+        owner_id = owner.id
+    login(owner_id)
+
+    # The forms store what was typed; saving must not fail in the flush hook
+    form = {'property_type': 'House', 'title': 'Odd', 'address': '1 Test Street', 'city': 'Springfield',
+            'bedrooms': 'two', 'bathrooms': '1.5', 'rent_amount': '900', 'availability_status': 'available'}
+    assert client.post('/properties/add', data=form).status_code == 302
+    with app.app_context():
+        prop_id = Property.query.filter_by(title='Odd').one().id
+    form.update(bedrooms='3', rent_amount='1200')
+    assert client.post(f'/properties/edit/{prop_id}', data=form).status_code == 302
+
+    with app.app_context():
+        assert facets.facet_values(dict(facets._current_values(db.session.get(Property, prop_id)),
+                                        rent_amount='ask'))['bedrooms'] == '3'
+        assert facets.reconcile(fix=False) == []
+        counts, total = facets.facet_counts(db.session.get(type(owner), owner_id), {})
+        assert total == 1
+        assert _options(counts['bedrooms']) == {'3': 1}
+        assert _options(counts['bathrooms']) == {}
+        assert _options(counts['rent']) == {'1000': 1}
@@ -0,0 +1,69 @@
+"""
+Fragment cache: {% cache %} blocks served from memory or disk, keyed on
+model ids and updated_at, and dropped when a commit changes their rows.
+"""
+
+from flask import render_template_string
+
+from app import create_app
+from conftest import make_portfolio, make_user
+from extensions import db
+from models import Payment, Property
+
+
+def _setup(app):
+    with app.app_context():
+        owner = make_portfolio(1)
+        admin, tenant = make_user('admin'), make_user('tenant')
+        db.session.commit()
+        return Property.query.one().id, admin.id, tenant.id
+
+
+def test_property_page_is_served_from_the_cache(app, client, login):
+    property_id, admin_id, tenant_id = _setup(app)
+    cache = app.extensions['fragment_cache']
+    login(admin_id)
+    first = client.get(f'/properties/{property_id}').data
+    assert (cache.hits, cache.misses) == (0, 2)  # details and description blocks
+    assert client.get(f'/properties/{property_id}').data == first
+    assert cache.hits == 2
+
+    # The role-dependent buttons sit outside the cached blocks
+    assert b'>Edit</a>' in first
+    login(tenant_id)
+    page = client.get(f'/properties/{property_id}').data
+    assert b'>Edit</a>' not in page and cache.hits == 4
+
+    # An edit moves updated_at, and the commit drops the old fragments
+    with app.app_context():
+        db.session.get(Property, property_id).title = 'Renamed Cottage'
+        db.session.commit()
+    assert len(cache) == 0
+    assert b'Renamed Cottage' in client.get(f'/properties/{property_id}').data
+
+
+def test_rows_without_updated_at_are_evicted_on_commit(app):
+    template = '{% cache [payment], 60 %}{{ payment.status }}{% endcache %}'
+    with app.app_context():
+        make_portfolio(1)
+        with app.test_request_context():
+            payment = Payment.query.one()
+            assert render_template_string(template, payment=payment) == 'completed'
+            payment.status = 'cancelled'
+            db.session.flush()
+            # Not committed yet: the cached fragment still stands
+            assert render_template_string(template, payment=payment) == 'completed'
+            db.session.commit()
+            assert render_template_string(template, payment=payment) == 'cancelled'
+
+
+def test_disk_tier_is_shared_between_workers(tmp_path):
+    template = "{% cache ['greeting', name] %}{{ render_count.append(1) or '' }}Hello {{ name }}{% endcache %}"
+    rendered = []
+    for _ in range(2):
+        app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+                          'FRAGMENT_CACHE_DIR': str(tmp_path)})
+        with app.test_request_context():
+            assert render_template_string(template, name='<b>', render_count=rendered) == 'Hello &lt;b&gt;'
+    assert len(rendered) == 1  # the second app found it on disk
+    assert app.extensions['fragment_cache'].hits == 1
@@ -0,0 +1,112 @@
+"""
+Identity cache: the logged-in user is loaded without SQL, and changes to
+users reach every worker.
+"""
+
+import pytest
+
+import identity
+from app import create_app
+from conftest import count_queries, make_user
+from extensions import db
+from models import User
+
+
+def _statements_for(app, client, url):
+    with app.app_context():
+        engine = db.engine
+    with count_queries(engine) as statements:
+        response = client.get(url)
+    assert response.status_code == 200, url
+    return statements
+
+
+def test_cached_user_needs_no_queries(app, client, login):
+    with app.app_context():
+        tenant = make_user('tenant')
+        tenant.full_name = 'Cached Tenant'
+        db.session.commit()
+        tenant_id = tenant.id
+    login(tenant_id)
+
+    first = _statements_for(app, client, '/profile')
+    assert any('FROM users' in statement for statement in first)
+
+    statements = _statements_for(app, client, '/profile')
+    assert not any('users' in statement or 'cache_generations' in statement
+                   for statement in statements)
+    assert b'Cached Tenant' in client.get('/profile').data
+
+
+def test_edit_profile_and_admin_changes_evict(app, client, login):
+    with app.app_context():
+        admin, owner = make_user('admin'), make_user('owner')
+        db.session.commit()
+        admin_id, owner_id = admin.id, owner.id
+
+    login(owner_id)
+    client.get('/profile')
+    client.post('/profile/edit', data={'full_name': 'Renamed Owner', 'email': 'renamed@example.com'})
+    assert b'Renamed Owner' in client.get('/profile').data
+
+    # An admin demotes the owner: the owner's next request runs with the new role
+    login(admin_id)
+    with app.app_context():
+        user = db.session.get(User, owner_id)
+        form = {'username': user.username, 'email': user.email, 'full_name': user.full_name,
+                'role': 'tenant', 'is_active': 'on'}
+    assert client.post(f'/admin/users/edit/{owner_id}', data=form).status_code == 302
+    login(owner_id)
+    assert b'Tenant' in client.get('/profile').data
+
+    login(admin_id)
+    assert client.post(f'/admin/users/delete/{owner_id}').status_code == 302
+    login(owner_id)
+    assert client.get('/profile').status_code == 302
+
+
+def test_other_workers_see_changes_through_the_generation(tmp_path, login):
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/shared.db',
+              'IDENTITY_GENERATION_INTERVAL': 0}
+    worker, other = create_app(config), create_app(config)
+    client = worker.test_client()
+    with worker.app_context():
+        tenant = make_user('tenant')
+        tenant.full_name = 'Before'
+        db.session.commit()
+        tenant_id = tenant.id
+    with client.session_transaction() as session:
+        session['_user_id'] = str(tenant_id)
+    assert b'Before' in client.get('/profile').data
+
+    # Another process renames the user; this worker's cache still holds the old row
+    with other.app_context():
+        db.session.get(User, tenant_id).full_name = 'After'
+        db.session.commit()
+    assert b'After' in client.get('/profile').data
+
+    with worker.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def test_cache_is_bounded_and_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(identity.time, 'monotonic', lambda: now[0])
+    cache = identity.IdentityCache(ttl=60, max_size=2, interval=1)
+
+    cache.put(1, {'id': 1}, cache.epoch)
+    cache.put(2, {'id': 2}, cache.epoch)
+    assert cache.get(1) == {'id': 1}
+    cache.put(3, {'id': 3}, cache.epoch)
+    assert cache.get(2) is None  # least recently used
+    assert len(cache) == 2
+
+    now[0] += 61
+    assert cache.get(1) is None and cache.get(3) is None
+
+    # A load that started before an eviction is not cached
+    epoch = cache.epoch
+    cache.evict(4)
+    cache.put(4, {'id': 4}, epoch)
+    assert cache.get(4) is None
@@ -0,0 +1,137 @@
+"""Uploads must be stored once by content, stripped of metadata and served as thumbnails in grids."""
+
+import io
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+from conftest import make_user
+from extensions import db
+from models import Property
+import images
+
+
+@pytest.fixture
+def folders(app, tmp_path):
+    app.config.update(UPLOAD_FOLDER=str(tmp_path / 'static'),
+                      IMAGE_ORIGINALS_FOLDER=str(tmp_path / 'originals'),
+                      UPLOAD_TEMP_FOLDER=str(tmp_path))
+    return tmp_path
+
+
+def _photo(color='red', size=(2400, 1600), orientation=None):
+    image = Image.new('RGB', size, color)
+    exif = Image.Exif()
+    exif[0x010F] = 'Test Camera'  # Make
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def _add_property(client, data, filename='photo.jpg', title='With photo'):
+    return client.post('/properties/add', data={
+        'property_type': 'House', 'title': title, 'address': '1 Test Street',
+        'rent_amount': '1000', 'image': (io.BytesIO(data), filename),
+    }, content_type='multipart/form-data')
+
+
+def _owner(app):
+    with app.app_context():
+        owner = make_user('owner')
+        db.session.commit()
+        return owner.id
+
+
+def test_upload_renders_stripped_variants(app, client, login, folders):
+    login(_owner(app))
+    _add_property(client, _photo(orientation=6))
+    images.wait()
+
+    with app.app_context():
+        key = Property.query.one().image_path
+    assert images.KEY.fullmatch(key)
+    for variant, width in images.VARIANTS.items():
+        for ext in images.FORMATS:
+            with Image.open(images.variant_path(str(folders / 'static'), key, variant, ext)) as image:
+                assert not image.getexif()
+                assert 'icc_profile' not in image.info
+                # Orientation 6 (rotated 90°) is applied, so the photo is now portrait
+                assert image.height > image.width
+                assert image.width <= width
+
+
+def test_identical_uploads_are_stored_once(app, client, login, folders):
+    login(_owner(app))
+    _add_property(client, _photo('blue'), filename='a.jpg')
+    _add_property(client, _photo('blue'), filename='b.jpg')
+    _add_property(client, _photo('green'), filename='a.jpg')
+    images.wait()
+
+    with app.app_context():
+        keys = [prop.image_path for prop in Property.query.order_by(Property.id)]
+    assert keys[0] == keys[1] != keys[2]
+    originals = [name for _, _, files in os.walk(folders / 'originals') for name in files]
+    assert sorted(originals) == sorted({keys[0], keys[2]})
+
+
+def test_variants_render_off_the_request_thread(app, client, login, folders, monkeypatch):
+    threads = []
+    render = images.render_variants
+
+    def recording(*args):
+        threads.append(threading.current_thread().name)
+        render(*args)
+
+    monkeypatch.setattr(images, 'render_variants', recording)
+    login(_owner(app))
+    _add_property(client, _photo('purple'))
+    images.wait()
+    assert threads and threads[0].startswith('images')
+    assert threads[0] != threading.current_thread().name
+
+
+def test_non_images_are_rejected(app, client, login, folders):
+    login(_owner(app))
+    # Refused from its first bytes, before the view runs
+    assert _add_property(client, b'<?php echo 1; ?>', filename='shell.jpg').status_code == 415
+    # Looks like a JPEG but does not decode: the property is saved without it
+    assert _add_property(client, b'\xff\xd8\xff\xe0' + b'0' * 64, filename='broken.jpg').status_code == 302
+    with app.app_context():
+        assert Property.query.one().image_path is None
+    assert not [name for _, _, files in os.walk(folders / 'originals') for name in files]
+
+
+def test_grid_only_loads_thumbnails(app, client, login, folders):
+    login(_owner(app))
+    _add_property(client, _photo('orange'))
+    images.wait()
+    with app.app_context():
+        prop = Property.query.one()
+        prop_id, key = prop.id, prop.image_path
+
+    body = client.get('/properties').get_data(as_text=True)
+    assert f'{key}-thumb.webp 400w' in body
+    assert '-medium.' not in body and '-full.' not in body
+
+    body = client.get(f'/properties/{prop_id}').get_data(as_text=True)
+    assert f'{key}-full.webp 1920w' in body
+
+
+def test_legacy_uploads_are_converted(app, folders):
+    os.makedirs(folders / 'static')
+    (folders / 'static' / 'house.jpg').write_bytes(_photo('gray'))
+    with app.app_context():
+        owner = make_user('owner')
+        db.session.flush()
+        db.session.add(Property(owner_id=owner.id, property_type='House', title='Old', address='1 Test Street',
+                                rent_amount=900, image_path='house.jpg'))
+        db.session.commit()
+
+        assert images.process_existing() == (1, 0)
+        key = Property.query.one().image_path
+        assert images.image_variants(key).ready
+        assert images.process_existing() == (0, 0)
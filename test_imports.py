@@ -5,7 +5,7 @@ print("Testing imports...")
 
 try:
     print("1. Importing extensions...")
-    from extensions import db, login_manager, migrate
+    from extensions import db, login_manager
     print("   ✓ Extensions imported successfully")
     
     print("2. Importing models...")
@@ -0,0 +1,129 @@
+"""
+Notification inbox: unread-first keyset pages, bulk mark-read and archival.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import inbox
+from conftest import count_queries, make_user
+from extensions import db
+from models import Notification, NotificationArchive
+
+
+def _notify(user, count, **fields):
+    rows = [Notification(user_id=user.id, title=f'N{n}', message='m', **fields) for n in range(count)]
+    db.session.add_all(rows)
+    db.session.flush()
+    return [row.id for row in rows]
+
+
+def test_inbox_lists_unread_first_and_pages_both_ways(app):
+    with app.app_context():
+        tenant, other = make_user('tenant'), make_user('tenant')
+        db.session.flush()
+        old_unread = _notify(tenant, 2)
+        read = _notify(tenant, 4, is_read=True)
+        new_unread = _notify(tenant, 2)
+        _notify(other, 3)
+        db.session.commit()
+        expected = new_unread[::-1] + old_unread[::-1] + read[::-1]
+
+        pages, args = [], {'per_page': '3'}
+        while True:
+            page = inbox.inbox_page(tenant.id, args)
+            pages.append([row.id for row in page])
+            if not page.has_next:
+                break
+            args = {'per_page': '3', 'after': page.next_cursor}
+        assert sum(pages, []) == expected
+        assert [len(ids) for ids in pages] == [3, 3, 2]
+
+        # ...and back again from the last page
+        back = inbox.inbox_page(tenant.id, {'per_page': '3', 'before': page.prev_cursor})
+        assert [row.id for row in back] == pages[1]
+        back = inbox.inbox_page(tenant.id, {'per_page': '3', 'before': back.prev_cursor})
+        assert [row.id for row in back] == pages[0]
+        assert not back.has_prev
+
+        unread_only = inbox.inbox_page(tenant.id, {'is_read': '0'})
+        assert [row.id for row in unread_only] == new_unread[::-1] + old_unread[::-1]
+
+
+def test_page_spanning_both_halves_is_two_index_seeks(app):
+    with app.app_context():
+        tenant = make_user('tenant')
+        db.session.flush()
+        _notify(tenant, 2)
+        _notify(tenant, 5, is_read=True)
+        db.session.commit()
+        tenant_id = tenant.id
+        with count_queries(db.engine) as statements:
+            page = inbox.inbox_page(tenant_id, {'per_page': '4'})
+        assert len(page) == 4
+        assert len(statements) == 2
+        for statement in statements:
+            plan = db.session.connection().exec_driver_sql(
+                'EXPLAIN QUERY PLAN ' + statement, (tenant_id, 5, 0)).all()
+            assert 'ix_notifications_user_read' in ' '.join(str(row) for row in plan)
+
+
+def test_bulk_mark_read_is_one_update(app, client, login):
+    with app.app_context():
+        tenant, other = make_user('tenant'), make_user('tenant')
+        db.session.flush()
+        _notify(tenant, 3, notification_type='maintenance')
+        _notify(tenant, 2, notification_type='rent_due')
+        _notify(other, 2, notification_type='maintenance')
+        db.session.commit()
+        tenant_id, other_id = tenant.id, other.id
+        engine = db.engine
+    login(tenant_id)
+
+    with count_queries(engine) as statements:
+        response = client.post('/notifications/mark-read', data={'notification_type': 'maintenance'})
+    assert response.status_code == 302
+    assert sum(statement.startswith('UPDATE notifications') for statement in statements) == 1
+
+    with app.app_context():
+        unread = dict(db.session.query(Notification.user_id, db.func.count())
+                      .filter(Notification.is_read.is_(False)).group_by(Notification.user_id).all())
+        assert unread == {tenant_id: 2, other_id: 2}
+
+    client.post('/notifications/mark-read', data={})
+    with app.app_context():
+        assert Notification.query.filter_by(user_id=tenant_id, is_read=False).count() == 0
+
+    # Marking a single notification read changes state, so it is POST only
+    with app.app_context():
+        notification_id = Notification.query.filter_by(user_id=other_id).first().id
+    assert client.get(f'/notifications/mark-read/{notification_id}').status_code == 405
+    client.post(f'/notifications/mark-read/{notification_id}')
+    with app.app_context():
+        assert not db.session.get(Notification, notification_id).is_read
+
+
+def test_archive_moves_old_read_notifications_in_batches(app):
+    now = datetime(2026, 6, 1)
+    with app.app_context():
+        tenant = make_user('tenant')
+        db.session.flush()
+        old = now - timedelta(days=120)
+        archived = _notify(tenant, 5, is_read=True, created_at=old)
+        kept = _notify(tenant, 2, created_at=old)  # still unread
+        kept += _notify(tenant, 2, is_read=True, created_at=now - timedelta(days=10))
+        db.session.commit()
+
+        with count_queries(db.engine) as statements:
+            assert inbox.archive_read(90, batch_size=2, now=now) == 5
+        assert sum(statement.startswith('DELETE FROM notifications') for statement in statements) == 3
+
+        assert sorted(id for (id,) in db.session.query(Notification.id)) == sorted(kept)
+        rows = NotificationArchive.query.order_by(NotificationArchive.id).all()
+        assert [row.id for row in rows] == archived
+        assert rows[0].title == 'N0' and rows[0].created_at == old
+
+        assert inbox.archive_read(90, now=now) == 0
+        with pytest.raises(ValueError):
+            inbox.archive_read(30, now=now)
@@ -0,0 +1,73 @@
+"""
+Request instrumentation: Server-Timing figures, the slow-query log and
+N+1 detection for lazy relationship loads.
+"""
+
+import json
+import logging
+
+import pytest
+
+import instrumentation
+from app import create_app
+from conftest import make_portfolio, make_user
+from extensions import db
+from models import Lease
+
+
+def _lease_titles():
+    # Touches lease.property once per lease: the N+1 the detector is for
+    return ', '.join(lease.property.title for lease in Lease.query.order_by(Lease.id))
+
+
+@pytest.fixture
+def lease_app(app):
+    app.add_url_rule('/lease-titles', 'lease_titles', _lease_titles)
+    with app.app_context():
+        make_portfolio(6)
+    return app
+
+
+def test_server_timing_and_endpoint_totals(app, client, login):
+    with app.app_context():
+        make_portfolio(2)
+        admin = make_user('admin')
+        db.session.commit()
+        admin_id = admin.id
+    login(admin_id)
+
+    timing = client.get('/leases').headers['Server-Timing']
+    names = [part.split(';')[0] for part in timing.split(', ')]
+    assert names == ['sql', 'render', 'lazy', 'total']
+    assert 'lazy;desc="0 lazy loads"' in timing
+
+    totals = instrumentation.endpoint_stats(app)['leases.leases']
+    assert totals['requests'] == 1 and totals['queries'] >= 1
+    assert totals['sql_ms'] > 0 and totals['render_ms'] > 0
+
+
+def test_n_plus_one_raises_in_tests(lease_app, client):
+    with pytest.raises(instrumentation.NPlusOneError, match='Lease.property was lazy-loaded 5 times'):
+        client.get('/lease-titles')
+
+
+def test_slow_queries_name_the_relationship(lease_app, client, caplog):
+    lease_app.extensions['instrumentation'].raise_n_plus_one = False
+    lease_app.extensions['instrumentation'].slow_ms = 0  # every statement is "slow"
+    with caplog.at_level(logging.INFO):
+        response = client.get('/lease-titles')
+    assert response.status_code == 200
+    assert 'lazy;desc="6 lazy loads"' in response.headers['Server-Timing']
+    assert any('N+1 in lease_titles' in record.message for record in caplog.records
+               if record.name == 'instrumentation')
+
+    slow = [json.loads(record.message) for record in caplog.records if record.name == 'rental.sql.slow']
+    assert [entry['relationship'] for entry in slow].count('Lease.property') == 6
+    assert {entry['endpoint'] for entry in slow} == {'lease_titles'}
+    assert slow[0]['statement'].startswith('SELECT')
+
+
+def test_off_by_default():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    assert 'instrumentation' not in app.extensions
+    assert 'Server-Timing' not in app.test_client().get('/login').headers
@@ -0,0 +1,119 @@
+"""Invoice generation must be idempotent, honour lease terms and be settled by add_payment."""
+
+import os
+from datetime import date
+
+import pytest
+from flask_migrate import Migrate, downgrade, upgrade
+
+from app import create_app
+from conftest import make_portfolio, make_user
+from extensions import db
+from models import Lease, Payment
+import invoices
+from pagination import keyset_paginate
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def test_generate_invoices_is_idempotent(app):
+    with app.app_context():
+        make_portfolio(3)
+        leases = Lease.query.order_by(Lease.id).all()
+        leases[0].payment_due_day = 31
+        leases[1].status = 'expired'
+        db.session.commit()
+
+        first = invoices.generate_invoices('2024-04', chunk_size=1)
+        assert first == {'leases': 2, 'created': 2, 'existing': 0}
+        assert invoices.generate_invoices('2024-04') == {'leases': 2, 'created': 0, 'existing': 2}
+        # February already has the completed payments from make_portfolio
+        assert invoices.generate_invoices('2024-02')['created'] == 0
+
+        invoice = Payment.query.filter_by(lease_id=leases[0].id, payment_month='2024-04',
+                                          status='pending').one()
+        assert invoice.due_date == date(2024, 4, 30)
+        assert invoice.payment_date is None  # not paid yet
+        assert invoice.amount == leases[0].monthly_rent
+
+        # Outside the lease term nothing is billed
+        assert invoices.generate_invoices('2025-03')['leases'] == 0
+
+
+def test_dry_run_writes_nothing(app):
+    with app.app_context():
+        make_portfolio(2)
+        assert invoices.generate_invoices('2024-03', dry_run=True)['created'] == 2
+        assert Payment.query.filter_by(payment_month='2024-03').count() == 0
+
+
+def test_parse_month_rejects_bad_input():
+    for bad in ('2024-13', '2024-1', 'March', None):
+        with pytest.raises(ValueError):
+            invoices.parse_month(bad)
+
+
+def test_add_payment_settles_the_invoice(app, client, login):
+    with app.app_context():
+        admin = make_user('admin')
+        make_portfolio(1)
+        lease = Lease.query.one()
+        invoices.generate_invoices('2024-03')
+        ids = dict(admin=admin.id, lease=lease.id, tenant=lease.tenant_id)
+
+    login(ids['admin'])
+    form = {'lease_id': ids['lease'], 'tenant_id': ids['tenant'], 'amount': '1000',
+            'payment_date': '2024-03-02', 'payment_month': '2024-03', 'payment_method': 'cash'}
+    client.post('/payments/add', data=form)
+    client.post('/payments/add', data=form)
+
+    with app.app_context():
+        rows = Payment.query.filter_by(lease_id=ids['lease'], payment_month='2024-03').all()
+        assert [(row.status, row.payment_date, row.due_date) for row in rows] == [
+            ('completed', date(2024, 3, 2), date(2024, 3, 1))
+        ]
+
+
+def test_unpaid_invoices_sort_after_every_payment_date(app, client, login):
+    with app.app_context():
+        admin = make_user('admin')
+        make_portfolio(2)
+        invoices.generate_invoices('2024-03')
+        admin_id = admin.id
+        paid = [row.id for row in Payment.query.filter_by(status='completed').order_by(Payment.id)]
+        unpaid = [row.id for row in Payment.query.filter_by(status='pending').order_by(Payment.id)]
+
+        args = {'per_page': '3'}
+        pages = [keyset_paginate(Payment.query, Payment.id, {'payment_date': Payment.payment_date},
+                                 default_sort='payment_date', default_order='desc', args=args)]
+        pages.append(keyset_paginate(Payment.query, Payment.id, {'payment_date': Payment.payment_date},
+                                     default_sort='payment_date', default_order='desc',
+                                     args=dict(args, after=pages[0].next_cursor)))
+        assert [row.id for page in pages for row in page] == paid[::-1] + unpaid[::-1]
+
+    login(admin_id)
+    for url in ('/payments?sort=payment_date', '/reports/rent-collection', '/dashboard'):
+        response = client.get(url, follow_redirects=True)
+        assert response.status_code == 200
+        assert b'N/A' in response.data  # the invoices show no payment date
+
+
+def test_migration_clears_the_payment_date_of_unpaid_invoices(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/old.db'})
+    Migrate(app, db, directory=MIGRATIONS)
+    with app.app_context():
+        downgrade(revision='d9b3f6a1e5c4')
+        with db.engine.begin() as connection:
+            for row_id, status, paid in ((1, 'pending', '2024-03-05'), (2, 'completed', '2024-03-05'),
+                                         (3, 'pending', '2024-03-02')):
+                connection.execute(db.text(
+                    "INSERT INTO payments (id, lease_id, tenant_id, amount, payment_date, due_date, status) "
+                    "VALUES (:id, 1, 1, 1000, :paid, '2024-03-05', :status)"),
+                    {'id': row_id, 'paid': paid, 'status': status})
+        upgrade()
+
+        # Only the generated invoices lose the due date they carried as a payment date
+        assert [(row.id, row.payment_date) for row in Payment.query.order_by(Payment.id)] == [
+            (1, None), (2, date(2024, 3, 5)), (3, date(2024, 3, 2))]
+        db.session.remove()
+        db.engine.dispose()
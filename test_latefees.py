@@ -0,0 +1,68 @@
+"""Late fees must follow the configured policy and only touch pending payments."""
+
+from datetime import date
+
+import numpy as np
+import pytest
+
+from conftest import make_portfolio
+from extensions import db
+from models import Lease, Payment
+import invoices
+import latefees
+
+
+def _invoice(app, due_day=1):
+    with app.app_context():
+        make_portfolio(2)
+        Lease.query.update({'payment_due_day': due_day})
+        db.session.commit()
+        invoices.generate_invoices('2024-04')
+
+
+def _fees(app, status):
+    with app.app_context():
+        return {payment.late_fee for payment in Payment.query.filter_by(status=status)}
+
+
+@pytest.mark.parametrize('policy, as_of, fee', [
+    (latefees.LateFeePolicy('flat', amount=50, grace_days=5), date(2024, 4, 6), 0.0),
+    (latefees.LateFeePolicy('flat', amount=50, grace_days=5), date(2024, 4, 7), 50.0),
+    (latefees.LateFeePolicy('percentage', percent=5), date(2024, 4, 20), 50.0),
+    (latefees.LateFeePolicy('daily', amount=10, grace_days=2), date(2024, 4, 11), 80.0),
+    (latefees.LateFeePolicy('daily', amount=10, cap=75), date(2024, 5, 31), 75.0),
+])
+def test_policies(app, policy, as_of, fee):
+    _invoice(app)
+    with app.app_context():
+        result = latefees.assess_late_fees(policy, as_of=as_of)
+        assert result.checked == 2
+    assert _fees(app, 'pending') == {fee}
+    assert _fees(app, 'completed') == {0}
+
+
+def test_dry_run_reports_the_diff(app):
+    _invoice(app, due_day=31)
+    policy = latefees.LateFeePolicy('flat', amount=25)
+    with app.app_context():
+        # Due on the 30th: April has no 31st
+        assert latefees.assess_late_fees(policy, as_of=date(2024, 4, 30), dry_run=True).changed == 0
+        result = latefees.assess_late_fees(policy, as_of=date(2024, 5, 1), dry_run=True)
+        assert [(old, new, days) for _, old, new, days in result.rows()] == [(0.0, 25.0, 1)] * 2
+        assert Payment.query.filter(Payment.late_fee > 0).count() == 0
+
+        latefees.assess_late_fees(policy, as_of=date(2024, 5, 1))
+        assert latefees.assess_late_fees(policy, as_of=date(2024, 5, 1)).changed == 0
+
+
+def test_due_date_falls_back_to_lease_due_day():
+    stored = np.array(['NaT', '2024-03-10', 'NaT'], dtype='datetime64[D]')
+    months = np.array(['2024-02', '2024-03', 'NaT'], dtype='datetime64[M]')
+    due = latefees.effective_due_dates(stored, months, np.array([31, 1, 5]))
+    assert due.tolist()[:2] == [date(2024, 2, 29), date(2024, 3, 10)]
+    assert np.isnat(due[2])
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        latefees.LateFeePolicy.from_config({'LATE_FEE_POLICY': 'weekly'})
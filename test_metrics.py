@@ -0,0 +1,107 @@
+"""
+Prometheus metrics: request histograms, SQL and pool counters, business
+gauges, access control, and adding up several worker processes.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import metrics
+from app import create_app
+from conftest import make_portfolio, make_user
+from extensions import db
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Requests served as gevent workers serve them: each in a greenlet of its own
+GEVENT_REQUESTS = '''
+from gevent import monkey
+monkey.patch_all()
+from gevent.pool import Pool
+from app import create_app
+app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+client = app.test_client()
+pool = Pool(20)
+for _ in range(1000):
+    pool.spawn(client.get, '/login')
+pool.join()
+responses = app.extensions['metrics'].responses
+print(len(responses._shards), responses.totals()[('auth.login', '200')])
+'''
+
+
+def _samples(text):
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+
+def test_metrics_endpoint(app, client, login):
+    with app.app_context():
+        make_portfolio(2)
+        admin = make_user('admin')
+        db.session.commit()
+        admin_id = admin.id
+    login(admin_id)
+    assert client.get('/leases').status_code == 200
+    client.get('/leases')
+
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    samples = _samples(response.get_data(as_text=True))
+    assert samples['rms_http_request_duration_seconds_count{endpoint="leases.leases",role="admin"}'] == '2'
+    assert samples['rms_http_request_duration_seconds_bucket{endpoint="leases.leases",role="admin",le="+Inf"}'] == '2'
+    assert samples['rms_http_responses_total{endpoint="leases.leases",status="200"}'] == '2'
+    assert samples['rms_http_requests_in_flight'] == '1'  # the scrape itself
+    assert int(samples['rms_sql_queries_total{bind="primary"}']) > 0
+    assert samples['rms_active_leases'] == '2' and samples['rms_pending_maintenance_requests'] == '2'
+
+    # Only the machine itself, or a scraper with the token
+    assert client.get('/metrics', environ_overrides={'REMOTE_ADDR': '10.0.0.9'}).status_code == 403
+    app.config['METRICS_TOKEN'] = 's3cret'
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'},
+                      environ_overrides={'REMOTE_ADDR': '10.0.0.9'}).status_code == 200
+
+
+def test_histogram_buckets_and_threads():
+    registry = metrics.Registry()
+    registry.requests.observe(('leases', 'admin'), 0.003)
+    registry.requests.observe(('leases', 'admin'), 0.2)
+    thread = metrics.threading.Thread(target=registry.requests.observe, args=(('leases', 'admin'), 30.0))
+    thread.start()
+    thread.join()
+    counts = registry.requests.totals()[('leases', 'admin')]
+    assert counts[0] == 1 and counts[5] == 1 and counts[-2] == 1  # 5 ms, 250 ms and +Inf buckets
+    assert counts[-1] == 30.203
+    assert registry.requests.totals() == {('leases', 'admin'): counts}  # the exited thread is kept
+    assert len(registry.requests._shards) == 1  # and its dict folded into the retired totals
+
+
+def test_ended_greenlets_are_retired():
+    pytest.importorskip('gevent')
+    output = subprocess.run([sys.executable, '-c', GEVENT_REQUESTS], cwd=HERE, check=True,
+                            capture_output=True, text=True, env={**os.environ, 'PYTHONPATH': HERE}).stdout
+    shards, served = map(int, output.split())
+    assert served == 1000
+    assert shards <= 20  # one per greenlet still in the pool, not one per request
+
+
+def test_worker_snapshots_add_up(tmp_path):
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    for pid, in_flight in ((exited.pid, 4), (os.getppid(), 2)):
+        (tmp_path / f'{pid}.json').write_text(json.dumps({'pid': pid, 'metrics': {
+            'rms_http_responses_total': [[['leases', '200'], 10]],
+            'rms_http_requests_in_flight': [[[], in_flight]],
+        }}))
+
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'METRICS_DIR': str(tmp_path)})
+    samples = _samples(app.test_client().get('/metrics').get_data(as_text=True))
+    # Counters of the exited worker still count, its in-flight gauge does not
+    assert samples['rms_http_responses_total{endpoint="leases",status="200"}'] == '20'
+    assert samples['rms_http_requests_in_flight'] == '3'
+    assert (tmp_path / f'{os.getpid()}.json').exists()
@@ -0,0 +1,189 @@
+"""
+Keyset pagination: paging both ways through ties and either order, the
+cursors, NOT NULL list sort keys and paging through NULL sort values.
+"""
+
+import os
+from datetime import datetime
+
+import pytest
+from flask_migrate import Migrate, downgrade, upgrade
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app
+from conftest import make_user
+from extensions import db
+from models import MaintenanceRequest, Property, User
+from pagination import decode_cursor, encode_cursor, keyset_paginate
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Seven properties over four dates, so most pages start or end inside a tie
+DATES = [datetime(2024, 1, day) for day in (1, 2, 2, 2, 3, 3, 4)]
+
+
+@pytest.fixture
+def properties(app):
+    with app.app_context():
+        owner = make_user('owner')
+        db.session.flush()
+        for n, created in enumerate(DATES):
+            db.session.add(Property(owner_id=owner.id, property_type='House', title=f'Unit {n}',
+                                    address='1 Test Street', rent_amount=1000, created_at=created))
+        db.session.commit()
+        rows = Property.query.all()
+        return {row.id: row.created_at for row in rows}
+
+
+def _page(**args):
+    args.setdefault('per_page', '3')
+    return keyset_paginate(Property.query, Property.id, {'newest': Property.created_at, 'id': Property.id},
+                           default_sort='newest', default_order='desc', args=args)
+
+
+def _ids(page):
+    return [row.id for row in page]
+
+
+def _walk(**args):
+    """Every page from the first, following next_cursor"""
+    pages = [_page(**args)]
+    while pages[-1].has_next:
+        pages.append(_page(after=pages[-1].next_cursor, **args))
+    return pages
+
+
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_pages_follow_sort_key_then_id(app, properties, order):
+    expected = sorted(properties, key=lambda row_id: (properties[row_id], row_id), reverse=order == 'desc')
+    with app.app_context():
+        pages = _walk(order=order)
+    assert [_ids(page) for page in pages] == [expected[0:3], expected[3:6], expected[6:]]
+    assert not pages[0].has_prev and pages[1].has_prev and pages[2].has_prev
+    assert not pages[-1].has_next
+
+
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_before_walks_back_over_the_same_pages(app, properties, order):
+    with app.app_context():
+        pages = _walk(order=order)
+        back = [pages[-1]]
+        while back[-1].has_prev:
+            back.append(_page(before=back[-1].prev_cursor, order=order))
+        assert [_ids(page) for page in reversed(back)] == [_ids(page) for page in pages]
+        # The first page reached backwards has no previous page, but links forward
+        assert not back[-1].has_prev and back[-1].has_next
+
+
+def test_page_boundary_inside_a_tie(app, properties):
+    tied = sorted(row_id for row_id, created in properties.items() if created == datetime(2024, 1, 2))
+    with app.app_context():
+        first = _page(order='asc', per_page='2')
+        second = _page(order='asc', per_page='2', after=first.next_cursor)
+    # The first page ends on the first of three rows sharing a date; the rest follow
+    assert _ids(first)[-1] == tied[0]
+    assert _ids(second) == tied[1:]
+
+
+def test_cursor_round_trip():
+    created = datetime(2024, 1, 2, 3, 4, 5, 678900)
+    cursor = encode_cursor(created, 42)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (created.isoformat(), 42)
+    assert decode_cursor(encode_cursor('Unit 7', 7)) == ('Unit 7', 7)
+
+
+@pytest.mark.parametrize('cursor', [
+    '',
+    'not a cursor',
+    '!!!!',
+    encode_cursor('2024-01-02T00:00:00', 3)[:-3],   # truncated
+    encode_cursor('2024-01-02T00:00:00', 3) + 'x',  # bytes appended
+    'WzEsMiwzXQ',  # [1,2,3]
+    'WyJ4IiwieSJd',  # ["x","y"]
+    'WyJ4IixudWxsXQ',  # ["x",null]
+    'eyJhIjoxfQ',  # {"a":1}
+])
+def test_malformed_cursor_is_rejected(cursor):
+    assert decode_cursor(cursor) is None
+
+
+@pytest.mark.parametrize('cursor', ['garbage', encode_cursor('not a date', 3), 'WyJ4IixudWxsXQ'])
+def test_malformed_or_tampered_cursor_shows_the_first_page(app, properties, cursor):
+    with app.app_context():
+        first = _page()
+        assert _ids(_page(after=cursor)) == _ids(first)
+        assert _ids(_page(before=cursor)) == _ids(first)
+        assert not _page(after=cursor).has_prev
+
+
+def test_list_sort_keys_are_not_null(app):
+    with app.app_context():
+        owner = make_user('owner')
+        db.session.flush()
+        prop = Property(owner_id=owner.id, property_type='House', title='Unit',
+                        address='1 Test Street', rent_amount=1000, created_at=None)
+        db.session.add(prop)
+        db.session.commit()
+        assert prop.created_at is not None  # the default fills in for None
+        with pytest.raises(IntegrityError):
+            db.session.execute(db.text(
+                "INSERT INTO properties (owner_id, property_type, title, address, rent_amount, created_at) "
+                "VALUES (:owner, 'House', 'Unit', '1 Test Street', 1000, NULL)"), {'owner': owner.id})
+        db.session.rollback()
+
+
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_null_sort_values_are_paged_through(app, properties, order):
+    def page(**args):
+        return keyset_paginate(Property.query, Property.id, {'city': Property.city}, default_sort='city',
+                               args=dict(order=order, per_page='2', **args))
+
+    with app.app_context():
+        ids = sorted(properties)
+        for row_id, city in zip(ids, ['Leeds', None, 'York', None, 'Leeds', None, 'Bath']):
+            db.session.get(Property, row_id).city = city
+        db.session.commit()
+        # SQLite sorts NULL before every value: first ascending, last descending
+        expected = [row_id for _, row_id in sorted(
+            ((db.session.get(Property, row_id).city or '', row_id) for row_id in ids),
+            reverse=order == 'desc')]
+
+        pages = [page()]
+        while pages[-1].has_next:
+            pages.append(page(after=pages[-1].next_cursor))
+        assert [_ids(p) for p in pages] == [expected[0:2], expected[2:4], expected[4:6], expected[6:]]
+
+        back = [pages[-1]]
+        while back[-1].has_prev:
+            back.append(page(before=back[-1].prev_cursor))
+        assert [_ids(p) for p in reversed(back)] == [_ids(p) for p in pages]
+
+
+def test_migration_fills_in_missing_sort_keys(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/old.db'})
+    Migrate(app, db, directory=MIGRATIONS)
+    updated, assigned = datetime(2024, 3, 4, 5, 6, 7), datetime(2024, 5, 6, 7, 8, 9)
+    with app.app_context():
+        downgrade(revision='a7e4b2f9c318')
+        with db.engine.begin() as connection:
+            connection.execute(db.text(
+                "INSERT INTO users (id, username, email, password_hash, full_name, role, updated_at) "
+                "VALUES (1, 'owner', 'owner@example.com', 'x', 'Owner', 'owner', :updated)"), {'updated': updated})
+            connection.execute(db.text(
+                "INSERT INTO properties (id, owner_id, property_type, title, address, rent_amount) "
+                "VALUES (1, 1, 'House', 'Garden house', '1 Test Street', 1000)"))
+            connection.execute(db.text(
+                "INSERT INTO maintenance_requests (id, property_id, tenant_id, title, description, assigned_date) "
+                "VALUES (1, 1, 1, 'Leaky tap', 'Drips', :assigned)"), {'assigned': assigned})
+        upgrade()
+
+        assert db.session.get(User, 1).created_at == updated
+        assert db.session.get(Property, 1).created_at is not None
+        assert db.session.get(MaintenanceRequest, 1).reported_date == assigned
+        # The rebuilt properties table still feeds the search index
+        db.session.execute(db.text("UPDATE properties SET title = 'Pond house' WHERE id = 1"))
+        assert db.session.execute(db.text(
+            "SELECT rowid FROM properties_fts WHERE properties_fts MATCH 'pond'")).scalar() == 1
+        db.session.remove()
+        db.engine.dispose()
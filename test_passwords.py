@@ -0,0 +1,82 @@
+"""
+Password hashing service: process pool, saturation and rehash on login.
+"""
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import passwords
+from conftest import make_user
+from extensions import db
+from models import User
+
+FAST = 'pbkdf2:sha256:1000'
+
+
+@pytest.fixture
+def pool(app):
+    app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0, PASSWORD_HASH_METHOD=FAST)
+    yield app
+    passwords.shutdown()
+
+
+def _user_with_password(password, method):
+    user = make_user('tenant')
+    user.password_hash = generate_password_hash(password, method)
+    db.session.commit()
+    return user.id
+
+
+def test_hashes_and_verifies_on_the_pool(pool):
+    with pool.app_context():
+        pwhash = passwords.hash_password('s3cret')
+        assert passwords.hash_method(pwhash) == FAST
+        assert passwords.verify_password(pwhash, 's3cret')
+        assert not passwords.verify_password(pwhash, 'wrong')
+        assert passwords._executor is not None
+
+
+def test_saturated_pool_rejects_logins_at_once(pool, client):
+    with pool.app_context():
+        user = db.session.get(User, _user_with_password('s3cret', FAST))
+        username = user.username
+        passwords.hash_password('warm up')  # start the pool
+        _, slots = passwords._pool(1, 0)
+
+    assert slots.acquire(blocking=False)  # the only slot is busy
+    try:
+        response = client.post('/login', data={'username': username, 'password': 's3cret'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == str(passwords.RETRY_AFTER)
+    finally:
+        slots.release()
+
+    response = client.post('/login', data={'username': username, 'password': 's3cret'})
+    assert response.status_code == 302
+
+
+def test_login_rehashes_outdated_hashes(app, client):
+    app.config.update(PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_METHOD=FAST)
+    with app.app_context():
+        user_id = _user_with_password('s3cret', 'pbkdf2:sha256:500')
+        username = db.session.get(User, user_id).username
+
+    client.post('/login', data={'username': username, 'password': 'wrong'})
+    with app.app_context():
+        assert db.session.get(User, user_id).password_hash.startswith('pbkdf2:sha256:500$')
+
+    assert client.post('/login', data={'username': username, 'password': 's3cret'}).status_code == 302
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        assert passwords.hash_method(user.password_hash) == FAST
+        assert user.check_password('s3cret')
+
+
+@pytest.mark.parametrize('method, stored', [
+    ('scrypt', 'scrypt:32768:8:1'),
+    ('pbkdf2', f'pbkdf2:sha256:{passwords.DEFAULT_PBKDF2_ITERATIONS}'),
+    ('pbkdf2:sha512', f'pbkdf2:sha512:{passwords.DEFAULT_PBKDF2_ITERATIONS}'),
+    ('scrypt:16384:8:1', 'scrypt:16384:8:1'),
+])
+def test_canonical_method_matches_stored_hashes(method, stored):
+    assert passwords.canonical_method(method) == stored
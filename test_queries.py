@@ -0,0 +1,65 @@
+"""
+Query-count regression tests: list and report pages must run a fixed
+number of SQL statements however many rows they render.
+"""
+
+import pytest
+
+from conftest import count_queries, make_portfolio, make_user
+from extensions import db
+
+ADMIN_ROUTES = [
+    '/payments?per_page=100',
+    '/leases?per_page=100',
+    '/maintenance?per_page=100',
+    '/properties?per_page=100',
+    '/admin/dashboard',
+    '/reports/rent-collection',
+    '/reports/occupancy',
+    '/reports/maintenance',
+]
+
+OWNER_ROUTES = [
+    '/payments?per_page=100',
+    '/leases?per_page=100',
+    '/maintenance?per_page=100',
+    '/reports/rent-collection',
+]
+
+
+def _queries_for(app, client, url):
+    # Warm the identity cache, so both runs count only the page's own queries
+    client.get(url)
+    with app.app_context():
+        engine = db.engine
+    with count_queries(engine) as statements:
+        response = client.get(url)
+    assert response.status_code == 200, url
+    return len(statements)
+
+
+@pytest.mark.parametrize('url', ADMIN_ROUTES)
+def test_admin_query_count_is_constant(app, client, login, url):
+    with app.app_context():
+        admin = make_user('admin')
+        make_portfolio(3)
+        admin_id = admin.id
+    login(admin_id)
+    small = _queries_for(app, client, url)
+
+    with app.app_context():
+        make_portfolio(30)
+    assert _queries_for(app, client, url) == small
+
+
+@pytest.mark.parametrize('url', OWNER_ROUTES)
+def test_owner_query_count_is_constant(app, client, login, url):
+    with app.app_context():
+        owner = make_portfolio(3)
+        owner_id = owner.id
+    login(owner_id)
+    small = _queries_for(app, client, url)
+
+    with app.app_context():
+        make_portfolio(30, owner=db.session.get(type(owner), owner_id))
+    assert _queries_for(app, client, url) == small
@@ -0,0 +1,60 @@
+"""Reminders must go out once per horizon, to the right people, and never twice."""
+
+from datetime import date
+
+from conftest import make_portfolio
+from extensions import db
+from models import Lease, Notification
+import invoices
+import reminders
+
+
+def _notifications(notification_type):
+    return Notification.query.filter_by(notification_type=notification_type).count()
+
+
+def test_lease_expiry_reminders_follow_horizons(app):
+    with app.app_context():
+        owner = make_portfolio(3)
+        leases = Lease.query.order_by(Lease.id).all()
+        leases[0].end_date = date(2024, 3, 31)   # 30 days out
+        leases[1].end_date = date(2024, 3, 6)    # 5 days out
+        leases[2].end_date = date(2024, 9, 1)    # beyond every horizon
+        db.session.commit()
+
+        today = date(2024, 3, 1)
+        assert reminders.send_reminders(today)['lease_expiry'] == 4
+        # Tenant and owner both hear about each lease, once
+        assert Notification.query.filter_by(user_id=owner.id).count() == 2
+        assert Notification.query.filter_by(user_id=leases[1].tenant_id).one().message.startswith(
+            'Your lease for')
+
+        # Re-running the same day sends nothing new
+        assert reminders.send_reminders(today)['lease_expiry'] == 0
+        # The 30-day lease reaches the 7-day horizon later on
+        assert reminders.send_reminders(date(2024, 3, 25))['lease_expiry'] == 2
+        assert _notifications('lease_renewal') == 6
+
+
+def test_rent_due_reminders_are_deduplicated(app):
+    with app.app_context():
+        make_portfolio(2)
+        Lease.query.update({'payment_due_day': 10})
+        db.session.commit()
+        invoices.generate_invoices('2024-04')
+
+        assert reminders.send_reminders(date(2024, 3, 1), horizons=(7,))['rent_due'] == 0
+        assert reminders.send_reminders(date(2024, 4, 5), horizons=(7,))['rent_due'] == 2
+        assert reminders.send_reminders(date(2024, 4, 6), horizons=(7,))['rent_due'] == 0
+        assert _notifications('rent_due') == 2
+
+
+def test_scans_use_range_indexes(app):
+    with app.app_context():
+        connection = db.session.connection()
+        for query, index in ((reminders.expiring_leases, 'ix_leases_status_end_date'),
+                             (reminders.due_invoices, 'ix_payments_status_due_date')):
+            sql = str(query(date(2024, 1, 1), 60).statement.compile(
+                db.engine, compile_kwargs={'literal_binds': True}))
+            plan = ' '.join(row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql))
+            assert f'USING INDEX {index}' in plan, plan
@@ -0,0 +1,39 @@
+"""Report aggregates must match row-level totals and respect owner scoping."""
+
+from conftest import make_portfolio, make_user
+from extensions import db
+from models import User, Payment
+import reports
+
+
+def test_payment_totals_are_scoped_to_owner(app):
+    with app.app_context():
+        admin = make_user('admin')
+        owner = make_portfolio(3)
+        make_portfolio(2)
+        Payment.query.filter(Payment.id == 1).update({'status': 'pending'})
+        db.session.commit()
+
+        everything = reports.payment_totals(admin)
+        assert everything['completed'] == (4, 4000)
+        assert everything['pending'] == (1, 1000)
+
+        mine = reports.payment_totals(db.session.get(User, owner.id))
+        assert sum(count for count, _ in mine.values()) == 3
+
+
+def test_breakdowns_group_rows(app):
+    with app.app_context():
+        admin = make_user('admin')
+        make_portfolio(3)
+        make_portfolio(2)
+
+        by_month = reports.payments_by_month(admin)
+        assert [(row.payment_month, row.payments, row.collected) for row in by_month] == [('2024-02', 5, 5000)]
+
+        by_owner = reports.payments_by_owner(admin)
+        assert sorted(row.payments for row in by_owner) == [2, 3]
+
+        assert reports.occupancy_totals(admin) == {'occupied': 5}
+        assert reports.maintenance_totals(admin) == {'pending': 5}
+        assert len(reports.maintenance_by_property(admin)) == 5
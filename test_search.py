@@ -0,0 +1,89 @@
+"""Property search must rank, stay in step with edits and use the FTS index."""
+
+from conftest import make_user
+from extensions import db
+from models import Property
+from queries import scoped_properties
+import search
+
+
+def _property(owner, title, **fields):
+    fields.setdefault('address', '1 Test Street')
+    fields.setdefault('city', 'Springfield')
+    fields.setdefault('rent_amount', 1000)
+    prop = Property(owner_id=owner.id, property_type=fields.pop('property_type', 'House'),
+                    title=title, **fields)
+    db.session.add(prop)
+    return prop
+
+
+def _titles(text, args=None):
+    rows, _, _ = search.search_properties(Property.query, text, args or {})
+    return [prop.title for prop in rows]
+
+
+def test_ranking_prefixes_and_filters(app):
+    with app.app_context():
+        owner = make_user('owner')
+        db.session.flush()
+        _property(owner, 'Quiet cottage', description='Near the lake apartment district')
+        _property(owner, 'Lake view apartment', bedrooms=2, rent_amount=1500,
+                  property_type='Apartment')
+        _property(owner, 'City loft', amenities='Gym, lake access', bedrooms=1)
+        db.session.commit()
+
+        # A title match outranks the same word in amenities or description
+        assert _titles('lake')[0] == 'Lake view apartment'
+        assert _titles('apa')[0] == 'Lake view apartment'
+        assert _titles('lak apart') == ['Lake view apartment', 'Quiet cottage']
+        assert _titles('lake', {'bedrooms': '2'}) == ['Lake view apartment']
+        assert set(_titles('lake', {'rent_max': '1200'})) == {'Quiet cottage', 'City loft'}
+        assert _titles('lake', {'property_type': 'Apartment', 'rent_min': 'junk'}) == \
+            ['Lake view apartment']
+        # Query syntax in user input is treated as plain words
+        assert _titles('lake OR "NEAR(') == []
+        assert search.match_expression('?!') is None
+
+
+def test_index_follows_updates_and_deletes(app):
+    with app.app_context():
+        owner = make_user('owner')
+        db.session.flush()
+        prop = _property(owner, 'Garden flat')
+        db.session.commit()
+        assert _titles('garden') == ['Garden flat']
+
+        prop.title = 'Roof terrace flat'
+        db.session.commit()
+        assert _titles('garden') == []
+        assert _titles('terrace') == ['Roof terrace flat']
+
+        db.session.delete(prop)
+        db.session.commit()
+        assert _titles('flat') == []
+
+
+def test_tenants_only_find_available_properties(app, client, login):
+    with app.app_context():
+        owner = make_user('owner')
+        tenant = make_user('tenant')
+        db.session.flush()
+        _property(owner, 'Harbour studio', availability_status='available')
+        _property(owner, 'Harbour house', availability_status='occupied')
+        db.session.commit()
+        tenant_id = tenant.id
+
+    login(tenant_id)
+    body = client.get('/properties/search?q=harbour').get_data(as_text=True)
+    assert 'Harbour studio' in body
+    assert 'Harbour house' not in body
+
+
+def test_search_uses_the_fts_index(app):
+    with app.app_context():
+        query, _ = search.search_query(
+            scoped_properties(make_user('admin'), 'properties/list.html'), 'lake view', {'bedrooms': '2'})
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = ' '.join(row[-1] for row in db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + sql))
+        assert 'VIRTUAL TABLE INDEX' in plan, plan
+        assert 'LIKE' not in sql.upper()
@@ -0,0 +1,60 @@
+"""
+Start-up: the factory leaves the views unimported until the URL map is
+first used, so CLI commands never load them, and a fresh interpreter
+imports nothing that only the web pages or ``flask db`` need.
+"""
+
+import subprocess
+import sys
+
+from flask import url_for
+
+import bench_startup
+
+# A new database made by create_app in an interpreter that has not imported search.py
+SEARCH_PROBE = '''
+import sys
+from app import create_app
+from extensions import db
+from models import Property, User
+application = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': sys.argv[1]})
+with application.app_context():
+    admin = User(username='admin', email='admin@example.com', full_name='Admin', role='admin',
+                 password_hash='x', is_active=True)
+    db.session.add(admin)
+    db.session.flush()
+    db.session.add(Property(owner_id=admin.id, property_type='House', title='Garden house',
+                            address='1 Test Street', city='Springfield', rent_amount=1000))
+    db.session.commit()
+    admin_id = admin.id
+client = application.test_client()
+with client.session_transaction() as session:
+    session['_user_id'] = str(admin_id)
+response = client.get('/properties/search?q=garden')
+print(response.status_code, b'Garden house' in response.data)
+'''
+
+
+def test_views_are_registered_on_first_use(app):
+    assert 'main.index' not in app.view_functions
+    result = app.test_cli_runner().invoke(args=['reconcile-counters', '--dry-run'])
+    assert 'up to date' in result.output
+    assert 'main.index' not in app.view_functions
+
+    with app.test_request_context():
+        assert url_for('properties.view_property', property_id=7) == '/properties/7'
+    assert 'main.index' in app.view_functions
+    assert app.test_client().get('/no-such-page').status_code == 404
+
+
+def test_factory_skips_web_only_imports(tmp_path):
+    run = bench_startup.probe(f'sqlite:///{tmp_path}/startup.db')
+    assert run['loaded'] == []
+    assert run['status'] == 200
+
+
+def test_new_database_has_the_search_index(tmp_path):
+    output = subprocess.run([sys.executable, '-c', SEARCH_PROBE, f'sqlite:///{tmp_path}/new.db'],
+                            cwd=bench_startup.HERE, check=True, capture_output=True, text=True).stdout
+    assert output.split() == ['200', 'True']
+
@@ -0,0 +1,184 @@
+"""Uploads must stream to disk in bounded memory and be refused before the body is read."""
+
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+from flask import jsonify, request
+
+from conftest import make_user
+from extensions import db
+import uploads
+
+MB = 1024 * 1024
+BOUNDARY = 'upload-test-boundary'
+
+
+class MultipartBody:
+    """A lazily generated multipart body with one ``size``-byte file part starting with ``head``"""
+
+    def __init__(self, head, size):
+        self.prefix = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; '
+                       f'filename="big.bin"\r\nContent-Type: application/octet-stream\r\n\r\n').encode()
+        self.suffix = f'\r\n--{BOUNDARY}--\r\n'.encode()
+        self.head = head
+        self.size = size
+        self.length = len(self.prefix) + size + len(self.suffix)
+        self.consumed = 0
+        self.sha256 = hashlib.sha256()
+        self._chunk = b'\0' * (256 * 1024)
+
+    def _payload(self, start, end):
+        data = bytearray()
+        if start < len(self.head):
+            data += self.head[start:end]
+            start = len(self.head)
+        if end > start:
+            data += self._chunk[:end - start]
+        return bytes(data)
+
+    def read(self, n=-1):
+        remaining = self.length - self.consumed
+        n = remaining if n is None or n < 0 else min(n, remaining, len(self._chunk))
+        out = bytearray()
+        position = self.consumed
+        end = position + n
+        prefix_end = len(self.prefix)
+        payload_end = prefix_end + self.size
+        if position < prefix_end:
+            out += self.prefix[position:min(end, prefix_end)]
+        if end > prefix_end and position < payload_end:
+            piece = self._payload(max(position, prefix_end) - prefix_end, min(end, payload_end) - prefix_end)
+            self.sha256.update(piece)
+            out += piece
+        if end > payload_end:
+            out += self.suffix[max(position, payload_end) - payload_end:end - payload_end]
+        self.consumed = end
+        return bytes(out)
+
+    def readline(self, limit=-1):
+        return self.read(limit)
+
+
+def _rss():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+@pytest.fixture
+def upload_app(app, tmp_path):
+    app.config.update(UPLOAD_TEMP_FOLDER=str(tmp_path), MAX_CONTENT_LENGTH=None,
+                      MAX_UPLOAD_FILE_SIZE=None)
+
+    @uploads.accepts_uploads('image/jpeg')
+    def receive():
+        file = request.files['file']
+        return jsonify(digest=file.stream.digest, size=file.stream.size,
+                       on_disk=os.path.getsize(file.stream.path))
+
+    app.add_url_rule('/upload-test', 'upload_test', receive, methods=['POST'])
+    return app
+
+
+def _post(client, body, content_length=None, url='/upload-test'):
+    # Handed to the app as wsgi.input directly: the test client would otherwise
+    # seek to the end of the stream to measure it
+    return client.post(url, environ_overrides={
+        'wsgi.input': body,
+        'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+        'CONTENT_LENGTH': str(body.length if content_length is None else content_length),
+    })
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/statm'), reason='needs /proc to read RSS')
+def test_100mb_upload_streams_in_bounded_memory(upload_app, client, tmp_path):
+    body = MultipartBody(b'\xff\xd8\xff\xe0' + b'JFIF', 100 * MB)
+    peak = baseline = _rss()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, _rss())
+            time.sleep(0.005)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    try:
+        response = _post(client, body)
+    finally:
+        done.set()
+        sampler.join()
+
+    assert peak - baseline < 32 * MB
+    assert response.status_code == 200
+    assert response.json == {'digest': body.sha256.hexdigest(), 'size': 100 * MB, 'on_disk': 100 * MB}
+    # The temporary file is gone once the request is over
+    assert os.listdir(tmp_path) == []
+
+
+def test_oversized_file_is_refused_mid_body(upload_app, client, tmp_path):
+    upload_app.config['MAX_UPLOAD_FILE_SIZE'] = MB
+    body = MultipartBody(b'\xff\xd8\xff\xe0' + b'JFIF', 100 * MB)
+    assert _post(client, body).status_code == 413
+    assert body.consumed < 2 * MB
+    assert os.listdir(tmp_path) == []
+
+
+def test_oversized_request_is_refused_from_its_header(upload_app, client):
+    upload_app.config['MAX_CONTENT_LENGTH'] = 10 * MB
+    body = MultipartBody(b'\xff\xd8\xff\xe0' + b'JFIF', 100 * MB)
+    assert _post(client, body).status_code == 413
+    assert body.consumed == 0
+
+
+def test_request_limit_holds_without_a_truthful_header(upload_app, client):
+    upload_app.config['MAX_CONTENT_LENGTH'] = 10 * MB
+    body = MultipartBody(b'\xff\xd8\xff\xe0' + b'JFIF', 100 * MB)
+    # Claims to be small, then keeps sending
+    response = _post(client, body, content_length=MB)
+    assert response.status_code in (400, 413)
+    assert body.consumed <= MB
+
+
+def test_unexpected_type_is_refused_after_the_first_chunk(upload_app, client, tmp_path):
+    body = MultipartBody(b'MZ\x90\x00' + b'\0' * 8, 100 * MB)
+    assert _post(client, body).status_code == 415
+    assert body.consumed < MB
+    assert os.listdir(tmp_path) == []
+
+
+def test_views_without_declared_types_take_no_files(app, client, login, tmp_path):
+    app.config['UPLOAD_TEMP_FOLDER'] = str(tmp_path)
+    with app.app_context():
+        user = make_user('tenant')
+        db.session.commit()
+        user_id = user.id
+    login(user_id)
+    body = MultipartBody(b'\xff\xd8\xff\xe0' + b'JFIF', MB)
+    assert _post(client, body, url='/profile/edit').status_code == 415
+
+
+@pytest.mark.parametrize('head, mimetype', [
+    (b'\xff\xd8\xff\xdb' + b'\0' * 8, 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n\0\0\0\r', 'image/png'),
+    (b'GIF89a' + b'\0' * 6, 'image/gif'),
+    (b'RIFF\0\0\0\0WEBP', 'image/webp'),
+    (b'<svg xmlns="', None),
+])
+def test_sniff(head, mimetype):
+    assert uploads.sniff(head) == mimetype
+
+
+@pytest.mark.parametrize('head, mimetype', [
+    (b'username,ema', 'text/plain'),
+    (b'\xef\xbb\xbfref,owner,', 'text/plain'),   # UTF-8 BOM, as Excel saves CSV
+    (b'caf\xc3\xa9,\xc3', 'text/plain'),          # ends mid-character
+    (b'\xff\xd8\xff\xdb' + b'\0' * 8, 'image/jpeg'),
+    (b'PK\x03\x04\x14\0\x06\0\x08\0\0\0', None),  # a spreadsheet, not CSV
+    (b'\xff\xfeu\0s\0e\0r\0n\0', None),         # UTF-16
+])
+def test_sniff_text(head, mimetype):
+    assert uploads.sniff(head, text=True) == mimetype
@@ -0,0 +1,175 @@
+"""
+Streamed, size-bounded file uploads.
+
+``UploadRequest`` replaces Flask's request class so that every file part of
+a multipart body is written straight to a temporary file in
+UPLOAD_TEMP_FOLDER, in the parser's fixed-size chunks, instead of being
+buffered by werkzeug. While the chunks go by, ``UploadStream`` hashes them
+and sniffs the content type from the first bytes, so:
+
+- a body larger than MAX_CONTENT_LENGTH is refused from its Content-Length
+  header, or as soon as it runs over when it has none (413);
+- a file larger than MAX_UPLOAD_FILE_SIZE is refused as soon as it runs
+  over, without reading the rest of the body (413);
+- a file whose leading bytes are not one of the types the view declared
+  with ``@accepts_uploads`` is refused after its first chunk (415). Views
+  that declare nothing accept no files. Text, which has no signature of
+  its own, is only recognised for views that accept ``text/plain``.
+
+Whatever was written is deleted when the request ends, unless the view
+kept it with ``UploadStream.keep``.
+"""
+
+import codecs
+import hashlib
+import os
+import shutil
+import tempfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+# Leading bytes of the file types uploads can be sniffed as
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+SNIFF_BYTES = 12
+
+IMAGE_TYPES = frozenset({'image/jpeg', 'image/png', 'image/gif', 'image/webp'})
+# CSV has no signature: anything that starts out as UTF-8 text is accepted,
+# and the importer checks it row by row
+CSV_TYPES = frozenset({'text/plain'})
+
+# Control characters that never occur in text files
+_BINARY = bytes(set(range(32)) - {9, 10, 12, 13}) + b'\x7f'
+
+
+def _is_text(head):
+    if any(byte in _BINARY for byte in head):
+        return False
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head)  # may end mid-character
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def sniff(head, text=False):
+    """
+    The content type ``head`` (the first bytes of a file) belongs to, or None.
+
+    Only with ``text`` does a file without a signature that reads as UTF-8
+    come out as ``text/plain``.
+    """
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, mimetype in SIGNATURES:
+        if head.startswith(signature):
+            return mimetype
+    if text and head and _is_text(head):
+        return 'text/plain'
+    return None
+
+
+def accepts_uploads(*mimetypes):
+    """Declare the (sniffed) content types a view accepts as file uploads"""
+    def decorator(view):
+        view.upload_types = frozenset(mimetypes)
+        return view
+    return decorator
+
+
+class UploadStream:
+    """
+    Writable, then readable, temporary file that hashes and checks what it is given.
+
+    werkzeug writes each chunk of the file part with ``write``, then seeks
+    back to the start and hands the stream to the view as
+    ``FileStorage.stream``.
+    """
+
+    def __init__(self, folder, max_size, allowed):
+        self.max_size = max_size
+        self.allowed = allowed
+        self.size = 0
+        self.mimetype = None
+        self.kept = False
+        self._sha256 = hashlib.sha256()
+        self._head = b''
+        handle, self.path = tempfile.mkstemp(dir=folder, suffix='.part')
+        self._file = os.fdopen(handle, 'w+b')
+
+    @property
+    def digest(self):
+        return self._sha256.hexdigest()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            self.close()
+            raise RequestEntityTooLarge(f'Uploaded files are limited to {self.max_size} bytes.')
+        if len(self._head) < SNIFF_BYTES:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES:
+                self._check_type()
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    def _check_type(self):
+        self.mimetype = sniff(self._head, text='text/plain' in self.allowed)
+        if self.mimetype not in self.allowed:
+            self.close()
+            raise UnsupportedMediaType('This kind of file cannot be uploaded here.')
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # werkzeug rewinds once the part is complete: check files shorter than SNIFF_BYTES too
+        if self.mimetype is None and 0 < self.size < SNIFF_BYTES:
+            self._check_type()
+        return self._file.seek(offset, whence)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def tell(self):
+        return self._file.tell()
+
+    def keep(self, target):
+        """Move the upload to ``target`` so it outlives the request"""
+        self._file.close()
+        shutil.move(self.path, target)
+        self.kept = True
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self.kept and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class UploadRequest(Request):
+    """Flask request that streams file uploads through ``UploadStream``"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        config = current_app.config
+        view = current_app.view_functions.get(self.endpoint)
+        stream = UploadStream(config['UPLOAD_TEMP_FOLDER'], config['MAX_UPLOAD_FILE_SIZE'],
+                              getattr(view, 'upload_types', frozenset()))
+        self.__dict__.setdefault('_upload_streams', []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        # Also covers parts written before the body was rejected
+        for stream in self.__dict__.get('_upload_streams', ()):
+            stream.close()